@@ -0,0 +1,164 @@
+"""
+Benchmark of building and serialising the map figure for large datasets.
+
+Compares the `build_map` of `examples/plotly_mapbox_aggrid_multi_select_change_update.py`
+(`px.scatter_mapbox` plus a `go.Scattermapbox` "Selected" trace, serialised with
+`fig.to_json()`) with the `FigureManager` of the `bi_comms_plotly_map` package:
+
+* `validated`: traces built via `plotly.graph_objs`.
+* `fast`: traces assembled straight from NumPy arrays (`validate=False`),
+  serialised with a `TraceJSONCache`.
+* `fast, cached`: the same figure built and serialised again, as on a rerun
+  where the traces did not change.
+
+Messages are serialised with `orjson` when it is installed, with `json` otherwise.
+The points are the carshare points, resampled with some jitter to the number of
+points requested. Run it via the below from the main project:
+
+```
+PYTHONPATH=src python examples/benchmark_figure_build.py --sizes 10000 100000 1000000
+```
+"""
+
+import argparse
+import time
+from typing import Callable, List
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objs as go
+
+from bi_comms_plotly_map import FigureManager
+from bi_comms_plotly_map.encoding import TraceJSONCache, dumps, orjson
+from bi_comms_plotly_map.protocol import DeltaEncoder
+
+LAT_COL = "centroid_lat"
+LON_COL = "centroid_lon"
+JITTER_DEGREES = 0.01
+SELECTED_FRACTION = 0.01
+SIZES = [10_000, 100_000, 1_000_000]
+# Large enough to hold the traces of 1M points, as a cache shared by sessions would.
+CACHE_BYTES = 1024**3
+
+
+def return_data(n_rows: int, seed: int = 0) -> pd.DataFrame:
+    """`n_rows` carshare points, resampled with jitter, with a route per row."""
+    rng = np.random.default_rng(seed)
+    data = px.data.carshare()
+    data = data.iloc[rng.integers(0, data.shape[0], n_rows)].reset_index(drop=True)
+    data[LAT_COL] += rng.normal(0, JITTER_DEGREES, n_rows)
+    data[LON_COL] += rng.normal(0, JITTER_DEGREES, n_rows)
+    return data.assign(
+        route="R" + data["peak_hour"].astype(str).str.zfill(2),
+        index=data.index,
+        selected=rng.random(n_rows) < SELECTED_FRACTION,
+    ).sort_values(["route"])
+
+
+def build_map(df: pd.DataFrame) -> str:
+    """The `build_map` of the multi-select example, serialised for the browser."""
+    fig = px.scatter_mapbox(
+        df,
+        lat=LAT_COL,
+        lon=LON_COL,
+        color="route",
+        color_discrete_sequence=px.colors.qualitative.Plotly,
+        hover_name="index",
+        hover_data={
+            "route": True,
+            "peak_hour": True,
+            "car_hours": True,
+            "selected": True,
+            LAT_COL: False,
+            LON_COL: False,
+        },
+        size="car_hours",
+        size_max=15,
+        zoom=11,
+        center={"lat": df[LAT_COL].median(), "lon": df[LON_COL].median()},
+    )
+    selected_data = df.loc[df["selected"]]
+    fig.add_trace(
+        go.Scattermapbox(
+            lat=selected_data[LAT_COL],
+            lon=selected_data[LON_COL],
+            mode="markers",
+            marker=go.scattermapbox.Marker(size=10, color="rgb(242, 0, 0)", opacity=1),
+            hoverinfo="none",
+            name="Selected",
+        )
+    )
+    fig.update_layout(mapbox_style="carto-positron", margin=dict(r=0, t=0, l=0, b=0))
+    return fig.to_json()
+
+
+def figure_manager_build(validate: bool) -> Callable[[pd.DataFrame], str]:
+    """Build and serialise a full figure message with a `FigureManager`.
+
+    The returned function keeps its manager and caches, so calling it again
+    with the same data measures a rerun with unchanged traces.
+    """
+    manager = FigureManager(
+        lat_col=LAT_COL,
+        lon_col=LON_COL,
+        color_col="route",
+        size_col="car_hours",
+        hover_name="index",
+        hover_data=["route", "peak_hour", "car_hours"],
+        trace_cache_bytes=CACHE_BYTES,
+        validate=validate,
+    )
+    encoder = DeltaEncoder()
+    trace_cache = TraceJSONCache(CACHE_BYTES) if not validate else None
+
+    def build(df: pd.DataFrame) -> str:
+        manager.set_data(df, data_version=id(df))
+        update = manager.build(selected=np.flatnonzero(df["selected"]))
+        encoder.request_full()
+        trace_keys = {
+            id(trace): key
+            for trace, key in zip(update.figure["data"], update.trace_keys)
+        }
+        return dumps(
+            encoder.encode(update),
+            binary=False,
+            trace_cache=trace_cache,
+            trace_keys=trace_keys,
+        )
+
+    return build
+
+
+def time_call(func: Callable[[pd.DataFrame], str], df: pd.DataFrame) -> dict:
+    start = time.perf_counter()
+    payload = func(df)
+    return {"seconds": time.perf_counter() - start, "mb": len(payload) / 1024**2}
+
+
+def run(sizes: List[int]) -> pd.DataFrame:
+    results = []
+    for n_rows in sizes:
+        df = return_data(n_rows)
+        fast = figure_manager_build(validate=False)
+        timings = {
+            "build_map (px)": time_call(build_map, df),
+            "FigureManager, validated": time_call(
+                figure_manager_build(validate=True), df
+            ),
+            "FigureManager, fast": time_call(fast, df),
+            "FigureManager, fast, cached": time_call(fast, df),
+        }
+        for method, timing in timings.items():
+            results.append({"points": n_rows, "method": method, **timing})
+    results = pd.DataFrame(results)
+    baseline = results.groupby("points")["seconds"].transform("first")
+    return results.assign(speedup=baseline / results["seconds"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    args = parser.parse_args()
+    print(f"Serialising with {'orjson' if orjson is not None else 'json'}.")
+    print(run(args.sizes).to_string(index=False, float_format="{:.3f}".format))
@@ -0,0 +1,728 @@
+"""
+Example taken from https://github.com/reyemb/streamlit-plotly-mapbox-events and updated with example from https://plotly.com/python/scattermapbox/ and https://github.com/andfanilo/social-media-tutorials/blob/master/20220914-crossfiltering/streamlit_app.py.
+
+Extension of `examples/plotly_mapbox_aggrid_multi_select_change_update.py` that uses the
+`bi_comms_plotly_map` package to keep map interaction fast on large datasets.
+
+Map events are resolved to rows via an integer `SelectionIndex` instead of "lon-lat" strings,
+and the map is built incrementally by a `FigureManager`, so only changed traces are rebuilt.
+The package's own `plotly_map` component then only ships those changes to the browser,
+with coordinates encoded as binary float32 arrays. In viewport mode, only the points in (and
+around) the current map view are sent, and are paged in and out when panning and zooming.
+The points in view are looked up in a `GridIndex` that is built once and shared by all sessions.
+Lasso selections only send their outline, which is resolved to points with the same index.
+Each map event is resolved once, when it is new, against the figure it happened on.
+Zoomed out below `CLUSTER_BELOW_ZOOM`, the map shows cluster bubbles from a `ClusterPyramid`
+instead of every point; selecting a bubble selects all of its points. In density mode the
+points are drawn as a raster image, rendered server-side, and selected via their lasso outline.
+The loaded data is shared, read-only, by all sessions; each session only keeps a `DataOverlay`
+of its selection and route changes, with a `RouteIndex` of the rows of every route instead of
+regrouping the data by route on every rerun. Route changes can be undone and redone.
+The base data is normalized to a compact schema (categorical routes, float32 coordinates,
+downcast integers); the memory saved is shown below the map. The grid is paged on the server
+by a `GridWindow`: it only receives the rows of the current page, with their selection read
+from the selection bitmap. The selection summary per route is updated with the points that
+change selection or route, instead of being regrouped on every rerun. The selected points are
+a `RowView` of their positions in the shared data; only the page shown is copied out of it.
+The grid, the summary and the selected points table are `Regions` that declare which tracked
+inputs they depend on, and reuse their previous output unless one of those changed, so a map
+move does not rebuild them. Built traces are kept in a size-bounded LRU cache, so switching
+back to an earlier route filter, view or mode does not rebuild its traces. Traces are assembled
+from NumPy arrays without plotly's validation, and their serialised JSON is cached as well.
+Both caches are shared by all sessions, so their budgets do not grow with the number of users;
+the trace cache is sized to hold `SHARED_TRACE_CACHE_FIGURES` figures of all points.
+Large figures are loaded progressively: a spatially stratified first chunk of the points is
+built and drawn right away, and the rest is built and streamed in batches; selecting is
+possible once all are loaded.
+With `DATA_PATH` set to a Parquet or Arrow IPC file, the data is read from a memory-mapped
+`ParquetSource` or `ArrowSource`, projected to the columns used and filtered to `DATA_ROUTES`
+and `DATA_BOUNDS` while reading; otherwise the carshare data is read via a `FrameSource`.
+Map and grid selections are `SelectionState` bitmaps,
+and a `ChangeTracker` reruns the app once for every change of an input, including deselections.
+Panning and zooming are debounced in the map component; unless the map depends on the view
+(viewport or density mode, or crossing the clustering zoom), the view is only stored, without
+rerunning the app. Selected points are highlighted in the browser as soon as they are
+selected; with "Update tables on map selection" unchecked, the app only learns about map
+selections along with the next other map event.
+
+Run it via the below from the main project:
+
+```
+PYTHONPATH=src streamlit run examples/plotly_mapbox_large_data_select_change_update.py
+```
+"""
+
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import streamlit as st
+from st_aggrid import AgGrid, GridOptionsBuilder
+
+from bi_comms_plotly_map import DataOverlay, FigureManager, FigureUpdate, SelectionState
+from bi_comms_plotly_map.cache import LRUCache
+from bi_comms_plotly_map.change_detection import ChangeTracker
+from bi_comms_plotly_map.clustering import ClusterPyramid
+from bi_comms_plotly_map.component import (
+    plotly_map,
+    return_loading_progress,
+    return_payload_stats,
+    return_selection_index,
+)
+from bi_comms_plotly_map.data_source import (
+    ArrowSource,
+    DataSource,
+    FrameSource,
+    ParquetSource,
+)
+from bi_comms_plotly_map.encoding import TraceJSONCache
+from bi_comms_plotly_map.grid import POSITION_COL, GridWindow
+from bi_comms_plotly_map.progressive import FIRST_CHUNK_POINTS
+from bi_comms_plotly_map.regions import Regions
+from bi_comms_plotly_map.route_index import RouteIndex
+from bi_comms_plotly_map.schema import memory_report, normalize_frame
+from bi_comms_plotly_map.spatial_index import GridIndex
+from bi_comms_plotly_map.viewport import Viewport, ViewportCuller
+
+# Parquet (`.parquet`) or Arrow IPC (`.arrow`, `.feather`) file with the columns of
+# `COLUMN_ORDER`, ideally sorted by route; the carshare data is used when `None`.
+DATA_PATH = None
+# Routes (e.g. `["R07", "R08"]`) and `Viewport` bounds to load, all when `None`.
+DATA_ROUTES = None
+DATA_BOUNDS = None
+PLOTLY_HEIGHT = 500
+LAT_COL = "centroid_lat"
+LON_COL = "centroid_lon"
+
+LAT_LON_QUERIES = [
+    "lat_lon_click_query",
+    "lat_lon_select_query",
+    "lat_lon_hover_query",
+]
+LAT_LON_QUERIES_ACTIVE = {
+    "lat_lon_click_query": False,
+    "lat_lon_select_query": True,
+    "lat_lon_hover_query": False,
+}
+LAT_LON_QUERY_EVENTS = {
+    "lat_lon_click_query": "click",
+    "lat_lon_select_query": "select",
+    "lat_lon_hover_query": "hover",
+}
+SELECTION_QUERIES = LAT_LON_QUERIES + ["aggrid_select"]
+
+MAP_ZOOM = 11
+SELECT_GEOMETRY_ONLY = True
+RELAYOUT_DEBOUNCE_MS = 300
+VIEWPORT_MARGIN = 0.5
+CLUSTER_BELOW_ZOOM = 10
+GRID_PAGE_SIZE = 200
+SELECTED_PAGE_SIZE = 50
+SHARED_TRACE_CACHE_BYTES = 512 * 1024**2
+SHARED_TRACE_CACHE_FIGURES = 4
+SHARED_TRACE_JSON_CACHE_BYTES = 256 * 1024**2
+
+REGION_DEPENDENCIES = {
+    "grid": ("selection", "routes", "route_filters", "grid_page"),
+    "summary": ("selection", "routes"),
+    "selected_points": ("selection", "routes", "selected_page"),
+}
+
+COLUMN_ORDER = [
+    "index",
+    "route",
+    "peak_hour",
+    "car_hours",
+    "centroid_lat",
+    "centroid_lon",
+]
+
+
+@st.experimental_singleton
+def return_data_source() -> DataSource:
+    """The source of the base data: `DATA_PATH` if set, the carshare data otherwise."""
+    if DATA_PATH is None:
+        data = px.data.carshare()
+        data = data.assign(
+            route="R" + data["peak_hour"].astype(str).str.zfill(2),
+            index=data.index,
+        ).sort_values(["route"])
+        return FrameSource(data, LAT_COL, LON_COL, route_col="route")
+    if DATA_PATH.endswith(".parquet"):
+        return ParquetSource(DATA_PATH, LAT_COL, LON_COL, route_col="route")
+    return ArrowSource(DATA_PATH, LAT_COL, LON_COL, route_col="route")
+
+
+@st.experimental_singleton
+def load_transform_data() -> Tuple[
+    pd.DataFrame, GridIndex, ClusterPyramid, RouteIndex, pd.DataFrame
+]:
+    """Load data and do some basic transformation. The `st.experimental_singleton`
+    decorator prevents the data from being continously reloaded.
+
+    Returns the base data, normalized to a compact schema, with a spatial index and
+    cluster pyramid over its point coordinates and an index of its routes. All are
+    shared by all sessions and never changed; session changes are kept in a
+    `DataOverlay`. The memory use of the data before and after normalizing is
+    returned as well, so the data as read is not kept.
+    """
+    read = return_data_source().read(COLUMN_ORDER, routes=DATA_ROUTES, bbox=DATA_BOUNDS)
+    data = normalize_frame(read, LAT_COL, LON_COL, route_col="route")
+    report = memory_report(read, data)
+    return (
+        data,
+        GridIndex.from_frame(data, LAT_COL, LON_COL),
+        ClusterPyramid.from_frame(data, LAT_COL, LON_COL, weight_col="car_hours"),
+        RouteIndex.from_frame(data, "route"),
+        report,
+    )
+
+
+@st.experimental_singleton
+def return_shared_caches() -> Tuple[LRUCache, TraceJSONCache]:
+    """Caches of built and of serialised traces, shared by all sessions.
+
+    The traces are keyed by their contents (data version, route rows, view), so
+    sessions showing the same routes reuse each other's traces. The trace cache
+    holds `SHARED_TRACE_CACHE_FIGURES` figures of all points of the data, and at
+    least `SHARED_TRACE_CACHE_BYTES`.
+    """
+    data, _, _, route_index, _ = load_transform_data()
+    figure_manager = new_figure_manager()
+    figure_manager.set_data(data, data_version=0, route_index=route_index)
+    trace_cache_bytes = max(
+        SHARED_TRACE_CACHE_BYTES,
+        SHARED_TRACE_CACHE_FIGURES * figure_manager.figure_nbytes,
+    )
+    return (
+        LRUCache(trace_cache_bytes),
+        TraceJSONCache(SHARED_TRACE_JSON_CACHE_BYTES),
+    )
+
+
+def new_figure_manager(**kwargs) -> FigureManager:
+    """A figure manager with the settings of the map, see `FigureManager`."""
+    return FigureManager(
+        lat_col=LAT_COL,
+        lon_col=LON_COL,
+        color_col="route",
+        size_col="car_hours",
+        hover_name="index",
+        hover_data=["route", "peak_hour", "car_hours"],
+        height=PLOTLY_HEIGHT,
+        cluster_below_zoom=CLUSTER_BELOW_ZOOM,
+        selection_highlight="selectedpoints",
+        validate=False,
+        point_order="stratified",
+        **kwargs,
+    )
+
+
+def initialize_state():
+    """Initializes all filters, data and counter in Streamlit Session State."""
+    n_rows = return_n_rows()
+    for query in LAT_LON_QUERIES:
+        if query not in st.session_state:
+            st.session_state[query] = SelectionState(n_rows)
+
+    if "map_move_query" not in st.session_state:
+        st.session_state.map_move_query = None
+
+    if "change_tracker" not in st.session_state:
+        st.session_state.change_tracker = ChangeTracker()
+
+    if "regions" not in st.session_state:
+        st.session_state.regions = Regions(st.session_state.change_tracker)
+        for region, dependencies in REGION_DEPENDENCIES.items():
+            st.session_state.regions.declare(region, dependencies)
+
+    if "map_layout" not in st.session_state:
+        st.session_state.map_layout = {}
+
+    if "counter" not in st.session_state:
+        st.session_state.counter = 0
+
+    if "aggrid_select" not in st.session_state:
+        st.session_state.aggrid_select = SelectionState(n_rows)
+
+    if "data" not in st.session_state:
+        st.session_state.data = None
+
+    if "data_overlay" not in st.session_state:
+        st.session_state.data_overlay = None
+
+    if "selected_data" not in st.session_state:
+        st.session_state.selected_data = []
+
+    if "current_query" not in st.session_state:
+        st.session_state.current_query = {}
+
+    if "route_filters" not in st.session_state:
+        st.session_state.route_filters = []
+
+    if "handled_map_events" not in st.session_state:
+        st.session_state.handled_map_events = {}
+
+    if "figure_manager" not in st.session_state:
+        st.session_state.figure_manager = new_figure_manager(
+            trace_cache=return_shared_caches()[0]
+        )
+
+    if "viewport_mode" not in st.session_state:
+        st.session_state.viewport_mode = False
+
+    if "density_mode" not in st.session_state:
+        st.session_state.density_mode = False
+
+    if "live_selection" not in st.session_state:
+        st.session_state.live_selection = True
+
+    if "grid_window" not in st.session_state:
+        st.session_state.grid_window = GridWindow(page_size=GRID_PAGE_SIZE)
+
+    if "viewport_culler" not in st.session_state:
+        st.session_state.viewport_culler = ViewportCuller(margin=VIEWPORT_MARGIN)
+
+
+def return_n_rows() -> int:
+    """Number of rows of the shared base data, the size of all selections."""
+    return load_transform_data()[0].shape[0]
+
+
+def return_memory_report() -> pd.DataFrame:
+    """Memory use of the base data per column, before and after normalizing."""
+    return load_transform_data()[4]
+
+
+def return_filtered_positions() -> np.ndarray:
+    """Row positions of the routes filtered on, or of all rows."""
+    if st.session_state.route_filters:
+        route_index = st.session_state.data_overlay.route_index
+        return route_index.filter(st.session_state.route_filters)
+    return np.arange(st.session_state.data.shape[0])
+
+
+def reset_state_callback():
+    """Resets all filters and increments counter in Streamlit Session State"""
+    st.session_state.counter += 1
+    n_rows = return_n_rows()
+    for query in LAT_LON_QUERIES:
+        st.session_state[query] = SelectionState(n_rows)
+    # st.session_state.map_move_query = set()
+    # st.session_state.map_layout = {}
+    st.session_state.aggrid_select = SelectionState(n_rows)
+    st.session_state.current_query = {}
+    st.session_state.change_tracker.reset(SELECTION_QUERIES)
+    st.session_state.data_overlay.clear_selection()
+
+
+def query_data_map() -> pd.DataFrame:
+    """Apply filters in Streamlit Session State to filter the input DataFrame"""
+    overlay = st.session_state.data_overlay
+    selected = st.session_state["aggrid_select"]
+    for query in LAT_LON_QUERIES:
+        selected = selected | st.session_state[query]
+    overlay.set_selected(selected)
+    st.session_state.data = overlay.view()
+    st.session_state.selected_data = overlay.selected_rows(COLUMN_ORDER)
+
+
+def track_region_inputs() -> None:
+    """Record the inputs the page regions depend on, see `REGION_DEPENDENCIES`."""
+    tracker = st.session_state.change_tracker
+    overlay = st.session_state.data_overlay
+    tracker.update("selection", overlay.selected)
+    tracker.update("routes", overlay.route_version)
+    tracker.update("route_filters", list(st.session_state.route_filters))
+
+
+def set_figure_data() -> None:
+    """Pass the current data, and the indexes over it, to the figure manager."""
+    st.session_state.figure_manager.set_data(
+        st.session_state.data,
+        data_version=0,
+        spatial_index=st.session_state.spatial_index,
+        cluster_pyramid=st.session_state.cluster_pyramid,
+        route_index=st.session_state.data_overlay.route_index,
+    )
+
+
+def build_map() -> FigureUpdate:
+    """Build a scatter plot on map of selected and normal elements.
+
+    Only the traces whose data changed since the previous run are rebuilt.
+    """
+    if st.session_state.map_layout:
+        center = st.session_state.map_layout["center"]
+        zoom = st.session_state.map_layout["zoom"]
+    else:
+        center, zoom = None, MAP_ZOOM
+
+    figure_manager = st.session_state.figure_manager
+    set_figure_data()
+
+    viewport = None
+    if st.session_state.viewport_mode:
+        view = st.session_state.map_layout.get("viewport")
+        if view is None:
+            view = Viewport.from_center_zoom(
+                center or figure_manager.default_center, zoom, height_px=PLOTLY_HEIGHT
+            )
+        viewport = st.session_state.viewport_culler.update(view)
+
+    update = figure_manager.build(
+        selected=st.session_state.data_overlay.selected_positions(),
+        route_filters=st.session_state.route_filters,
+        center=center,
+        zoom=zoom,
+        viewport=viewport,
+        density=st.session_state.density_mode,
+        first_points=FIRST_CHUNK_POINTS,
+    )
+    return update
+
+
+def return_map_key() -> str:
+    """Key of the map component, changed to reset the map."""
+    return f"lat_lon_query{st.session_state.counter}"
+
+
+def return_grid_key() -> str:
+    """Key of the grid, changed to reset it and whenever the grid is rebuilt."""
+    versions = "_".join(str(v) for v in st.session_state.regions.key("grid"))
+    return f"selection_grid{st.session_state.counter}_{versions}"
+
+
+def render_plotly_map_ui() -> None:
+    """Renders all Plotly figures.
+
+    Returns a Dict of filter to set of row identifiers to keep, built from the
+    click/select events from Plotly figures.
+
+    The return will be then stored into Streamlit Session State next.
+    """
+
+    def return_query_selections(map_events: dict) -> None:
+        """Unpack events from the plotly map component.
+
+        The latest events are returned on every rerun, but each is resolved once,
+        when it is new, so a selection does not change with the figure shown later
+        (e.g. a route filter or a culled viewport). Events are resolved with the
+        `SelectionIndex` of the figure they happened on, and ignored when that
+        figure is no longer known. Only sources with a new event are set in the
+        current query.
+        """
+        handled = st.session_state.handled_map_events
+        n_rows = return_n_rows()
+        for query in LAT_LON_QUERIES:  # search for point selections on map
+            geometry = query == "lat_lon_select_query" and SELECT_GEOMETRY_ONLY
+            kind = "select_geometry" if geometry else LAT_LON_QUERY_EVENTS[query]
+            update = map_events["updates"].get(kind)
+            selection_index = None
+            if (
+                LAT_LON_QUERIES_ACTIVE[query]
+                and update
+                and handled.get(kind) != update["id"]
+            ):
+                handled[kind] = update["id"]
+                selection_index = return_selection_index(
+                    return_map_key(), update["ack"]
+                )
+            if selection_index is None:
+                continue
+            if geometry:
+                positions = selection_index.resolve_geometry(map_events[kind])
+            else:
+                positions = selection_index.resolve(map_events[kind])
+            st.session_state.current_query[query] = SelectionState.from_positions(
+                n_rows, positions
+            )
+
+        if map_events["relayout"]:  # there was a layout update
+            st.session_state.map_layout["center"] = map_events["relayout"]["center"]
+            st.session_state.map_layout["zoom"] = map_events["relayout"]["zoom"]
+            st.session_state.map_layout["viewport"] = Viewport.from_relayout(
+                map_events["relayout"], height_px=PLOTLY_HEIGHT
+            )
+            st.session_state.current_query["map_move_query"] = (
+                map_events["relayout"]["center"]["lat"],
+                map_events["relayout"]["center"]["lon"],
+                map_events["relayout"]["zoom"],
+            )
+            st.session_state.current_query["map_move_deferred"] = bool(
+                map_events["relayout"].get("deferred")
+            )
+        else:
+            st.session_state.current_query["map_move_query"] = None
+            st.session_state.current_query["map_move_deferred"] = False
+
+    # Only rerun on map moves when the figure depends on the map view.
+    view_dependent = st.session_state.viewport_mode or st.session_state.density_mode
+
+    map_events = plotly_map(
+        build_map(),
+        click_event=LAT_LON_QUERIES_ACTIVE["lat_lon_click_query"],
+        select_event=LAT_LON_QUERIES_ACTIVE["lat_lon_select_query"],
+        hover_event=LAT_LON_QUERIES_ACTIVE["lat_lon_hover_query"],
+        relayout_event=True,
+        relayout_debounce_ms=RELAYOUT_DEBOUNCE_MS,
+        relayout_mode="rerun" if view_dependent else "store",
+        relayout_zoom_breaks=[CLUSTER_BELOW_ZOOM],
+        select_mode="rerun" if st.session_state.live_selection else "store",
+        select_geometry_only=SELECT_GEOMETRY_ONLY,
+        key=return_map_key(),
+        override_height=PLOTLY_HEIGHT,
+        override_width="100%",
+        progressive=True,
+        trace_cache=return_shared_caches()[1],
+    )
+    return_query_selections(map_events)
+
+    if map_events["loading"]:
+        loaded, total = return_loading_progress(return_map_key())
+        st.caption(f"Loading points: {loaded} of {total}, selection is disabled.")
+    stats = return_payload_stats(return_map_key())
+    if stats:
+        st.caption(
+            f"Map update v{stats['version']} ({'full' if stats['full'] else 'delta'}): "
+            f"{stats['bytes'] / 1024:.1f} KB serialised in {stats['seconds'] * 1000:.1f} ms"
+        )
+    cache = st.session_state.figure_manager.cache_stats
+    st.caption(
+        f"Trace cache (shared): {cache['entries']} traces, {cache['bytes'] / 1024**2:.1f} MB, "
+        f"{cache['hits']} hits, {cache['misses']} misses, "
+        f"{cache['evictions']} evictions, {cache['rejected']} too large to cache"
+    )
+
+
+def build_grid(page: int) -> Tuple[pd.DataFrame, dict, np.ndarray]:
+    """Rows, grid options and row positions of the grid `page`."""
+    grid_window = st.session_state.grid_window
+    rows = return_filtered_positions()
+    grid_window.set_page(page - 1, rows.shape[0])
+    positions = grid_window.window(rows)
+    data = grid_window.frame(st.session_state.data, positions, COLUMN_ORDER)
+
+    pre_selected_rows = grid_window.pre_selected(
+        positions, st.session_state.data_overlay.selected
+    )
+
+    gb = GridOptionsBuilder.from_dataframe(data)
+    gb.configure_column("index", headerCheckboxSelection=True)
+    gb.configure_column(POSITION_COL, hide=True)
+    gb.configure_side_bar()  # Add a sidebar
+    gb.configure_selection(
+        "multiple",
+        use_checkbox=True,
+        groupSelectsChildren="Group checkbox select children",
+        pre_selected_rows=pre_selected_rows,
+    )  # Enable multi-row selection
+    return data, gb.build(), positions
+
+
+def selection_dataframe() -> None:
+    """Grid of the current page of the filtered rows.
+
+    Only the rows of the page are sent to the grid; grid selections replace the
+    grid selection of those rows and keep that of the other pages, when the grid
+    reported a new selection for the page. The grid is only rebuilt when an input
+    of the "grid" region changed. Its key changes with those inputs, as a keyed
+    grid only shows new rows and pre-selections when it is mounted, and stays the
+    same otherwise, so the grid keeps its selection.
+    """
+    grid_window = st.session_state.grid_window
+    n_rows = return_filtered_positions().shape[0]
+    page = st.number_input(
+        f"Grid page (of {grid_window.n_pages(n_rows)})",
+        min_value=1,
+        max_value=grid_window.n_pages(n_rows),
+        value=grid_window.set_page(grid_window.page, n_rows) + 1,
+    )
+    st.session_state.change_tracker.update("grid_page", page)
+    data, gridOptions, positions = st.session_state.regions.run(
+        "grid", lambda: build_grid(page)
+    )
+
+    grid_response = AgGrid(
+        data,
+        gridOptions=gridOptions,
+        data_return_mode="AS_INPUT",
+        update_mode="MANUAL",
+        columns_auto_size_mode="FIT_CONTENTS",
+        fit_columns_on_grid_load=False,
+        theme="streamlit",  # Add theme color to the table
+        enable_enterprise_modules=True,
+        height=PLOTLY_HEIGHT,
+        width="100%",
+        reload_data=False,
+        key=return_grid_key(),
+    )
+    selected_rows = grid_response["selected_rows"]
+    if grid_response.column_state is None:
+        selected_rows = None  # the grid did not respond yet
+    if not grid_window.is_new_response(return_grid_key(), selected_rows):
+        return
+    st.session_state.current_query["aggrid_select"] = GridWindow.merge(
+        st.session_state.aggrid_select, positions, grid_response["selected_rows"]
+    )
+
+
+def update_state():
+    """Stores input dict of filters into Streamlit Session State.
+
+    If one of the input filters is different from previous value in Session State,
+    rerun Streamlit to activate the filtering and plot updating with the new info in State.
+    Changes, including deselections, are detected by the `ChangeTracker` fingerprints,
+    so every change causes exactly one rerun. Only sources with a new event (a map
+    event or a grid response) are in the current query, so deselections are never
+    taken from a reset or not yet reported component.
+    """
+    tracker = st.session_state.change_tracker
+    rerun = False
+    for query in SELECTION_QUERIES:
+        if query not in st.session_state.current_query:
+            continue
+        current = st.session_state.current_query.pop(query)
+        if tracker.update(query, current):
+            # Rows deselected in this source are deselected in the data as well.
+            st.session_state.data_overlay.set_selected(
+                st.session_state[query] - current, selected=False
+            )
+            st.session_state[query] = current
+            rerun = True
+
+    if tracker.update(
+        "map_move_query", st.session_state.current_query["map_move_query"]
+    ):
+        st.session_state["map_move_query"] = st.session_state.current_query[
+            "map_move_query"
+        ]
+        # A deferred map view came along with another event, which reruns by itself.
+        rerun = rerun or not st.session_state.current_query["map_move_deferred"]
+
+    if rerun:
+        st.experimental_rerun()
+
+
+def activate_side_bar():
+    routes = st.session_state.data_overlay.route_index.routes
+    with st.sidebar:
+        st.session_state.route_filters = st.multiselect("Filter route", routes)
+        st.button(key="button0", label="Clear selection", on_click=reset_state_callback)
+        st.session_state.viewport_mode = st.checkbox(
+            "Only send points in view", value=st.session_state.viewport_mode
+        )
+        st.session_state.density_mode = st.checkbox(
+            "Draw points as a density raster", value=st.session_state.density_mode
+        )
+        st.session_state.live_selection = st.checkbox(
+            "Update tables on map selection", value=st.session_state.live_selection
+        )
+        update_mode = st.radio(
+            "Update selected points to", ("different route", "new route")
+        )
+        if update_mode == "different route":
+            new_route_id = st.selectbox("Update selected point route value to:", routes)
+        elif update_mode == "new route":
+            new_id = max(routes) + "_" + "A"
+            new_route_id = st.text_input(
+                "Update selected point route value to new route name:", new_id
+            )
+        cap_button = st.button(
+            key="button1",
+            label=f"Change selected points to route {new_route_id}",
+        )
+        if cap_button:
+            update_selected_points(new_route_id)
+        editor = st.session_state.data_overlay.route_editor
+        undo_col, redo_col = st.columns(2)
+        with undo_col:
+            if st.button("Undo route change", disabled=not editor.can_undo):
+                apply_route_changes(st.session_state.data_overlay.undo_routes())
+        with redo_col:
+            if st.button("Redo route change", disabled=not editor.can_redo):
+                apply_route_changes(st.session_state.data_overlay.redo_routes())
+
+
+def update_selected_points(new_route_id):
+    if len(st.session_state.selected_data) > 0:
+        overlay = st.session_state.data_overlay
+        apply_route_changes(
+            overlay.set_routes(overlay.selected_positions(), new_route_id)
+        )
+    else:
+        st.warning("No points were selected...")
+
+
+def apply_route_changes(changed_routes: list):
+    """Rebuild the traces of the changed routes only, and rerun."""
+    st.session_state.data = st.session_state.data_overlay.view()
+    set_figure_data()
+    st.session_state.figure_manager.update_routes(changed_routes)
+    st.experimental_rerun()
+
+
+def return_selection_summary() -> pd.DataFrame:
+    """Summary per route of the selected points, kept up to date by the overlay."""
+    return st.session_state.data_overlay.summary.frame(route_col="route")
+
+
+@Regions.fragment
+def render_selected_points() -> None:
+    """Table of one page of the selected points, taken from the data on demand."""
+    selected = st.session_state.selected_data
+    page = st.number_input(
+        f"Selected points page (of {selected.n_pages(SELECTED_PAGE_SIZE)})",
+        min_value=1,
+        max_value=selected.n_pages(SELECTED_PAGE_SIZE),
+        value=1,
+    )
+    st.session_state.change_tracker.update("selected_page", page)
+    st.table(
+        st.session_state.regions.run(
+            "selected_points", lambda: selected.page(page - 1, SELECTED_PAGE_SIZE)
+        )
+    )
+    st.caption(f"{len(selected)} points selected")
+
+
+def main():
+    st.title("Plotly-map bi-comms selection")
+    st.text(
+        "Selecting elements on the map with lasso, or in the table. Update the route of selected elements."
+    )
+    (
+        base_data,
+        st.session_state.spatial_index,
+        st.session_state.cluster_pyramid,
+        route_index,
+        _,
+    ) = load_transform_data()
+    if st.session_state.data_overlay is None:
+        st.session_state.data_overlay = DataOverlay(
+            base_data, route_col="route", route_index=route_index
+        )
+        st.session_state.data_overlay.summarize("car_hours", "peak_hour")
+    st.session_state.data = st.session_state.data_overlay.view()
+    activate_side_bar()
+    c1, c2 = st.columns(2)
+    query_data_map()
+    track_region_inputs()
+    with c1:
+        render_plotly_map_ui()
+        st.write("Selection summary:")
+        st.table(st.session_state.regions.run("summary", return_selection_summary))
+        with st.expander("Memory use of the base data"):
+            st.table(return_memory_report())
+    with c2:
+        selection_dataframe()
+        st.write("Selected points:")
+        render_selected_points()
+    update_state()
+
+
+if __name__ == "__main__":
+    st.set_page_config(layout="wide")
+    initialize_state()
+    main()
@@ -0,0 +1,16 @@
+"""Helpers for bi-directional communication between streamlit and a plotly map."""
+
+from .selection_index import SelectionIndex
+from .selection_state import SelectionState
+from .figure_manager import FigureManager, FigureUpdate
+from .protocol import DeltaEncoder
+from .overlay import DataOverlay
+
+__all__ = [
+    "DataOverlay",
+    "DeltaEncoder",
+    "FigureManager",
+    "FigureUpdate",
+    "SelectionIndex",
+    "SelectionState",
+]
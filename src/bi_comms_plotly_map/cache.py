@@ -0,0 +1,158 @@
+"""
+Size-bounded least-recently-used cache.
+
+Caching only the last built value per slot (e.g. one trace per route) means
+that flipping back and forth between two route filters, map views or modes
+rebuilds the same values over and over. An `LRUCache` keeps any number of values
+under their composite keys, up to a total size in bytes, and evicts the least
+recently used values first. Hits, misses and evictions are counted, so the
+cache can be sized from its `stats`; values too large for the cache are counted
+as `rejected` and warned about with a `CacheSizeWarning`. A cache can be shared
+between the sessions of an app (e.g. via `st.experimental_singleton`), as long as
+its keys identify the contents of the values; its operations are guarded by a
+lock.
+"""
+
+import sys
+import threading
+import warnings
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+import numpy as np
+
+# Objects measured per object array by `nbytes`.
+NBYTES_SAMPLE = 1000
+
+
+class CacheSizeWarning(UserWarning):
+    """A value was not cached, as it is larger than the whole cache."""
+
+
+class LRUCache:
+    """Values under hashable keys, evicted least recently used first.
+
+    The size of a value is estimated with `sizeof` when it is stored; values
+    larger than `max_bytes` are not stored at all, with a `CacheSizeWarning`.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        max_entries: Optional[int] = None,
+        sizeof: Optional[Callable[[Any], int]] = None,
+    ):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.sizeof = sizeof or nbytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.rejected = 0
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Value under `key`, marked as most recently used, or `default`."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Store `value` under `key`, evicting values until it fits."""
+        size = self.sizeof(value)
+        with self._lock:
+            self.pop(key)
+            if size > self.max_bytes:
+                self.rejected += 1
+                warnings.warn(
+                    f"A value of {size} bytes is not cached, as the cache only "
+                    f"holds {self.max_bytes} bytes.",
+                    CacheSizeWarning,
+                    stacklevel=2,
+                )
+                return
+            self._entries[key] = (value, size)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes or (
+                self.max_entries is not None and len(self._entries) > self.max_entries
+            ):
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.nbytes -= evicted
+                self.evictions += 1
+
+    def get_or_build(self, key: Hashable, build: Callable[[], Any]) -> Any:
+        """Value under `key`, built with `build` and stored on a miss.
+
+        The value is built outside of the lock, so other sessions are not held up.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return entry[0]
+            self.misses += 1
+        value = build()
+        self.put(key, value)
+        return value
+
+    def pop(self, key: Hashable) -> Any:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            self.nbytes -= entry[1]
+            return entry[0]
+
+    def clear(self) -> None:
+        """Drop all values, keeping the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    @property
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.nbytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "rejected": self.rejected,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+def nbytes(value: Any) -> int:
+    """Approximate bytes held by nested dicts, lists, arrays and strings.
+
+    The objects in object arrays are measured on a sample of `NBYTES_SAMPLE`.
+    """
+    if isinstance(value, np.ndarray):
+        if value.dtype == object and value.size:
+            sample = value.ravel()[:: max(value.size // NBYTES_SAMPLE, 1)]
+            per_object = sum(sys.getsizeof(v) for v in sample) / sample.shape[0]
+            return value.nbytes + int(per_object * value.size)
+        return value.nbytes
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(nbytes(k) + nbytes(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(nbytes(v) for v in value)
+    return sys.getsizeof(value)
@@ -0,0 +1,198 @@
+"""
+Zoom dependent clustering of map points.
+
+Beyond ~100k markers a scatter map becomes unusable, so at low zoom levels points
+are shown as cluster bubbles instead. The `ClusterPyramid` buckets points into a
+web mercator grid per zoom level (cells of `cell_px` screen pixels). Points are
+sorted once by their Morton (z-order) code at the finest level, which makes the
+points of every cell, at every coarser level, a contiguous range of that order.
+Each level therefore only stores cluster boundaries and aggregates, and the
+members of a cluster are a slice of the shared order.
+"""
+
+import math
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from .viewport import TILE_SIZE, Viewport, mercator_xy
+
+CLUSTER_CELL_PX = 64
+MAX_CLUSTER_ZOOM = 16
+
+
+class ClusterLevel:
+    """Clusters of one zoom level.
+
+    Cluster `i` holds the points `order[starts[i]:ends[i]]` of the pyramid, of
+    which `count[i]` are included (all of them, unless a mask was applied).
+    """
+
+    def __init__(
+        self,
+        zoom: int,
+        starts: np.ndarray,
+        ends: np.ndarray,
+        count: np.ndarray,
+        weight: np.ndarray,
+        lat: np.ndarray,
+        lon: np.ndarray,
+    ):
+        self.zoom = zoom
+        self.starts = starts
+        self.ends = ends
+        self.count = count
+        self.weight = weight
+        self.lat = lat
+        self.lon = lon
+
+    def __len__(self) -> int:
+        return self.starts.shape[0]
+
+    def subset(self, keep: np.ndarray) -> "ClusterLevel":
+        return ClusterLevel(
+            self.zoom,
+            self.starts[keep],
+            self.ends[keep],
+            self.count[keep],
+            self.weight[keep],
+            self.lat[keep],
+            self.lon[keep],
+        )
+
+
+class ClusterPyramid:
+    """Hierarchical grid clusters of points, for zoom levels 0 to `max_zoom`."""
+
+    def __init__(
+        self,
+        lat: np.ndarray,
+        lon: np.ndarray,
+        weights: Optional[np.ndarray] = None,
+        max_zoom: int = MAX_CLUSTER_ZOOM,
+        cell_px: int = CLUSTER_CELL_PX,
+    ):
+        if cell_px & (cell_px - 1) or not 0 < cell_px <= TILE_SIZE:
+            raise ValueError(f"`cell_px` has to be a power of two up to {TILE_SIZE}.")
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        self.max_zoom = max_zoom
+        # Bits per axis of the cell index at zoom 0.
+        self._zoom_bits = int(math.log2(TILE_SIZE // cell_px))
+        bits = max_zoom + self._zoom_bits
+        if bits > 31:
+            raise ValueError("`max_zoom` too large for the cell size.")
+
+        valid = np.flatnonzero(np.isfinite(lat) & np.isfinite(lon))
+        x, y = mercator_xy(lat[valid], lon[valid])
+        cells = 2**bits
+        ix = np.clip((x * cells).astype(np.int64), 0, cells - 1)
+        iy = np.clip((y * cells).astype(np.int64), 0, cells - 1)
+        codes = _interleave(ix) | (_interleave(iy) << 1)
+        sort = np.argsort(codes, kind="stable")
+        self.order = valid[sort]
+        self._codes = codes[sort]
+        self._bits = bits
+        self._lat = lat[self.order]
+        self._lon = lon[self.order]
+        self._weights = (
+            np.ones(self.order.shape[0])
+            if weights is None
+            else np.asarray(weights, dtype=np.float64)[self.order]
+        )
+        self.levels = [self._build_level(zoom) for zoom in range(max_zoom + 1)]
+
+    @classmethod
+    def from_frame(
+        cls,
+        data: pd.DataFrame,
+        lat_col: str,
+        lon_col: str,
+        weight_col: Optional[str] = None,
+        **kwargs,
+    ) -> "ClusterPyramid":
+        weights = None if weight_col is None else data[weight_col].to_numpy()
+        return cls(
+            data[lat_col].to_numpy(), data[lon_col].to_numpy(), weights, **kwargs
+        )
+
+    def level(self, zoom: float) -> ClusterLevel:
+        """Clusters for a (fractional) map zoom."""
+        return self.levels[int(min(max(math.floor(zoom), 0), self.max_zoom))]
+
+    def clusters(
+        self,
+        zoom: float,
+        mask: Optional[np.ndarray] = None,
+        viewport: Optional[Viewport] = None,
+    ) -> ClusterLevel:
+        """Clusters for a zoom, over the rows in `mask` and inside `viewport`.
+
+        `mask` is a boolean array over the rows of the data, e.g. a route filter.
+        Cluster counts, weights and centroids are recomputed over the masked rows.
+        """
+        level = self.level(zoom)
+        if mask is not None and len(level):
+            included = mask[self.order]
+            count = np.add.reduceat(included.astype(np.int64), level.starts)
+            weight = np.add.reduceat(self._weights * included, level.starts)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                lat = np.add.reduceat(self._lat * included, level.starts) / count
+                lon = np.add.reduceat(self._lon * included, level.starts) / count
+            level = ClusterLevel(
+                level.zoom, level.starts, level.ends, count, weight, lat, lon
+            ).subset(count > 0)
+        if viewport is not None:
+            level = level.subset(viewport.contains(level.lat, level.lon))
+        return level
+
+    def members(
+        self,
+        level: ClusterLevel,
+        clusters: np.ndarray,
+        mask: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        """Row positions of the points in `clusters` (indices into `level`)."""
+        clusters = np.asarray(clusters, dtype=np.int64)
+        if clusters.size == 0:
+            return np.empty(0, dtype=np.int64)
+        rows = np.concatenate(
+            [self.order[level.starts[c] : level.ends[c]] for c in clusters]
+        )
+        if mask is not None:
+            rows = rows[mask[rows]]
+        return rows
+
+    def _build_level(self, zoom: int) -> ClusterLevel:
+        if self.order.size == 0:
+            empty = np.empty(0, dtype=np.int64)
+            return ClusterLevel(zoom, empty, empty, empty, empty * 1.0, empty, empty)
+        shift = 2 * (self._bits - (zoom + self._zoom_bits))
+        level_codes = self._codes >> shift
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(level_codes)) + 1))
+        ends = np.append(starts[1:], level_codes.shape[0])
+        count = ends - starts
+        return ClusterLevel(
+            zoom,
+            starts,
+            ends,
+            count,
+            np.add.reduceat(self._weights, starts),
+            np.add.reduceat(self._lat, starts) / count,
+            np.add.reduceat(self._lon, starts) / count,
+        )
+
+
+def _interleave(values: np.ndarray) -> np.ndarray:
+    """Spread the (up to 32) bits of `values` to the even bits of an int64."""
+    v = values.astype(np.uint64)
+    for shift, magic in (
+        (16, 0x0000FFFF0000FFFF),
+        (8, 0x00FF00FF00FF00FF),
+        (4, 0x0F0F0F0F0F0F0F0F),
+        (2, 0x3333333333333333),
+        (1, 0x5555555555555555),
+    ):
+        v = (v | (v << np.uint64(shift))) & np.uint64(magic)
+    return v.astype(np.int64)
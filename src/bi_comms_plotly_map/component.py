@@ -0,0 +1,296 @@
+"""
+Bi-directional plotly map streamlit component.
+
+The frontend (`frontend/`) keeps the figure in the browser and applies the
+delta messages of `protocol.DeltaEncoder`, so a rerun only ships what changed.
+Events are returned in the same shape as `streamlit_plotly_mapbox_events`
+(points with `lat`, `lon`, `curveNumber` and `pointIndex`). With
+`select_geometry_only`, selections only return their lasso or box outline, to be
+resolved with `SelectionIndex.resolve_geometry`.
+
+Relayout events (panning and zooming) are debounced in the frontend: the events
+of one gesture are merged and only reported once the map has been still for
+`relayout_debounce_ms`. With `relayout_mode="store"`, the map view is not
+reported on its own at all, so panning causes no rerun; the latest view is sent
+along with the next other event instead, marked `deferred`.
+
+Events refer to points of the figure the frontend held when they happened, which
+can be older than the figure of the current rerun. The `SelectionIndex` of the
+last few figure versions sent is kept, to resolve events against the figure they
+happened on (see `return_selection_index`).
+
+Selections are highlighted by plotly in the browser right away; with a
+`FigureManager(selection_highlight="selectedpoints")` figure, python keeps the
+same styling once it has seen the selection. With `select_mode="store"`,
+selections are only sent along with the next reported event, so selecting does
+not rerun the app until something that depends on it is needed.
+
+The serialised JSON of every trace is cached by its `FigureUpdate` trace key,
+so a full message only serialises the traces that were not sent before. Pass a
+`TraceJSONCache` shared by all sessions as `trace_cache` to keep one cache per
+app instead of one per session.
+
+The state of each map (its encoder, loader, last payload and selection indexes)
+is kept per component key in one dict in Streamlit Session State. The state of
+keys that were not rendered since the previous render of a key is dropped, e.g.
+that of an old key after changing the key to reset the map.
+
+With `progressive`, large figures are sent as a first chunk of points, and the
+rest in `extendTraces` batches, one per rerun, requested by the frontend once it
+has drawn the previous batch (see `progressive.ProgressiveLoader`). Selections
+are ignored until all points are loaded.
+"""
+
+import os
+import time
+from collections import OrderedDict
+from typing import Optional, Sequence
+
+import streamlit as st
+import streamlit.components.v1 as components
+
+from .encoding import TraceJSONCache, dumps
+from .figure_manager import FigureUpdate
+from .progressive import CHUNK_POINTS, FIRST_CHUNK_POINTS, ProgressiveLoader
+from .protocol import DeltaEncoder
+from .selection_index import SelectionIndex
+
+FRONTEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "frontend")
+
+_component_func = components.declare_component("bi_comms_plotly_map", path=FRONTEND_DIR)
+
+EMPTY_EVENTS = {
+    "event_id": 0,
+    "click": [],
+    "select": [],
+    "hover": [],
+    "select_geometry": None,
+    "relayout": None,
+    "updates": {},
+}
+EVENT_MODES = ("rerun", "store")
+# Figure versions whose `SelectionIndex` is kept, see `return_selection_index`.
+SELECTION_INDEX_VERSIONS = 8
+# Session State key of the states of all maps, by component key.
+STATE_KEY = "bi_comms_plotly_map"
+
+
+class MapState:
+    """Session state of the map of one component key."""
+
+    def __init__(self):
+        self.encoder = DeltaEncoder()
+        self.loader = ProgressiveLoader()
+        self.selection_indexes: "OrderedDict[int, SelectionIndex]" = OrderedDict()
+        self.trace_cache: Optional[TraceJSONCache] = None
+        self.payload: Optional[tuple] = None
+        self.payload_stats: Optional[dict] = None
+        self.rendered = 0
+
+
+def plotly_map(
+    update: FigureUpdate,
+    key: str,
+    click_event: bool = False,
+    select_event: bool = True,
+    hover_event: bool = False,
+    relayout_event: bool = True,
+    relayout_debounce_ms: int = 300,
+    relayout_mode: str = "rerun",
+    relayout_zoom_breaks: Sequence[float] = (),
+    select_mode: str = "rerun",
+    select_geometry_only: bool = False,
+    override_height: int = 500,
+    override_width: str = "100%",
+    binary: bool = True,
+    float32_coordinates: bool = True,
+    progressive: bool = False,
+    first_chunk_points: int = FIRST_CHUNK_POINTS,
+    chunk_points: int = CHUNK_POINTS,
+    trace_cache: Optional[TraceJSONCache] = None,
+) -> dict:
+    """Render the map, sending only the changes since the previous rerun.
+
+    Numeric arrays are sent as base64 typed arrays when `binary` is set, with
+    `lat` and `lon` as float32 when `float32_coordinates` is set. The size and
+    serialisation time of the payload are available via `return_payload_stats`.
+
+    Relayout events are reported once the map has been still for
+    `relayout_debounce_ms`. In `relayout_mode="store"` they are only stored in
+    the frontend, unless the zoom crosses one of `relayout_zoom_breaks` (e.g. a
+    zoom level where the figure changes from clusters to points). Likewise,
+    with `select_mode="store"` selections are only sent along with other events.
+
+    With `progressive`, figures of more than `first_chunk_points` points are
+    sent as a first chunk, followed by batches of `chunk_points` points, one per
+    rerun; see `return_loading_progress`. Figures built with
+    `FigureManager.build(..., first_points=first_chunk_points)` only build the
+    points of each batch when it is sent, and need `progressive`.
+
+    Serialised traces are kept in `trace_cache` when given (e.g. one shared by
+    all sessions via `st.experimental_singleton`), and in a cache per component
+    key in Streamlit Session State otherwise.
+
+    Returns the latest events as a dict with `click`, `select` and `hover` point
+    lists, the `relayout` data and an `event_id` that increments per event. With
+    `select_geometry_only`, `select` stays empty and `select_geometry` holds the
+    `lassoPoints` or `range` of the selection instead. As the latest events are
+    returned on every rerun, `updates` holds per event kind (e.g. `"click"`) the
+    `id` of its latest event, to handle each event once, and the version of the
+    figure it happened on (`ack`, see `return_selection_index`). `loading` is
+    set while the points of the figure are still being sent. `error` holds the
+    message of a full figure the frontend failed to draw (which is also shown),
+    as asking for the same figure again would fail again.
+    """
+    for name, mode in (("relayout_mode", relayout_mode), ("select_mode", select_mode)):
+        if mode not in EVENT_MODES:
+            raise ValueError(f"`{name}` has to be one of {EVENT_MODES}.")
+    state = _return_state(key)
+    encoder = state.encoder
+    loader = state.loader
+    loader.first_chunk_points = first_chunk_points
+    loader.chunk_points = chunk_points
+    if update.pending and not progressive:
+        raise ValueError("Figures with pending traces have to be loaded `progressive`.")
+    if not progressive:
+        loader.cancel()
+    elif loader.loading and update.changed:
+        encoder.request_full()  # the traces changed while loading, start over
+    elif update.pending and not loader.loading:
+        encoder.request_full()  # pending traces are only sent by the loader
+    if loader.loading and not encoder.needs_full(update):
+        message = encoder.encode_ops(*loader.next_ops())
+    elif progressive and encoder.needs_full(update) and loader.should_load(update):
+        message = encoder.encode(loader.start(update))
+    else:
+        loader.cancel()
+        message = encoder.encode(update)
+    if loader.loading:
+        message = dict(message, loading=True)
+    _keep_selection_index(state, message["version"], update.selection_index)
+    trace_keys = None
+    if update.trace_keys is not None:
+        trace_keys = {
+            id(trace): trace_key
+            for trace, trace_key in zip(update.figure["data"], update.trace_keys)
+        }
+    if trace_cache is None:
+        if state.trace_cache is None:
+            state.trace_cache = TraceJSONCache()
+        trace_cache = state.trace_cache
+    payload = _return_payload(
+        state, message, binary, float32_coordinates, trace_keys, trace_cache
+    )
+    value = _component_func(
+        message=payload,
+        click_event=click_event,
+        select_event=select_event,
+        hover_event=hover_event,
+        relayout_event=relayout_event,
+        relayout_debounce_ms=relayout_debounce_ms,
+        relayout_mode=relayout_mode,
+        relayout_zoom_breaks=list(relayout_zoom_breaks),
+        select_mode=select_mode,
+        select_geometry_only=select_geometry_only,
+        override_height=override_height,
+        override_width=override_width,
+        key=key,
+        default=None,
+    )
+    if encoder.acknowledge(value):
+        st.experimental_rerun()  # the frontend lost track, resend the full figure
+    events = dict(EMPTY_EVENTS)
+    if value:
+        events.update({k: value[k] for k in EMPTY_EVENTS if k in value})
+    events["loading"] = loader.loading
+    events["error"] = None
+    error = (value or {}).get("error")
+    if error and error.get("version") == encoder.version:
+        events["error"] = error.get("message")
+        st.error(f"The map could not draw the figure: {events['error']}")
+    return events
+
+
+def return_payload_stats(key: str) -> Optional[dict]:
+    """Version, size in bytes and serialisation time of the last message sent."""
+    state = _get_state(key)
+    return None if state is None else state.payload_stats
+
+
+def return_selection_index(
+    key: str, version: Optional[int]
+) -> Optional[SelectionIndex]:
+    """`SelectionIndex` of the figure sent as `version`, if it is still kept.
+
+    Pass the `ack` of an event in `updates`, to resolve the event against the
+    figure it happened on rather than the figure of the current rerun.
+    """
+    state = _get_state(key)
+    return None if state is None else state.selection_indexes.get(version)
+
+
+def return_loading_progress(key: str) -> Optional[tuple]:
+    """Points sent and points in total of a progressively loaded map."""
+    state = _get_state(key)
+    return None if state is None else state.loader.progress
+
+
+def _get_state(key: str) -> Optional[MapState]:
+    return st.session_state.get(STATE_KEY, {}).get(key)
+
+
+def _return_state(key: str) -> MapState:
+    """State of the map `key`, dropping the maps not rendered since its last render."""
+    if STATE_KEY not in st.session_state:
+        st.session_state[STATE_KEY] = {}
+    states = st.session_state[STATE_KEY]
+    rendered = max((other.rendered for other in states.values()), default=0) + 1
+    state = states.get(key)
+    if state is None:
+        state = states[key] = MapState()
+    else:
+        for other in [k for k, s in states.items() if s.rendered < state.rendered]:
+            del states[other]
+    state.rendered = rendered
+    return state
+
+
+def _return_payload(
+    state: MapState,
+    message: dict,
+    binary: bool,
+    float32_coordinates: bool,
+    trace_keys: Optional[dict] = None,
+    trace_cache: Optional[TraceJSONCache] = None,
+) -> str:
+    """Serialise the message, reusing the last payload if nothing changed."""
+    options = (message["version"], binary, float32_coordinates)
+    if state.payload is not None and state.payload[0] == options:
+        return state.payload[1]
+    start = time.perf_counter()
+    payload = dumps(
+        message,
+        binary=binary,
+        float32_coordinates=float32_coordinates,
+        trace_cache=trace_cache,
+        trace_keys=trace_keys,
+    )
+    state.payload = (options, payload)
+    state.payload_stats = {
+        "version": message["version"],
+        "full": "figure" in message,
+        "bytes": len(payload),
+        "seconds": time.perf_counter() - start,
+    }
+    return payload
+
+
+def _keep_selection_index(
+    state: MapState, version: int, selection_index: SelectionIndex
+) -> None:
+    """Keep the index of the last `SELECTION_INDEX_VERSIONS` figure versions."""
+    indexes = state.selection_indexes
+    indexes[version] = selection_index
+    indexes.move_to_end(version)
+    while len(indexes) > SELECTION_INDEX_VERSIONS:
+        indexes.popitem(last=False)
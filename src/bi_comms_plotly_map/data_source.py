@@ -0,0 +1,277 @@
+"""
+Columnar data sources for the map.
+
+Loading a dataset into pandas as a whole (e.g. `px.data.carshare()`, or
+`pd.read_parquet` of all columns) makes startup memory and time proportional to
+the file, not to what the map shows. A `DataSource` reads only the columns the
+map needs, and only the rows on the given routes and inside a given `Viewport`:
+
+* `FrameSource` wraps a frame that is already in memory.
+* `ParquetSource` opens a Parquet file memory-mapped, and skips whole row groups
+  whose min/max statistics rule out the routes and bounds, before reading.
+* `ArrowSource` opens an Arrow IPC (Feather v2) file memory-mapped, so the
+  projected columns are read without copying.
+
+`pyarrow` is only needed for the Arrow and Parquet sources.
+"""
+
+from abc import ABC, abstractmethod
+from typing import Hashable, Iterable, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from .viewport import Viewport
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:  # optional, only needed for Arrow/Parquet sources
+    pa = pc = pq = None
+
+
+class DataSource(ABC):
+    """Point data with coordinates in `lat_col` and `lon_col`, read on demand.
+
+    `read` returns the `columns` (all if none are given) of the rows on `routes`
+    and inside `bbox`, as a frame with a fresh range index. Subclasses implement
+    `columns`, `n_rows` and `read`.
+    """
+
+    def __init__(self, lat_col: str, lon_col: str, route_col: Optional[str] = None):
+        self.lat_col = lat_col
+        self.lon_col = lon_col
+        self.route_col = route_col
+
+    @property
+    @abstractmethod
+    def columns(self) -> List[str]:
+        pass
+
+    @property
+    @abstractmethod
+    def n_rows(self) -> int:
+        pass
+
+    @abstractmethod
+    def read(
+        self,
+        columns: Optional[Sequence[str]] = None,
+        routes: Optional[Iterable[Hashable]] = None,
+        bbox: Optional[Viewport] = None,
+    ) -> pd.DataFrame:
+        pass
+
+    def _needed_columns(
+        self,
+        columns: Sequence[str],
+        routes: Optional[list],
+        bbox: Optional[Viewport],
+    ) -> List[str]:
+        """The requested columns plus the columns needed to filter on."""
+        needed = list(columns)
+        if routes is not None:
+            if self.route_col is None:
+                raise ValueError("Filtering on routes needs a `route_col`.")
+            needed.append(self.route_col)
+        if bbox is not None:
+            needed.extend([self.lat_col, self.lon_col])
+        return list(dict.fromkeys(needed))
+
+
+class FrameSource(DataSource):
+    """A data source over a pandas frame in memory."""
+
+    def __init__(
+        self,
+        data: pd.DataFrame,
+        lat_col: str,
+        lon_col: str,
+        route_col: Optional[str] = None,
+    ):
+        super().__init__(lat_col, lon_col, route_col)
+        self.data = data
+
+    @property
+    def columns(self) -> List[str]:
+        return list(self.data.columns)
+
+    @property
+    def n_rows(self) -> int:
+        return self.data.shape[0]
+
+    def read(
+        self,
+        columns: Optional[Sequence[str]] = None,
+        routes: Optional[Iterable[Hashable]] = None,
+        bbox: Optional[Viewport] = None,
+    ) -> pd.DataFrame:
+        columns = self.columns if columns is None else list(columns)
+        routes = None if routes is None else list(routes)
+        self._needed_columns(columns, routes, bbox)  # checks the filters
+        mask = np.ones(self.data.shape[0], dtype=bool)
+        if routes is not None:
+            mask &= self.data[self.route_col].isin(routes).to_numpy()
+        if bbox is not None:
+            mask &= bbox.contains(
+                self.data[self.lat_col].to_numpy(), self.data[self.lon_col].to_numpy()
+            )
+        return self.data.loc[mask, columns].reset_index(drop=True)
+
+
+class ArrowDataSource(DataSource):
+    """Shared filtering of the Arrow based sources."""
+
+    def __init__(
+        self, path: str, lat_col: str, lon_col: str, route_col: Optional[str] = None
+    ):
+        if pa is None:
+            raise ImportError("Arrow and Parquet data sources need `pyarrow`.")
+        super().__init__(lat_col, lon_col, route_col)
+        self.path = path
+
+    def _filter_table(
+        self,
+        table: "pa.Table",
+        columns: Sequence[str],
+        routes: Optional[list],
+        bbox: Optional[Viewport],
+    ) -> pd.DataFrame:
+        """Filter rows of `table` exactly, and convert `columns` to pandas."""
+        mask = None
+        if routes is not None:
+            column = table[self.route_col]
+            value_type = column.type
+            if pa.types.is_dictionary(value_type):
+                value_type = value_type.value_type
+            value_set = pa.array(routes, type=value_type)
+            mask = pc.is_in(column, value_set=value_set)
+        if bbox is not None:
+            lat, lon = table[self.lat_col], table[self.lon_col]
+            inside = pc.and_(
+                pc.and_(
+                    pc.greater_equal(lat, bbox.min_lat),
+                    pc.less_equal(lat, bbox.max_lat),
+                ),
+                pc.and_(
+                    pc.greater_equal(lon, bbox.min_lon),
+                    pc.less_equal(lon, bbox.max_lon),
+                ),
+            )
+            mask = inside if mask is None else pc.and_(mask, inside)
+        if mask is not None:
+            table = table.filter(mask)
+        return table.select(list(columns)).to_pandas()
+
+
+class ParquetSource(ArrowDataSource):
+    """A memory-mapped Parquet file, pruned by row group statistics.
+
+    Row groups are skipped when their min/max statistics show that none of
+    their rows are on the requested routes or inside the bounds, so sorting the
+    file by route (or by a spatial key) makes filters cheap.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        lat_col: str,
+        lon_col: str,
+        route_col: Optional[str] = None,
+        memory_map: bool = True,
+    ):
+        super().__init__(path, lat_col, lon_col, route_col)
+        self.file = pq.ParquetFile(path, memory_map=memory_map)
+        self._column_index = {
+            name: i for i, name in enumerate(self.file.metadata.schema.names)
+        }
+
+    @property
+    def columns(self) -> List[str]:
+        return list(self.file.schema_arrow.names)
+
+    @property
+    def n_rows(self) -> int:
+        return self.file.metadata.num_rows
+
+    def row_groups(
+        self,
+        routes: Optional[Iterable[Hashable]] = None,
+        bbox: Optional[Viewport] = None,
+    ) -> List[int]:
+        """Row groups that may hold rows on `routes` and inside `bbox`."""
+        metadata = self.file.metadata
+        routes = None if routes is None else list(routes)
+        self._needed_columns([], routes, bbox)  # checks the filters
+        kept = []
+        for i in range(metadata.num_row_groups):
+            group = metadata.row_group(i)
+            if routes is not None and not any(
+                self._may_contain(group, self.route_col, route, route)
+                for route in routes
+            ):
+                continue
+            if bbox is not None and not (
+                self._may_contain(group, self.lat_col, bbox.min_lat, bbox.max_lat)
+                and self._may_contain(group, self.lon_col, bbox.min_lon, bbox.max_lon)
+            ):
+                continue
+            kept.append(i)
+        return kept
+
+    def read(
+        self,
+        columns: Optional[Sequence[str]] = None,
+        routes: Optional[Iterable[Hashable]] = None,
+        bbox: Optional[Viewport] = None,
+    ) -> pd.DataFrame:
+        columns = self.columns if columns is None else list(columns)
+        routes = None if routes is None else list(routes)
+        needed = self._needed_columns(columns, routes, bbox)
+        table = self.file.read_row_groups(self.row_groups(routes, bbox), columns=needed)
+        return self._filter_table(table, columns, routes, bbox)
+
+    def _may_contain(self, group, column: str, low, high) -> bool:
+        """Whether the statistics of `column` in a row group overlap [low, high]."""
+        statistics = group.column(self._column_index[column]).statistics
+        if statistics is None or not statistics.has_min_max:
+            return True
+        return not (statistics.max < low or statistics.min > high)
+
+
+class ArrowSource(ArrowDataSource):
+    """A memory-mapped Arrow IPC (Feather v2) file.
+
+    Columns are read straight from the mapped file, without copying; the rows
+    are filtered after reading, as IPC files have no statistics.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        lat_col: str,
+        lon_col: str,
+        route_col: Optional[str] = None,
+    ):
+        super().__init__(path, lat_col, lon_col, route_col)
+        self.table = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+
+    @property
+    def columns(self) -> List[str]:
+        return list(self.table.column_names)
+
+    @property
+    def n_rows(self) -> int:
+        return self.table.num_rows
+
+    def read(
+        self,
+        columns: Optional[Sequence[str]] = None,
+        routes: Optional[Iterable[Hashable]] = None,
+        bbox: Optional[Viewport] = None,
+    ) -> pd.DataFrame:
+        columns = self.columns if columns is None else list(columns)
+        routes = None if routes is None else list(routes)
+        table = self.table.select(self._needed_columns(columns, routes, bbox))
+        return self._filter_table(table, columns, routes, bbox)
@@ -0,0 +1,197 @@
+"""
+Binary typed-array encoding of numeric arrays sent to the map frontend.
+
+Numeric numpy arrays are sent as `{"dtype": "f4", "bdata": "<base64>"}` objects,
+following plotly.js' typed-array specification, instead of JSON lists of
+decimal floats. The frontend decodes them into JS typed arrays. Coordinates can
+optionally be sent as float32, which keeps roughly a metre of precision.
+
+Messages are serialised with `orjson` when it is installed (it serialises NumPy
+arrays natively), and with `json` and plotly's encoder otherwise. A
+`TraceJSONCache` keeps the serialised JSON of traces by their `FigureUpdate`
+trace key, so unchanged traces are not serialised again in full messages. As
+trace keys identify the contents of the traces, one cache can be shared by all
+sessions.
+"""
+
+import base64
+import json
+import re
+import time
+from typing import Any, Callable, Dict, Hashable, Optional
+
+import numpy as np
+from plotly.utils import PlotlyJSONEncoder
+
+from .cache import LRUCache
+
+try:
+    import orjson
+except ImportError:  # optional, `json` is used instead
+    orjson = None
+
+COORDINATE_KEYS = {"lat", "lon"}
+
+# numpy dtypes with a matching JS typed array, little-endian as in the browser.
+TYPED_ARRAY_DTYPES = {
+    np.dtype("int8"): "i1",
+    np.dtype("uint8"): "u1",
+    np.dtype("int16"): "i2",
+    np.dtype("uint16"): "u2",
+    np.dtype("int32"): "i4",
+    np.dtype("uint32"): "u4",
+    np.dtype("float32"): "f4",
+    np.dtype("float64"): "f8",
+}
+
+INT32_MIN = np.iinfo(np.int32).min
+INT32_MAX = np.iinfo(np.int32).max
+
+TRACE_JSON_CACHE_BYTES = 32 * 1024**2
+TRACE_PLACEHOLDER = "__bi_comms_trace_{}__"
+TRACE_PLACEHOLDER_PATTERN = re.compile(r'"__bi_comms_trace_(\d+)__"')
+
+
+def encode_array(values: np.ndarray, float32: bool = False) -> Optional[dict]:
+    """Encode a numeric array as a typed-array spec, or `None` if not numeric."""
+    if values.dtype.kind not in "iuf" or values.size == 0:
+        return None
+    if values.dtype.kind == "f" and float32:
+        values = values.astype(np.float32)
+    elif values.dtype.kind in "iu" and values.dtype not in TYPED_ARRAY_DTYPES:
+        # 64 bit integers have no JS typed array.
+        if INT32_MIN <= values.min() and values.max() <= INT32_MAX:
+            values = values.astype(np.int32)
+        else:
+            values = values.astype(np.float64)
+    spec = {
+        "dtype": TYPED_ARRAY_DTYPES[values.dtype],
+        "bdata": base64.b64encode(
+            np.ascontiguousarray(values, dtype=values.dtype.newbyteorder("<"))
+        ).decode("ascii"),
+    }
+    if values.ndim > 1:
+        spec["shape"] = ",".join(str(n) for n in values.shape)
+    return spec
+
+
+def encode_typed_arrays(
+    obj: Any, float32_coordinates: bool = True, key: Optional[str] = None
+) -> Any:
+    """Replace the numeric arrays in a (nested) message with typed-array specs."""
+    if isinstance(obj, np.ndarray):
+        float32 = float32_coordinates and key in COORDINATE_KEYS
+        spec = encode_array(obj, float32=float32)
+        return obj if spec is None else spec
+    if isinstance(obj, dict):
+        return {
+            k: encode_typed_arrays(v, float32_coordinates, k) for k, v in obj.items()
+        }
+    if isinstance(obj, (list, tuple)):
+        return [encode_typed_arrays(v, float32_coordinates, key) for v in obj]
+    return obj
+
+
+def to_json(obj: Any) -> str:
+    """Serialise to a JSON string, with `orjson` when it is installed."""
+    if orjson is None:
+        return json.dumps(obj, cls=PlotlyJSONEncoder)
+    return orjson.dumps(
+        obj, default=_orjson_default, option=orjson.OPT_SERIALIZE_NUMPY
+    ).decode("utf-8")
+
+
+def _orjson_default(obj: Any) -> Any:
+    # Arrays orjson does not serialise itself, e.g. object arrays of strings.
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    return PlotlyJSONEncoder().default(obj)
+
+
+class TraceJSONCache:
+    """Serialised JSON of traces, under their `FigureUpdate` trace key."""
+
+    def __init__(self, max_bytes: int = TRACE_JSON_CACHE_BYTES):
+        self._cache = LRUCache(max_bytes, sizeof=len)
+
+    @property
+    def stats(self) -> dict:
+        return self._cache.stats
+
+    def trace_json(
+        self, key: Hashable, trace: dict, binary: bool, float32_coordinates: bool
+    ) -> str:
+        return self._cache.get_or_build(
+            (key, binary, float32_coordinates),
+            lambda: to_json(
+                encode_typed_arrays(trace, float32_coordinates) if binary else trace
+            ),
+        )
+
+
+def dumps(
+    message: dict,
+    binary: bool = True,
+    float32_coordinates: bool = True,
+    trace_cache: Optional[TraceJSONCache] = None,
+    trace_keys: Optional[Dict[int, Hashable]] = None,
+) -> str:
+    """Serialise a message to a JSON string, with numeric arrays as typed arrays.
+
+    With a `trace_cache`, the traces of the message found in `trace_keys` (trace
+    keys by `id` of the trace dict) are taken from, or added to, the cache.
+    """
+    fragments = []
+    if trace_cache is not None and trace_keys:
+
+        def cached(trace: dict) -> Any:
+            key = trace_keys.get(id(trace))
+            if key is None:
+                return trace
+            placeholder = TRACE_PLACEHOLDER.format(len(fragments))
+            fragments.append(
+                trace_cache.trace_json(key, trace, binary, float32_coordinates)
+            )
+            return placeholder
+
+        message = _map_traces(message, cached)
+    if binary:
+        message = encode_typed_arrays(message, float32_coordinates)
+    payload = to_json(message)
+    if fragments:
+        payload = TRACE_PLACEHOLDER_PATTERN.sub(
+            lambda match: fragments[int(match.group(1))], payload
+        )
+    return payload
+
+
+def _map_traces(message: dict, func: Callable[[dict], Any]) -> dict:
+    """Copy of a protocol message with `func` applied to its whole traces."""
+    message = dict(message)
+    if "figure" in message:
+        figure = message["figure"]
+        message["figure"] = dict(figure, data=[func(t) for t in figure["data"]])
+    if "ops" in message:
+        message["ops"] = [
+            dict(op, trace=func(op["trace"])) if "trace" in op else op
+            for op in message["ops"]
+        ]
+    return message
+
+
+def payload_stats(message: dict, **kwargs) -> dict:
+    """Size in bytes and serialisation time in seconds of a message."""
+    start = time.perf_counter()
+    payload = dumps(message, **kwargs)
+    return {"bytes": len(payload), "seconds": time.perf_counter() - start}
+
+
+def payload_report(message: dict) -> dict:
+    """Compare the plain JSON, typed-array and float32 typed-array payloads."""
+    return {
+        "json": payload_stats(message, binary=False),
+        "binary": payload_stats(message, binary=True, float32_coordinates=False),
+        "binary_float32": payload_stats(message, binary=True, float32_coordinates=True),
+    }
@@ -0,0 +1,780 @@
+"""
+Incremental building of the plotly map figure.
+
+Building the map with `px.scatter_mapbox` on every streamlit rerun regroups and
+revalidates the full data, even when only the "Selected" overlay changed. The
+`FigureManager` caches the traces per route, keyed by the data version and a
+per-route version, and only rebuilds the traces whose inputs changed. Traces are
+kept in a size-bounded `LRUCache`, so switching back to an earlier route filter,
+map view or mode reuses the traces built for it. Unless given, its size is
+derived from the data, to hold the traces of `TRACE_CACHE_FIGURES` figures of
+all points. Cache keys only depend on the
+contents of the traces (route versions are fingerprints of the route rows), so
+one cache can be shared by the managers of all sessions. Each
+build returns a `FigureUpdate` with the figure and the traces that changed
+since the previous build.
+
+Given a `Viewport`, traces only contain the points inside it. With a
+`GridIndex`, the points in view are looked up in the index instead of comparing
+the coordinates of every route. With a `ClusterPyramid`, zoom levels below
+`cluster_below_zoom` show a single trace of cluster bubbles instead of the routes.
+In density mode, the points are drawn as a server-side raster image layer.
+
+With `selection_highlight="selectedpoints"`, selected rows are not drawn as an
+overlay trace but styled in their route trace via plotly's `selectedpoints`, the
+same styling plotly applies in the browser while selecting. The frontend then
+highlights a selection immediately, before python has seen it.
+
+With `point_order="stratified"`, the points of every route trace are ordered so
+that any first part of them is a spatially stratified sample, e.g. to load the
+figure progressively (see `progressive.ProgressiveLoader`). Given `first_points`,
+a build only builds the first points of the route traces that are not cached,
+and returns a `PendingTrace` per such trace to build the others on demand, so
+the first chunk of a progressively loaded figure is sent without building the
+full figure first. Completed traces are kept by the manager while they are
+shown, as the trace cache may not hold them, so later builds do not start over.
+
+With `validate=False`, traces are assembled as plain dicts straight from the
+NumPy arrays, skipping the property validation of `plotly.graph_objs`. The
+traces are built from known-good properties, so this only saves time.
+"""
+
+import math
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objs as go
+
+from .cache import LRUCache, nbytes
+from .clustering import ClusterPyramid
+from .raster import RASTER_WIDTH_PX, density_layer
+from .route_index import RouteIndex
+from .selection_index import SelectionIndex, group_positions
+from .spatial_index import STRATIFIED_SAMPLE_POINTS, GridIndex, stratified_order
+from .viewport import Viewport
+
+SELECTED_TRACE_NAME = "Selected"
+SELECTED_MARKER = {"size": 10, "color": "rgb(242, 0, 0)", "opacity": 1}
+UNSELECTED_MARKER = {"opacity": 0.5}
+SELECTION_HIGHLIGHTS = ("overlay", "selectedpoints")
+POINT_ORDERS = ("rows", "stratified")
+CLUSTER_TRACE_NAME = "Clusters"
+CLUSTER_MARKER = {"color": "rgb(99, 110, 250)", "opacity": 0.6, "sizemin": 4}
+CLUSTER_SIZE_MAX = 40
+DENSITY_TRACE_NAME = "Density"
+MAP_STYLE = "carto-positron"
+TRACE_CACHE_BYTES = 64 * 1024**2
+TRACE_CACHE_FIGURES = 2
+# Rows of the trace measured by `FigureManager.figure_nbytes`.
+FIGURE_NBYTES_SAMPLE = 1000
+
+
+class FigureUpdate:
+    """Result of a `FigureManager.build`.
+
+    `figure` is a plotly figure dict, `changed_traces` the positions of traces
+    that differ from the previous build, and `full` is `True` when the trace
+    layout (number or order of traces) changed, so the figure has to be resent
+    as a whole. `trace_keys` identify the contents of each trace, e.g. to cache
+    their serialised form (`None` for pending traces). `pending` holds the
+    `PendingTrace`s, by trace position, of which the figure only holds the first
+    points.
+    """
+
+    def __init__(
+        self,
+        figure: dict,
+        changed_traces: List[int],
+        full: bool,
+        selection_index: SelectionIndex,
+        trace_keys: Optional[List[tuple]] = None,
+        pending: Optional[Dict[int, "PendingTrace"]] = None,
+    ):
+        self.figure = figure
+        self.changed_traces = changed_traces
+        self.full = full
+        self.selection_index = selection_index
+        self.trace_keys = trace_keys
+        self.pending = pending or {}
+
+    @property
+    def changed(self) -> bool:
+        return self.full or bool(self.changed_traces)
+
+    def to_figure(self) -> go.Figure:
+        """Wrap the figure dict as a `go.Figure`, without revalidating the traces."""
+        return go.Figure(self.figure, _validate=False)
+
+
+class PendingTrace:
+    """A route trace of which only the first points are built.
+
+    `points` builds the trace of a range of the points, and `complete` stores the
+    full trace, once assembled from those ranges, in `completed` (the traces the
+    manager keeps while they are shown) and in the trace cache.
+    """
+
+    def __init__(
+        self,
+        positions: np.ndarray,
+        build: Callable[[np.ndarray], dict],
+        cache: LRUCache,
+        key: tuple,
+        head_key: tuple,
+        completed: Dict[tuple, tuple],
+    ):
+        self.positions = positions
+        self._build = build
+        self._cache = cache
+        self._key = key
+        self._head_key = head_key
+        self._completed = completed
+
+    @property
+    def n_points(self) -> int:
+        return self.positions.shape[0]
+
+    def points(self, start: int, stop: int) -> dict:
+        """Trace of the points from `start` up to `stop`."""
+        return self._build(self.positions[start:stop])
+
+    def complete(self, trace: dict) -> None:
+        """Keep the full `trace`, so later builds return it."""
+        trace = {k: v for k, v in trace.items() if k != "selectedpoints"}
+        self._completed[self._key] = (trace, self.positions)
+        self._cache.put(self._key, (trace, self.positions))
+        self._cache.pop(self._head_key)
+
+
+class FigureManager:
+    """Builds a scatter map figure, with one trace per route, incrementally.
+
+    Routes are ordered by name and keep their colour between builds, so route
+    filters and route edits do not reshuffle the legend. Selecting a cluster
+    bubble, by clicking it or by an outline around its centroid, selects all its
+    rows, via the returned `SelectionIndex`.
+
+    In density mode (`build(..., density=True)`) the map holds a single empty
+    "Density" trace, so the selection tools stay available, and the points are
+    drawn as an image layer of `raster_width_px` pixels wide.
+
+    Traces are cached in `trace_cache` when given, e.g. an `LRUCache` shared by
+    the managers (with the same settings) of all sessions, and in a cache of
+    `trace_cache_bytes` of this manager otherwise. Without `trace_cache_bytes`,
+    the cache holds `TRACE_CACHE_FIGURES` times the `figure_nbytes` of the data,
+    and at least `TRACE_CACHE_BYTES`. A shared cache requires the `data_version`
+    to identify the data in all sessions.
+    """
+
+    def __init__(
+        self,
+        lat_col: str,
+        lon_col: str,
+        color_col: str,
+        size_col: Optional[str] = None,
+        hover_name: Optional[str] = None,
+        hover_data: Sequence[str] = (),
+        color_sequence: Sequence[str] = px.colors.qualitative.Plotly,
+        size_max: int = 15,
+        height: int = 500,
+        cluster_below_zoom: Optional[float] = None,
+        raster_width_px: int = RASTER_WIDTH_PX,
+        selection_highlight: str = "overlay",
+        trace_cache_bytes: Optional[int] = None,
+        trace_cache: Optional[LRUCache] = None,
+        validate: bool = True,
+        point_order: str = "rows",
+    ):
+        if selection_highlight not in SELECTION_HIGHLIGHTS:
+            raise ValueError(
+                f"`selection_highlight` has to be one of {SELECTION_HIGHLIGHTS}."
+            )
+        if point_order not in POINT_ORDERS:
+            raise ValueError(f"`point_order` has to be one of {POINT_ORDERS}.")
+        self.lat_col = lat_col
+        self.lon_col = lon_col
+        self.color_col = color_col
+        self.size_col = size_col
+        self.hover_name = hover_name
+        self.hover_data = list(hover_data)
+        self.color_sequence = list(color_sequence)
+        self.size_max = size_max
+        self.height = height
+        self.cluster_below_zoom = cluster_below_zoom
+        self.raster_width_px = raster_width_px
+        self.selection_highlight = selection_highlight
+        self.validate = validate
+        self.point_order = point_order
+
+        self.data: Optional[pd.DataFrame] = None
+        self.data_version: Optional[Hashable] = None
+        self._routes: Dict[Hashable, np.ndarray] = {}
+        self._route_colors: Dict[Hashable, str] = {}
+        self._route_versions: Dict[Hashable, tuple] = {}
+        self._shared_cache = trace_cache is not None
+        self._trace_cache_bytes = trace_cache_bytes
+        if trace_cache is None:
+            trace_cache = LRUCache(trace_cache_bytes or TRACE_CACHE_BYTES)
+        self._trace_cache = trace_cache
+        self._default_center: Optional[dict] = None
+        self._sizeref: Optional[float] = None
+        self._lat: Optional[np.ndarray] = None
+        self._lon: Optional[np.ndarray] = None
+        self._codes: Optional[np.ndarray] = None
+        self._route_codes: Dict[Hashable, int] = {}
+        self.route_index: Optional[RouteIndex] = None
+        self.spatial_index: Optional[GridIndex] = None
+        self.cluster_pyramid: Optional[ClusterPyramid] = None
+        self._visible: Optional[Tuple[tuple, np.ndarray]] = None
+        self._last_keys: List[tuple] = []
+        self._completed: Dict[tuple, tuple] = {}
+
+    def set_data(
+        self,
+        data: pd.DataFrame,
+        data_version: Hashable,
+        spatial_index: Optional[GridIndex] = None,
+        cluster_pyramid: Optional[ClusterPyramid] = None,
+        route_index: Optional[RouteIndex] = None,
+    ) -> None:
+        """Set the base data. A new `data_version` invalidates all cached traces.
+
+        A new frame with the same `data_version`, such as a `DataOverlay.view`
+        with other rows selected, is swapped in without invalidating any traces;
+        call `update_routes` when its routes changed. `spatial_index` and
+        `cluster_pyramid` have to be built over the coordinates of `data`. With
+        a `route_index` (e.g. `DataOverlay.route_index`), routes are read from the
+        index instead of being regrouped from the `color_col` column.
+        """
+        self.spatial_index = spatial_index
+        self.cluster_pyramid = cluster_pyramid
+        self.route_index = route_index
+        if data_version == self.data_version:
+            self.data = data
+            return
+        self.data = data
+        self.data_version = data_version
+        self._visible = None
+        if not self._shared_cache:
+            self._trace_cache.clear()
+        self._route_versions = {}
+        self._route_colors = {}
+        self._completed.clear()
+        self._default_center = None
+        self._sizeref = None
+        self._lat = data[self.lat_col].to_numpy()
+        self._lon = data[self.lon_col].to_numpy()
+        if self.size_col is not None:
+            max_size = data[self.size_col].max()
+            self._sizeref = 2.0 * max_size / self.size_max**2 if max_size else 1.0
+        self._regroup()
+        if not self._shared_cache and self._trace_cache_bytes is None:
+            self._trace_cache.max_bytes = max(
+                TRACE_CACHE_BYTES, TRACE_CACHE_FIGURES * self.figure_nbytes
+            )
+
+    def update_routes(self, routes: Iterable[Hashable] = ()) -> None:
+        """Mark `routes` as changed after their rows were edited in place.
+
+        Routes that gained or lost rows are detected and marked as well. Only
+        the traces of marked routes are rebuilt on the next `build`. The version
+        of a marked route is a fingerprint of its rows, so sessions that made the
+        same edits share their traces.
+        """
+        previous = {route: p.shape[0] for route, p in self._routes.items()}
+        self._regroup()
+        changed = set(routes)
+        changed.update(
+            route
+            for route, positions in self._routes.items()
+            if previous.get(route) != positions.shape[0]
+        )
+        for route in changed:
+            self._route_versions[route] = _array_key(self.route_positions(route))
+
+    @property
+    def default_center(self) -> dict:
+        """Median location of the data, computed once per data version.
+
+        Points without coordinates (NaN) are left out.
+        """
+        if self._default_center is None:
+            if np.isnan(self._lat).all() or np.isnan(self._lon).all():
+                return {"lat": 0.0, "lon": 0.0}
+            self._default_center = {
+                "lat": float(np.nanmedian(self._lat)),
+                "lon": float(np.nanmedian(self._lon)),
+            }
+        return self._default_center
+
+    @property
+    def figure_nbytes(self) -> int:
+        """Estimated bytes of the cached route traces of all rows of the data.
+
+        Measured on the trace of a sample of `FIGURE_NBYTES_SAMPLE` rows.
+        """
+        n_rows = self.data.shape[0]
+        if n_rows == 0 or not self._routes:
+            return 0
+        step = max(n_rows // FIGURE_NBYTES_SAMPLE, 1)
+        positions = np.arange(0, n_rows, step)[:FIGURE_NBYTES_SAMPLE]
+        sample = (self._route_trace(next(iter(self._routes)), positions), positions)
+        return int(nbytes(sample) * n_rows / positions.shape[0])
+
+    @property
+    def routes(self) -> List[Hashable]:
+        return list(self._routes)
+
+    def route_positions(self, route: Hashable) -> np.ndarray:
+        """Row positions of a route in the base data."""
+        return self._routes.get(route, np.empty(0, dtype=np.int64))
+
+    def build(
+        self,
+        selected: Optional[np.ndarray] = None,
+        route_filters: Optional[Iterable[Hashable]] = None,
+        center: Optional[dict] = None,
+        zoom: float = 11,
+        viewport: Optional[Viewport] = None,
+        density: bool = False,
+        first_points: Optional[int] = None,
+    ) -> FigureUpdate:
+        """Build the figure, reusing cached traces whose inputs did not change.
+
+        `selected` are the row positions shown in the "Selected" overlay. With a
+        `viewport` (see `ViewportCuller`), only the points inside it are included.
+        With `density`, the points are drawn as a raster over the viewport (or
+        the whole data when there is none).
+
+        With `first_points`, and more route points than that, route traces that
+        are not cached only hold their share of `first_points`, and are returned
+        as `FigureUpdate.pending`.
+        """
+        if self.data is None:
+            raise ValueError("No data set, call `set_data` first.")
+        routes = self._filter_routes(route_filters)
+        selection_index = SelectionIndex(
+            self.data.shape[0],
+            lat=self._lat,
+            lon=self._lon,
+            spatial_index=self.spatial_index,
+        )
+        viewport_key = None if viewport is None else viewport.key
+
+        traces, keys, layers = [], [], []
+        if density:
+            key = (
+                self.data_version,
+                DENSITY_TRACE_NAME,
+                tuple(routes) if route_filters else None,
+                tuple(self._route_versions.get(route, 0) for route in routes)
+                if route_filters
+                else None,
+                viewport_key,
+            )
+            layer, rows = self._trace_cache.get_or_build(
+                key,
+                lambda: self._build_density_layer(
+                    routes if route_filters else None, viewport
+                ),
+            )
+            traces.append(self._build_density_trace())
+            keys.append(key)
+            layers.append(layer)
+            selection_index.add_trace(np.empty(0, dtype=np.int64))
+            selection_index.add_area(rows)
+        elif self._show_clusters(zoom):
+            level = self.cluster_pyramid.level(zoom).zoom
+            key = (
+                self.data_version,
+                CLUSTER_TRACE_NAME,
+                level,
+                tuple(routes) if route_filters else None,
+                tuple(self._route_versions.get(route, 0) for route in routes)
+                if route_filters
+                else None,
+                viewport_key,
+            )
+            trace, rows, offsets = self._trace_cache.get_or_build(
+                key,
+                lambda: self._build_cluster_trace(
+                    zoom, routes if route_filters else None, viewport
+                ),
+            )
+            traces.append(trace)
+            keys.append(key)
+            selection_index.add_trace(
+                rows, offsets=offsets, lat=trace["lat"], lon=trace["lon"]
+            )
+
+        highlight_points = self.selection_highlight == "selectedpoints" and not traces
+        selected_mask = None
+        if highlight_points and selected is not None and len(selected):
+            selected_mask = np.zeros(self.data.shape[0], dtype=bool)
+            selected_mask[np.asarray(selected, dtype=np.int64)] = True
+
+        head_sizes = {}
+        if first_points is not None and not traces:
+            head_sizes = self._head_sizes(routes, viewport, first_points)
+        trace_keys, pending, shown = list(keys), {}, set()
+        for route in routes if not traces else []:
+            key = self._route_key(route, viewport_key)
+            shown.add(("route",) + key)
+            if ("route",) + key in self._completed:
+                trace, positions = self._completed[("route",) + key]
+            elif route in head_sizes:
+                head_key = ("route_head",) + key + (head_sizes[route],)
+                trace, positions = self._trace_cache.get_or_build(
+                    head_key,
+                    lambda: self._build_route_head(
+                        route,
+                        self._route_in_viewport(route, viewport),
+                        head_sizes[route],
+                    ),
+                )
+                pending[len(traces)] = PendingTrace(
+                    positions,
+                    lambda positions, route=route: self._route_trace(route, positions),
+                    self._trace_cache,
+                    ("route",) + key,
+                    head_key,
+                    self._completed,
+                )
+            else:
+                trace, positions = self._trace_cache.get_or_build(
+                    ("route",) + key,
+                    lambda: self._build_route_trace(
+                        route, self._route_in_viewport(route, viewport)
+                    ),
+                )
+            if highlight_points:
+                points = None
+                if selected_mask is not None:
+                    points = np.flatnonzero(selected_mask[positions])
+                    key = key + (_array_key(points),)
+                    points = points.tolist()
+                trace = dict(trace, selectedpoints=points)
+            traces.append(trace)
+            keys.append(key)
+            trace_keys.append(None if route in head_sizes else key)
+            selection_index.add_trace(positions)
+        # Only the completed traces of the figure shown are kept.
+        for key in set(self._completed) - shown:
+            del self._completed[key]
+
+        if not highlight_points:
+            overlay = self._selected_in_routes(selected, routes, route_filters)
+            overlay = self._in_viewport(overlay, viewport)
+            overlay_key = (
+                self.data_version,
+                SELECTED_TRACE_NAME,
+                _array_key(overlay),
+            )
+            traces.append(
+                self._trace_cache.get_or_build(
+                    overlay_key, lambda: self._build_selected_trace(overlay)
+                )
+            )
+            keys.append(overlay_key)
+            trace_keys.append(overlay_key)
+
+        full = [k[1] for k in keys] != [k[1] for k in self._last_keys]
+        changed_traces = [
+            i
+            for i, key in enumerate(keys)
+            if full or i >= len(self._last_keys) or self._last_keys[i] != key
+        ]
+        self._last_keys = keys
+        figure = {"data": traces, "layout": self._build_layout(center, zoom, layers)}
+        return FigureUpdate(
+            figure, changed_traces, full, selection_index, trace_keys, pending
+        )
+
+    @property
+    def cache_stats(self) -> dict:
+        """Entries, bytes, hits, misses and evictions of the (shared) trace cache."""
+        return self._trace_cache.stats
+
+    def _show_clusters(self, zoom: float) -> bool:
+        return (
+            self.cluster_pyramid is not None
+            and self.cluster_below_zoom is not None
+            and zoom < self.cluster_below_zoom
+        )
+
+    def _regroup(self) -> None:
+        if self.route_index is not None:
+            index = self.route_index
+            self._routes = {route: index.positions(route) for route in index.routes}
+            self._codes = index.codes
+            self._route_codes = {route: index.code(route) for route in self._routes}
+        else:
+            values = self.data[self.color_col]
+            positions = {values.iat[p[0]]: p for p in group_positions(values) if p.size}
+            self._routes = {
+                route: positions[route] for route in sorted(positions, key=str)
+            }
+            self._codes = np.full(values.shape[0], -1, dtype=np.int64)
+            self._route_codes = {}
+            for code, (route, route_positions) in enumerate(self._routes.items()):
+                self._codes[route_positions] = code
+                self._route_codes[route] = code
+        for route in self._routes:
+            if route not in self._route_colors:
+                self._route_colors[route] = self.color_sequence[
+                    len(self._route_colors) % len(self.color_sequence)
+                ]
+
+    def _route_key(self, route: Hashable, viewport_key: Optional[tuple]) -> tuple:
+        return (
+            self.data_version,
+            route,
+            self._route_versions.get(route, 0),
+            viewport_key,
+            self._route_colors[route],
+        )
+
+    def _head_sizes(
+        self, routes: list, viewport: Optional[Viewport], first_points: int
+    ) -> Dict[Hashable, int]:
+        """Points to build first per route whose trace is not cached.
+
+        Routes share `first_points` in proportion to their number of points, and
+        are built in full when they have no more than `first_points` in total.
+        """
+        viewport_key = None if viewport is None else viewport.key
+        uncached = []
+        for route in routes:
+            key = ("route",) + self._route_key(route, viewport_key)
+            if key not in self._completed and key not in self._trace_cache:
+                uncached.append(route)
+        if not uncached:
+            return {}
+        sizes = {
+            route: self._route_in_viewport(route, viewport).shape[0] for route in routes
+        }
+        total = sum(sizes.values())
+        if total <= first_points:
+            return {}
+        return {
+            route: math.ceil(sizes[route] * first_points / total) for route in uncached
+        }
+
+    def _filter_routes(self, route_filters: Optional[Iterable[Hashable]]) -> list:
+        if not route_filters:
+            return list(self._routes)
+        route_filters = set(route_filters)
+        return [route for route in self._routes if route in route_filters]
+
+    def _selected_in_routes(
+        self,
+        selected: Optional[np.ndarray],
+        routes: list,
+        route_filters: Optional[Iterable[Hashable]],
+    ) -> np.ndarray:
+        if selected is None or len(selected) == 0:
+            return np.empty(0, dtype=np.int64)
+        selected = np.asarray(selected, dtype=np.int64)
+        if not route_filters:
+            return selected
+        codes = [self._route_codes[route] for route in routes]
+        return selected[np.isin(self._codes[selected], codes)]
+
+    def _route_mask(self, routes: list) -> np.ndarray:
+        """Boolean mask of the rows on `routes`."""
+        if self.route_index is not None:
+            return self.route_index.mask(routes)
+        return np.isin(self._codes, [self._route_codes[route] for route in routes])
+
+    def _route_in_viewport(
+        self, route: Hashable, viewport: Optional[Viewport]
+    ) -> np.ndarray:
+        if viewport is None or self.spatial_index is None:
+            return self._in_viewport(self._routes[route], viewport)
+        if self._visible is None or self._visible[0] != viewport.key:
+            self._visible = (viewport.key, self.spatial_index.query_bbox(viewport))
+        visible = self._visible[1]
+        return visible[self._codes[visible] == self._route_codes[route]]
+
+    def _in_viewport(
+        self, positions: np.ndarray, viewport: Optional[Viewport]
+    ) -> np.ndarray:
+        if viewport is None:
+            return positions
+        return positions[viewport.contains(self._lat[positions], self._lon[positions])]
+
+    def _build_route_trace(self, route: Hashable, positions: np.ndarray) -> tuple:
+        """Trace of the rows at `positions` of `route`, with the ordered positions."""
+        positions = self._order_points(positions)
+        return self._route_trace(route, positions), positions
+
+    def _build_route_head(
+        self, route: Hashable, positions: np.ndarray, n_points: int
+    ) -> tuple:
+        """Trace of the first `n_points` of `route`, with all ordered positions."""
+        positions = self._order_points(positions)
+        return self._route_trace(route, positions[:n_points]), positions
+
+    def _order_points(self, positions: np.ndarray) -> np.ndarray:
+        if self.point_order == "stratified":
+            order = stratified_order(
+                self._lat[positions],
+                self._lon[positions],
+                sample=STRATIFIED_SAMPLE_POINTS,
+            )
+            return positions[order]
+        return positions
+
+    def _route_trace(self, route: Hashable, positions: np.ndarray) -> dict:
+        """Trace of the rows at `positions` of `route`, in that order."""
+        rows = self.data.iloc[positions]
+        marker = {"color": self._route_colors[route]}
+        if self.size_col is not None:
+            marker.update(
+                size=rows[self.size_col].to_numpy(),
+                sizemode="area",
+                sizeref=self._sizeref,
+            )
+        trace = self._scattermapbox(
+            lat=rows[self.lat_col].to_numpy(),
+            lon=rows[self.lon_col].to_numpy(),
+            mode="markers",
+            name=str(route),
+            legendgroup=str(route),
+            marker=marker,
+            **self._hover_properties(rows),
+        )
+        if self.selection_highlight == "selectedpoints":
+            selected_marker = {k: v for k, v in SELECTED_MARKER.items() if k != "size"}
+            trace["selected"] = {"marker": selected_marker}
+            trace["unselected"] = {"marker": dict(UNSELECTED_MARKER)}
+        return trace
+
+    def _hover_properties(self, rows: pd.DataFrame) -> dict:
+        """Hover text and template in the style of plotly express."""
+        properties = {}
+        template = []
+        if self.hover_name is not None:
+            properties["hovertext"] = rows[self.hover_name].to_numpy()
+            template.append("<b>%{hovertext}</b><br>")
+        for i, col in enumerate(self.hover_data):
+            template.append(f"{col}=%{{customdata[{i}]}}")
+        if self.hover_data:
+            properties["customdata"] = rows[self.hover_data].to_numpy()
+        properties["hovertemplate"] = "<br>".join(template) + "<extra></extra>"
+        return properties
+
+    def _build_cluster_trace(
+        self, zoom: float, routes: Optional[list], viewport: Optional[Viewport]
+    ) -> tuple:
+        """Cluster bubble trace, with the rows and row offsets of the clusters."""
+        mask = None
+        if routes is not None:
+            mask = self._route_mask(routes)
+        clusters = self.cluster_pyramid.clusters(zoom, mask=mask, viewport=viewport)
+        rows = self.cluster_pyramid.members(
+            clusters, np.arange(len(clusters)), mask=mask
+        )
+        offsets = np.concatenate(([0], np.cumsum(clusters.count)))
+        max_count = clusters.count.max() if len(clusters) else 1
+        weight_name = self.size_col or "weight"
+        trace = self._scattermapbox(
+            lat=clusters.lat,
+            lon=clusters.lon,
+            mode="markers",
+            name=CLUSTER_TRACE_NAME,
+            marker=dict(
+                CLUSTER_MARKER,
+                size=clusters.count,
+                sizemode="area",
+                sizeref=2.0 * max_count / CLUSTER_SIZE_MAX**2,
+            ),
+            customdata=np.column_stack([clusters.count, clusters.weight]),
+            hovertemplate=(
+                "<b>%{customdata[0]} points</b><br>"
+                f"{weight_name}=%{{customdata[1]:.1f}}<extra></extra>"
+            ),
+        )
+        return trace, rows, offsets
+
+    def _build_density_layer(
+        self, routes: Optional[list], viewport: Optional[Viewport]
+    ) -> tuple:
+        """Density image layer, with the rows drawn in it."""
+        if viewport is None:
+            rows = np.flatnonzero(np.isfinite(self._lat) & np.isfinite(self._lon))
+            if rows.size == 0:
+                return None, rows
+            viewport = Viewport(
+                self._lon[rows].min(),
+                self._lon[rows].max(),
+                self._lat[rows].min(),
+                self._lat[rows].max(),
+            )
+        elif self.spatial_index is not None:
+            rows = self.spatial_index.query_bbox(viewport)
+        else:
+            rows = np.flatnonzero(viewport.contains(self._lat, self._lon))
+        if routes is not None:
+            rows = rows[self._route_mask(routes)[rows]]
+        weights = None
+        if self.size_col is not None:
+            weights = self.data[self.size_col].to_numpy()[rows]
+        layer = density_layer(
+            self._lat[rows],
+            self._lon[rows],
+            viewport,
+            weights=weights,
+            width_px=self.raster_width_px,
+        )
+        return layer, rows
+
+    def _build_density_trace(self) -> dict:
+        return self._scattermapbox(
+            lat=[],
+            lon=[],
+            mode="markers",
+            hoverinfo="none",
+            name=DENSITY_TRACE_NAME,
+        )
+
+    def _build_selected_trace(self, selected: np.ndarray) -> dict:
+        rows = self.data.iloc[selected]
+        return self._scattermapbox(
+            lat=rows[self.lat_col].to_numpy(),
+            lon=rows[self.lon_col].to_numpy(),
+            mode="markers",
+            marker=dict(SELECTED_MARKER),
+            hoverinfo="none",
+            name=SELECTED_TRACE_NAME,
+        )
+
+    def _scattermapbox(self, **properties) -> dict:
+        """Scattermapbox trace dict, validated by plotly when `validate` is set."""
+        if self.validate:
+            return go.Scattermapbox(**properties).to_plotly_json()
+        return dict(properties, type="scattermapbox")
+
+    def _build_layout(
+        self, center: Optional[dict], zoom: float, layers: Sequence[dict] = ()
+    ) -> dict:
+        if center is None:
+            center = self.default_center
+        return {
+            "mapbox": {
+                "style": MAP_STYLE,
+                "center": center,
+                "zoom": zoom,
+                "layers": [layer for layer in layers if layer is not None],
+            },
+            "legend": {"title": {"text": self.color_col}, "itemsizing": "constant"},
+            "margin": {"r": 0, "t": 0, "l": 0, "b": 0},
+            "height": self.height,
+        }
+
+
+def _array_key(positions: np.ndarray) -> tuple:
+    """Cheap hashable key of a positions array."""
+    return (positions.shape[0], hash(positions.tobytes()))
@@ -0,0 +1,378 @@
+// Frontend of the bi_comms_plotly_map streamlit component.
+//
+// Talks to streamlit via the component postMessage protocol and keeps the
+// figure in the browser, applying the full or delta messages sent by python
+// (see `protocol.py`). Events are sent back with the figure version held here,
+// and every stored event is recorded in `updates` with a unique id and the figure
+// version it happened on, so python can tell new events from ones seen before.
+// Relayout events are coalesced until the map has been still for a quiet period,
+// and in "store" mode only kept here and sent along with the next other event.
+// Selections are highlighted by plotly right away; in "store" select mode they
+// are also only sent along with the next event. While a figure is loaded
+// progressively, the next batch is requested once a batch is drawn, and
+// selections are ignored. A delta that cannot be applied asks for a resync; a
+// full figure that cannot be drawn is reported as an error instead, as a resync
+// would only send the same figure again. The map view is owned by the frontend
+// once a figure is shown, so full figures keep the current center and zoom.
+
+(function () {
+  "use strict";
+
+  const PROTOCOL_VERSION = 1;
+  const PLOTLY_CONFIG = { responsive: true, displaylogo: false };
+  const TYPED_ARRAYS = {
+    i1: Int8Array,
+    u1: Uint8Array,
+    i2: Int16Array,
+    u2: Uint16Array,
+    i4: Int32Array,
+    u4: Uint32Array,
+    f4: Float32Array,
+    f8: Float64Array,
+  };
+
+  const gd = document.getElementById("map");
+
+  let args = {};
+  let lastMessageText = null;
+  let heldVersion = null;
+  let listening = false;
+  let applying = false;
+  let eventId = 0;
+  // Seeded from the clock, so ids stay unique when the component is remounted.
+  let updateId = Date.now();
+  let queue = Promise.resolve();
+  let pendingRelayout = null;
+  let relayoutTimer = null;
+  let reportedZoom = null;
+  let loading = false;
+  let lastEvents = {
+    click: [],
+    select: [],
+    hover: [],
+    select_geometry: null,
+    relayout: null,
+    updates: {},
+  };
+
+  function sendMessage(type, data) {
+    window.parent.postMessage(
+      Object.assign({ isStreamlitMessage: true, type: type }, data),
+      "*"
+    );
+  }
+
+  function setComponentValue(value) {
+    sendMessage("streamlit:setComponentValue", { value: value, dataType: "json" });
+  }
+
+  // Store the latest event of `kind`, to be sent with the next message.
+  function storeEvent(kind, payload) {
+    updateId += 1;
+    const update = { id: updateId, ack: heldVersion };
+    lastEvents = Object.assign({}, lastEvents, {
+      [kind]: payload,
+      updates: Object.assign({}, lastEvents.updates, { [kind]: update }),
+    });
+  }
+
+  function sendEvent(kind, payload) {
+    if (kind !== "relayout") {
+      flushRelayout(true);
+    }
+    eventId += 1;
+    storeEvent(kind, payload);
+    setComponentValue(
+      Object.assign({ event_id: eventId, ack: heldVersion }, lastEvents)
+    );
+  }
+
+  // Ask python for the next batch of a progressively loaded figure.
+  function requestNextBatch() {
+    setComponentValue(
+      Object.assign({ event_id: eventId, ack: heldVersion, loading: true }, lastEvents)
+    );
+  }
+
+  function reportError(version, err) {
+    setComponentValue(
+      Object.assign(
+        {
+          event_id: eventId,
+          ack: heldVersion,
+          error: { version: version, message: String((err && err.message) || err) },
+        },
+        lastEvents
+      )
+    );
+  }
+
+  function requestResync() {
+    heldVersion = null;
+    setComponentValue(
+      Object.assign(
+        {
+          event_id: eventId,
+          ack: heldVersion,
+          resync: true,
+          resync_id: Date.now() + "-" + Math.random(),
+        },
+        lastEvents
+      )
+    );
+  }
+
+  // Decode a `{dtype, bdata, shape}` typed-array spec (see `encoding.py`).
+  function decodeTypedArray(spec) {
+    const binary = atob(spec.bdata);
+    const bytes = new Uint8Array(binary.length);
+    for (let i = 0; i < binary.length; i++) {
+      bytes[i] = binary.charCodeAt(i);
+    }
+    const values = new TYPED_ARRAYS[spec.dtype](bytes.buffer);
+    if (!spec.shape) {
+      return values;
+    }
+    const shape = String(spec.shape).split(",").map(Number);
+    const rows = [];
+    for (let i = 0; i < shape[0]; i++) {
+      rows.push(values.subarray(i * shape[1], (i + 1) * shape[1]));
+    }
+    return rows;
+  }
+
+  function decodeTypedArrays(obj) {
+    if (Array.isArray(obj)) {
+      return obj.map(decodeTypedArrays);
+    }
+    if (obj === null || typeof obj !== "object") {
+      return obj;
+    }
+    if (typeof obj.bdata === "string" && obj.dtype in TYPED_ARRAYS) {
+      return decodeTypedArray(obj);
+    }
+    const decoded = {};
+    for (const key of Object.keys(obj)) {
+      decoded[key] = decodeTypedArrays(obj[key]);
+    }
+    return decoded;
+  }
+
+  function pointsOf(eventData) {
+    if (!eventData || !eventData.points) {
+      return [];
+    }
+    return eventData.points.map(function (p) {
+      return {
+        lat: p.lat,
+        lon: p.lon,
+        curveNumber: p.curveNumber,
+        pointNumber: p.pointNumber,
+        pointIndex: p.pointIndex,
+      };
+    });
+  }
+
+  // Only the outline of a selection, so its size does not depend on the points.
+  function geometryOf(eventData) {
+    if (!eventData || !(eventData.lassoPoints || eventData.range)) {
+      return null;
+    }
+    return { lassoPoints: eventData.lassoPoints, range: eventData.range };
+  }
+
+  function relayoutOf(eventData) {
+    const mapbox = gd.layout.mapbox || {};
+    return { raw: eventData, center: mapbox.center, zoom: mapbox.zoom };
+  }
+
+  function crossesZoomBreak(from, to) {
+    return (args.relayout_zoom_breaks || []).some(function (zoom) {
+      return from === null || from < zoom !== to < zoom;
+    });
+  }
+
+  // Merge the relayout events of one pan or zoom gesture into a single event.
+  function queueRelayout(eventData) {
+    pendingRelayout = Object.assign(pendingRelayout || {}, eventData);
+    clearTimeout(relayoutTimer);
+    relayoutTimer = setTimeout(function () {
+      flushRelayout(false);
+    }, args.relayout_debounce_ms || 0);
+  }
+
+  // Report the pending relayout. It is only stored, to go along with the next
+  // event, when `deferred` or in "store" mode without crossing a zoom break.
+  function flushRelayout(deferred) {
+    clearTimeout(relayoutTimer);
+    relayoutTimer = null;
+    if (pendingRelayout === null) {
+      return;
+    }
+    const relayout = relayoutOf(pendingRelayout);
+    pendingRelayout = null;
+    const store =
+      deferred ||
+      (args.relayout_mode === "store" &&
+        !crossesZoomBreak(reportedZoom, relayout.zoom));
+    if (store) {
+      relayout.deferred = true;
+      storeEvent("relayout", relayout);
+      return;
+    }
+    reportedZoom = relayout.zoom;
+    sendEvent("relayout", relayout);
+  }
+
+  function reportSelection(kind, payload) {
+    if (args.select_mode === "store") {
+      storeEvent(kind, payload);
+    } else {
+      sendEvent(kind, payload);
+    }
+  }
+
+  function attachListeners() {
+    if (listening) {
+      return;
+    }
+    listening = true;
+    gd.on("plotly_click", function (ev) {
+      if (args.click_event) sendEvent("click", pointsOf(ev));
+    });
+    gd.on("plotly_hover", function (ev) {
+      if (args.hover_event) sendEvent("hover", pointsOf(ev));
+    });
+    gd.on("plotly_selected", function (ev) {
+      if (!args.select_event || loading) return;
+      if (args.select_geometry_only) {
+        reportSelection("select_geometry", geometryOf(ev));
+      } else {
+        reportSelection("select", pointsOf(ev));
+      }
+    });
+    gd.on("plotly_deselect", function () {
+      if (!args.select_event || loading) return;
+      if (args.select_geometry_only) {
+        reportSelection("select_geometry", null);
+      } else {
+        reportSelection("select", []);
+      }
+    });
+    gd.on("plotly_relayout", function (ev) {
+      if (args.relayout_event && !applying) queueRelayout(ev);
+    });
+  }
+
+  function applyOp(op) {
+    switch (op.op) {
+      case "restyle":
+        return Plotly.restyle(gd, op.update, op.traces);
+      case "replace_trace":
+        return Plotly.deleteTraces(gd, op.index).then(function () {
+          return Plotly.addTraces(gd, op.trace, op.index);
+        });
+      case "extend":
+        return Plotly.extendTraces(gd, op.update, op.traces);
+      case "relayout":
+        return Plotly.relayout(gd, op.update);
+      default:
+        return Promise.reject(new Error("Unknown operation: " + op.op));
+    }
+  }
+
+  // `layout` with the center and zoom of the map shown, if any.
+  function withCurrentView(layout) {
+    const current = (gd.layout || {}).mapbox;
+    if (!current || !layout.mapbox) {
+      return layout;
+    }
+    const view = {};
+    for (const key of ["center", "zoom"]) {
+      if (current[key] !== undefined) {
+        view[key] = current[key];
+      }
+    }
+    return Object.assign({}, layout, {
+      mapbox: Object.assign({}, layout.mapbox, view),
+    });
+  }
+
+  function applyMessage(message) {
+    if (message.protocol !== PROTOCOL_VERSION) {
+      return Promise.reject(new Error("Unsupported protocol: " + message.protocol));
+    }
+    if (message.version === heldVersion) {
+      return Promise.resolve();
+    }
+    applying = true;
+    let applied;
+    if (message.figure) {
+      applied = Plotly.react(
+        gd,
+        message.figure.data,
+        withCurrentView(message.figure.layout),
+        PLOTLY_CONFIG
+      ).then(function () {
+        reportedZoom = (gd.layout.mapbox || {}).zoom;
+        attachListeners();
+      });
+    } else if (message.base_version === heldVersion) {
+      applied = message.ops.reduce(function (previous, op) {
+        return previous.then(function () {
+          return applyOp(op);
+        });
+      }, Promise.resolve());
+    } else {
+      applying = false;
+      requestResync();
+      return Promise.resolve();
+    }
+    return applied.then(
+      function () {
+        applying = false;
+        heldVersion = message.version;
+        loading = Boolean(message.loading);
+        if (loading) {
+          requestNextBatch();
+        }
+      },
+      function (err) {
+        applying = false;
+        throw err;
+      }
+    );
+  }
+
+  function onRender(renderArgs) {
+    args = renderArgs;
+    gd.style.width = args.override_width;
+    gd.style.height = args.override_height + "px";
+    sendMessage("streamlit:setFrameHeight", { height: args.override_height });
+    if (args.message === lastMessageText) {
+      return;
+    }
+    lastMessageText = args.message;
+    const message = decodeTypedArrays(JSON.parse(args.message));
+    queue = queue
+      .then(function () {
+        return applyMessage(message);
+      })
+      .catch(function (err) {
+        console.error(err);
+        if (message.figure) {
+          reportError(message.version, err);
+        } else {
+          requestResync();
+        }
+      });
+  }
+
+  window.addEventListener("message", function (event) {
+    if (event.data.type === "streamlit:render") {
+      onRender(event.data.args);
+    }
+  });
+
+  sendMessage("streamlit:componentReady", { apiVersion: 1 });
+})();
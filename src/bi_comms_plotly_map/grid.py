@@ -0,0 +1,101 @@
+"""
+Server-side paging of the rows shown in a data grid.
+
+Passing the whole (filtered) frame to `AgGrid`, with a page size of all rows and
+a `pre_selected_rows` list of every selected row, serialises and renders every
+row on every rerun. AgGrid's infinite and server-side row models fetch rows
+from a JavaScript datasource, which the streamlit component cannot call back
+into, so the paging is done on the server instead: a `GridWindow` slices one
+page of row positions, the grid only receives the rows of that page, and the
+pre-selection is read from the selection bitmap for those rows only. Selections
+made in the grid are merged back into the selection of all rows, but only when
+the grid of the window reported a new one: a grid returns its last response again
+on every rerun, and nothing at all once it is rebuilt for another page.
+"""
+
+import math
+from typing import Hashable, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .selection_state import SelectionState
+
+GRID_PAGE_SIZE = 200
+POSITION_COL = "_position"
+
+
+class GridWindow:
+    """Current page of `page_size` rows out of a sequence of row positions."""
+
+    def __init__(self, page_size: int = GRID_PAGE_SIZE):
+        if page_size < 1:
+            raise ValueError("The page size has to be at least 1.")
+        self.page_size = page_size
+        self.page = 0
+        self._last_response: Optional[Tuple[Hashable, List[int]]] = None
+
+    def n_pages(self, n_rows: int) -> int:
+        return max(1, math.ceil(n_rows / self.page_size))
+
+    def set_page(self, page: int, n_rows: int) -> int:
+        """Go to `page` (0-based), clamped to the pages of `n_rows` rows."""
+        self.page = min(max(int(page), 0), self.n_pages(n_rows) - 1)
+        return self.page
+
+    def window(self, rows: np.ndarray) -> np.ndarray:
+        """Row positions of the current page out of all `rows`."""
+        self.set_page(self.page, rows.shape[0])
+        start = self.page * self.page_size
+        return rows[start : start + self.page_size]
+
+    def frame(
+        self,
+        data: pd.DataFrame,
+        positions: np.ndarray,
+        columns: Optional[Sequence[str]] = None,
+    ) -> pd.DataFrame:
+        """Rows at `positions` of `data`, with their position in `POSITION_COL`.
+
+        Only the rows of the window are copied.
+        """
+        window = data.iloc[positions]
+        if columns is not None:
+            window = window[list(columns)]
+        return window.assign(**{POSITION_COL: positions}).reset_index(drop=True)
+
+    @staticmethod
+    def pre_selected(positions: np.ndarray, selection: SelectionState) -> List[int]:
+        """Grid row numbers of the selected rows among the window `positions`."""
+        return np.flatnonzero(selection.mask[positions]).tolist()
+
+    def is_new_response(
+        self, window_key: Hashable, selected_rows: Optional[Iterable[dict]]
+    ) -> bool:
+        """Whether the grid of window `window_key` reported a new selection.
+
+        Only a response that differs from the last one of the same window is new.
+        `selected_rows` is `None` while the grid has not responded, which is never
+        new, rather than a selection of no rows.
+        """
+        if selected_rows is None:
+            return False
+        response = (window_key, sorted(row[POSITION_COL] for row in selected_rows))
+        if response == self._last_response:
+            return False
+        self._last_response = response
+        return True
+
+    @staticmethod
+    def merge(
+        selection: SelectionState, positions: np.ndarray, selected_rows: Iterable[dict]
+    ) -> SelectionState:
+        """`selection` with the rows of the window replaced by the grid selection.
+
+        `selected_rows` are the rows returned by the grid, rows outside the window
+        keep their selection.
+        """
+        merged = selection.copy()
+        merged.discard(positions)
+        merged.add([row[POSITION_COL] for row in selected_rows])
+        return merged
@@ -0,0 +1,180 @@
+"""
+Per-session edits on top of a shared, read-only base dataset.
+
+Copying the loaded data into `st.session_state` gives every session a full
+private copy of the frame, only to track which rows are selected and which rows
+were moved to another route. Instead, the base frame is loaded once (e.g. in a
+`st.experimental_singleton`) and shared by all sessions, which never write to
+it. Each session keeps a `DataOverlay`: a `SelectionState` and the integer
+route codes of its rows (a `RouteIndex`), merged with the base frame when read
+via `view`. Route changes go through a `RouteEditor`, so they can be undone.
+A `SelectionSummary` attached via `summarize` is kept up to date with the rows
+that change selection or route.
+"""
+
+from typing import Dict, Hashable, Iterable, List, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+from .route_edits import RouteEditor
+from .route_index import RouteIndex
+from .row_view import RowView
+from .selection_state import SelectionState
+from .selection_summary import SelectionSummary
+
+SELECTED_COL = "selected"
+
+
+class DataOverlay:
+    """Selection and route overrides of one session over a shared base frame.
+
+    Rows are addressed by position (`iloc`) in the base frame. `version` is
+    bumped on every change, `route_version` only on route changes. A shared
+    `route_index` of the base frame is copied, so it can be built once.
+    """
+
+    def __init__(
+        self,
+        base: pd.DataFrame,
+        route_col: str,
+        selected_col: str = SELECTED_COL,
+        route_index: Optional[RouteIndex] = None,
+    ):
+        self.base = base
+        self.route_col = route_col
+        self.selected_col = selected_col
+        if route_index is None:
+            route_index = RouteIndex.from_frame(base, route_col)
+        self._base_codes = route_index.codes
+        self.route_index = route_index.copy()
+        self.route_editor = RouteEditor(self.route_index)
+        self.selected = SelectionState(base.shape[0])
+        self.summary: Optional[SelectionSummary] = None
+        self.version = 0
+        self.route_version = 0
+        self._routes: Optional[tuple] = None
+        self._view: Optional[tuple] = None
+        self._selected_positions: Optional[tuple] = None
+
+    @property
+    def n_rows(self) -> int:
+        return self.base.shape[0]
+
+    def selected_positions(self) -> np.ndarray:
+        """Sorted positions of the selected rows (cached until the next change)."""
+        if self._selected_positions is None or (
+            self._selected_positions[0] != self.version
+        ):
+            self._selected_positions = (self.version, self.selected.positions())
+        return self._selected_positions[1]
+
+    def selected_rows(self, columns: Optional[Sequence[str]] = None) -> RowView:
+        """The selected rows of `view`, without copying them out of the frame."""
+        return RowView(self.view(), self.selected_positions(), columns)
+
+    def set_selected(
+        self, positions: Union[Iterable[int], SelectionState], selected: bool = True
+    ) -> None:
+        """Mark the rows at `positions` (or of a selection) as (de)selected."""
+        flipped = self.selected.assign(positions, selected)
+        if flipped.size:
+            self.version += 1
+            if self.summary is not None and selected:
+                self.summary.add(flipped)
+            elif self.summary is not None:
+                self.summary.remove(flipped)
+
+    def clear_selection(self) -> None:
+        if self.selected.clear():
+            self.version += 1
+            if self.summary is not None:
+                self.summary.reset()
+
+    def summarize(self, value_col: str, bin_col: str) -> SelectionSummary:
+        """Attach a summary of the selection per route, updated on every change."""
+        self.summary = SelectionSummary.from_frame(
+            self.base, self.route_index, value_col, bin_col
+        )
+        self.summary.add(self.selected.positions())
+        return self.summary
+
+    def set_routes(self, positions: Iterable[int], route: Hashable) -> List[Hashable]:
+        """Move the rows at `positions` to `route`, returning the changed routes."""
+        return self._routes_changed(self.route_editor.reassign(positions, route))
+
+    def undo_routes(self) -> List[Hashable]:
+        """Undo the last route change, returning the changed routes."""
+        return self._routes_changed(self.route_editor.undo())
+
+    def redo_routes(self) -> List[Hashable]:
+        """Redo the last undone route change, returning the changed routes."""
+        return self._routes_changed(self.route_editor.redo())
+
+    def reset_routes(self) -> List[Hashable]:
+        """Move all rows back to their base route, as one (undoable) change."""
+        positions = np.flatnonzero(self.route_index.codes != self._base_codes)
+        return self._routes_changed(
+            self.route_editor.assign(positions, self._base_codes[positions])
+        )
+
+    @property
+    def route_overrides(self) -> Dict[int, Hashable]:
+        """Rows whose route differs from the base frame, with their route."""
+        positions = np.flatnonzero(self.route_index.codes != self._base_codes)
+        codes = self.route_index.codes[positions]
+        return {
+            position: self.route_index.name(code)
+            for position, code in zip(positions.tolist(), codes.tolist())
+        }
+
+    @property
+    def routes(self) -> np.ndarray:
+        """Route of every row, with the changes applied (cached per route version)."""
+        if self._routes is None or self._routes[0] != self.route_version:
+            if self.route_version:
+                routes = self.route_index.values()
+            else:
+                routes = self.base[self.route_col].to_numpy()
+            self._routes = (self.route_version, routes)
+        return self._routes[1]
+
+    def _routes_changed(self, changed: List[Hashable]) -> List[Hashable]:
+        if changed:
+            self.version += 1
+            self.route_version += 1
+            if self.summary is not None:
+                edit = self.route_editor.last_applied
+                selected = self.selected.mask[edit.positions]
+                self.summary.move(
+                    edit.positions[selected],
+                    np.broadcast_to(edit.old_codes, selected.shape)[selected],
+                    np.broadcast_to(edit.new_codes, selected.shape)[selected],
+                )
+        return changed
+
+    def view(self) -> pd.DataFrame:
+        """Base frame merged with the overlay, cached until the next change.
+
+        The view shares the columns of the base frame, except the route column
+        (once routes were changed) and the selected column.
+        """
+        if self._view is None or self._view[0] != self.version:
+            view = self.base.copy(deep=False)
+            if self.route_version and isinstance(
+                self.base[self.route_col].dtype, pd.CategoricalDtype
+            ):
+                view[self.route_col] = self.route_index.categorical()
+            elif self.route_version:
+                view[self.route_col] = self.routes
+            view[self.selected_col] = self.selected.mask.copy()
+            self._view = (self.version, view)
+        return self._view[1]
+
+    def memory_usage(self) -> int:
+        """Approximate bytes held by the overlay itself, excluding the base frame."""
+        return (
+            self.selected.n_rows
+            + self.route_index.codes.nbytes
+            + self.route_editor.nbytes
+        )
@@ -0,0 +1,238 @@
+"""
+Progressive loading of large figures into the map.
+
+Sending a figure of millions of points in one message leaves the map blank until
+the whole payload is serialised, shipped and drawn. A `ProgressiveLoader` sends
+a first chunk of the points of every trace as a full message instead, and the
+remaining points in batches of `extendTraces` operations, one batch per rerun.
+The frontend asks for the next batch once it has drawn the previous one, and
+ignores selections until all points are loaded.
+
+With `FigureManager(point_order="stratified")` the points of every trace are
+ordered (see `spatial_index.stratified_order`) so that any first chunk is a
+spatially stratified sample, showing the extent and density of the data.
+
+Figures built with `FigureManager.build(..., first_points=...)` only hold the
+first chunk of their uncached route traces. The points of each batch of these
+`PendingTrace`s are built when the batch is sent, and written into arrays of all
+points of the trace, allocated once. The full traces are complete, and cached,
+once all points are loaded.
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .figure_manager import FigureUpdate, PendingTrace
+from .protocol import extend_op, restyle_op
+
+FIRST_CHUNK_POINTS = 20_000
+CHUNK_POINTS = 200_000
+
+# Trace attributes holding one value per point, extended in every batch.
+POINT_ATTRIBUTES = (
+    ("lat",),
+    ("lon",),
+    ("text",),
+    ("hovertext",),
+    ("customdata",),
+    ("marker", "size"),
+    ("marker", "color"),
+)
+
+
+class ProgressiveLoader:
+    """Splits figures into a first chunk and batches of `extendTraces` operations.
+
+    Chunks are shared over the traces in proportion to their number of points.
+    """
+
+    def __init__(
+        self,
+        first_chunk_points: int = FIRST_CHUNK_POINTS,
+        chunk_points: int = CHUNK_POINTS,
+    ):
+        self.first_chunk_points = first_chunk_points
+        self.chunk_points = chunk_points
+        self._traces: List[dict] = []
+        self._pending: Dict[int, PendingTrace] = {}
+        self._assembled: Dict[int, dict] = {}
+        self._sizes = np.zeros(0, dtype=np.int64)
+        self._loaded = np.zeros(0, dtype=np.int64)
+
+    @property
+    def loading(self) -> bool:
+        return bool((self._loaded < self._sizes).any())
+
+    @property
+    def progress(self) -> Tuple[int, int]:
+        """Points loaded and points in total."""
+        return int(self._loaded.sum()), int(self._sizes.sum())
+
+    def should_load(self, update: FigureUpdate) -> bool:
+        """Whether `update` has more points than the first chunk, or pending traces."""
+        traces = update.figure["data"]
+        return (
+            bool(update.pending)
+            or sum(_n_points(trace) for trace in traces) > self.first_chunk_points
+        )
+
+    def start(self, update: FigureUpdate) -> FigureUpdate:
+        """Update holding the first chunk of the points of every trace."""
+        self._traces = list(update.figure["data"])
+        self._pending = dict(update.pending)
+        self._assembled = {
+            i: _allocate(self._traces[i], pending.n_points)
+            for i, pending in self._pending.items()
+        }
+        self._sizes = np.array(
+            [
+                self._pending[i].n_points if i in self._pending else _n_points(trace)
+                for i, trace in enumerate(self._traces)
+            ],
+            dtype=np.int64,
+        )
+        # Pending traces hold their first points, the others share the rest.
+        pending = np.isin(np.arange(len(self._traces)), list(self._pending))
+        first = np.array([_n_points(t) for t in self._traces], dtype=np.int64)
+        self._loaded = np.where(pending, self._sizes, 0)
+        self._loaded = self._next_counts(
+            max(self.first_chunk_points - int(first[pending].sum()), 0)
+        )
+        self._loaded[pending] = first[pending]
+        figure = dict(update.figure, data=self.partial_traces())
+        return FigureUpdate(
+            figure,
+            list(range(len(self._traces))),
+            True,
+            update.selection_index,
+        )
+
+    def cancel(self) -> None:
+        self._traces = []
+        self._pending = {}
+        self._assembled = {}
+        self._sizes = np.zeros(0, dtype=np.int64)
+        self._loaded = np.zeros(0, dtype=np.int64)
+
+    def next_ops(self) -> Tuple[List[dict], List[dict]]:
+        """Operations loading the next batch, and the traces once applied.
+
+        The last batch also restyles the `selectedpoints` of the traces, which
+        are left out while loading, and completes the pending traces.
+        """
+        counts = self._next_counts(self.chunk_points)
+        batches, groups = {}, {}
+        for i, trace in enumerate(self._traces):
+            start, stop = self._loaded[i], counts[i]
+            if stop == start:
+                continue
+            if i in self._pending:
+                batches[i] = self._pending[i].points(start, stop)
+                _fill(self._assembled[i], batches[i], start, stop)
+            else:
+                batches[i] = _slice_trace(trace, self._sizes[i], start, stop)
+            attributes = _point_attributes(batches[i], stop - start)
+            groups.setdefault(attributes, []).append(i)
+        ops = []
+        for attributes, indices in groups.items():
+            update = {
+                ".".join(path): [_get(batches[i], path) for i in indices]
+                for path in attributes
+            }
+            ops.append(extend_op(indices, update))
+        self._loaded = counts
+        if not self.loading:
+            for i, pending in self._pending.items():
+                self._traces[i] = self._assembled[i]
+                pending.complete(self._traces[i])
+            self._pending, self._assembled = {}, {}
+            selected = [i for i, t in enumerate(self._traces) if "selectedpoints" in t]
+            if selected:
+                points = [self._traces[i]["selectedpoints"] for i in selected]
+                ops.append(restyle_op(selected, {"selectedpoints": points}))
+        return ops, self.partial_traces()
+
+    def partial_traces(self) -> List[dict]:
+        """The traces with the points loaded so far (views, not copies)."""
+        return [
+            _slice_trace(self._assembled.get(i, trace), size, 0, loaded)
+            for i, (trace, size, loaded) in enumerate(
+                zip(self._traces, self._sizes.tolist(), self._loaded.tolist())
+            )
+        ]
+
+    def _next_counts(self, n_points: int) -> np.ndarray:
+        """Points loaded per trace after loading `n_points` more points."""
+        remaining = self._sizes - self._loaded
+        total = remaining.sum()
+        if total <= n_points:
+            return self._sizes.copy()
+        share = np.ceil(remaining * (n_points / total)).astype(np.int64)
+        return self._loaded + np.minimum(share, remaining)
+
+
+def _n_points(trace: dict) -> int:
+    lat = trace.get("lat")
+    return 0 if lat is None else len(lat)
+
+
+def _get(trace: dict, path: tuple) -> Optional[object]:
+    value = trace
+    for key in path:
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value
+
+
+def _point_attributes(trace: dict, n_points: int) -> tuple:
+    """Paths of the attributes of `trace` with one value per point."""
+    return tuple(
+        path
+        for path in POINT_ATTRIBUTES
+        if isinstance(_get(trace, path), (np.ndarray, list, tuple))
+        and len(_get(trace, path)) == n_points
+    )
+
+
+def _set(trace: dict, path: tuple, value: object) -> None:
+    if len(path) == 1:
+        trace[path[0]] = value
+    else:
+        trace[path[0]] = dict(trace[path[0]], **{path[1]: value})
+
+
+def _slice_trace(trace: dict, n_points: int, start: int, stop: int) -> dict:
+    """`trace` with only its points from `start` up to `stop`.
+
+    Partial traces also leave out `selectedpoints`, as they index all points.
+    """
+    if start == 0 and stop >= n_points:
+        return trace
+    sliced = dict(trace)
+    for path in _point_attributes(trace, n_points):
+        _set(sliced, path, _get(trace, path)[start:stop])
+    if "selectedpoints" in sliced:
+        sliced["selectedpoints"] = None
+    return sliced
+
+
+def _allocate(trace: dict, n_points: int) -> dict:
+    """`trace` with arrays for `n_points` points, starting with its own points."""
+    allocated = dict(trace)
+    n_first = _n_points(trace)
+    for path in _point_attributes(trace, n_first):
+        first = np.asarray(_get(trace, path))
+        # Strings of later points may be longer than fixed width strings allow.
+        dtype = object if first.dtype.kind in "US" else first.dtype
+        values = np.empty((n_points,) + first.shape[1:], dtype=dtype)
+        values[:n_first] = first
+        _set(allocated, path, values)
+    return allocated
+
+
+def _fill(trace: dict, batch: dict, start: int, stop: int) -> None:
+    """Write the points of `batch` into the arrays of `trace`, from `start`."""
+    for path in _point_attributes(batch, stop - start):
+        _get(trace, path)[start:stop] = _get(batch, path)
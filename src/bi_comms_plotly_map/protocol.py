@@ -0,0 +1,195 @@
+"""
+Versioned delta protocol between python and the map frontend.
+
+Every message sent to the frontend carries a `version`. A full message carries
+the complete figure, a delta message carries a list of operations that turn the
+figure at `base_version` into the figure at `version`:
+
+* `{"op": "restyle", "traces": [i], "update": {"marker.color": [...]}}`: `Plotly.restyle`.
+* `{"op": "replace_trace", "index": i, "trace": {...}}`: replace a whole trace.
+* `{"op": "extend", "traces": [i], "update": {"lat": [[...]]}}`: `Plotly.extendTraces`.
+* `{"op": "relayout", "update": {...}}`: `Plotly.relayout`.
+
+The frontend applies a delta only if it holds `base_version`. Otherwise it asks
+for a resync, after which the next message is a full one. A full message that
+fails to draw is reported as an error rather than resynced, which would loop.
+Python assumes deltas are applied, so no acknowledgement round-trip (and
+streamlit rerun) is needed on the happy path; the frontend reports the version it
+holds (`ack`) with every event.
+"""
+
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from .figure_manager import FigureUpdate
+
+PROTOCOL_VERSION = 1
+
+# The map view (center, zoom) is owned by the frontend once the figure is shown:
+# deltas leave it out, and the frontend keeps it when drawing a full figure.
+VIEW_LAYOUT_KEYS = {"center", "zoom"}
+
+
+class DeltaEncoder:
+    """Turns successive `FigureUpdate`s into full or delta protocol messages.
+
+    Keeps the figure last sent to the frontend, so deltas can be computed
+    against it. One encoder is used per component instance.
+    """
+
+    def __init__(self):
+        self.version = 0
+        self._traces: Optional[List[dict]] = None
+        self._layout: Optional[dict] = None
+        self._message: Optional[dict] = None
+        self._full_requested = True
+        self._handled_resync: Optional[int] = None
+
+    def request_full(self) -> None:
+        """Send the full figure with the next message."""
+        self._full_requested = True
+
+    def acknowledge(self, value: Optional[dict]) -> bool:
+        """Process the value returned by the frontend.
+
+        Returns `True` if the frontend asked for a resync that has not been handled
+        yet, in which case the next message will be a full one.
+        """
+        if not value or not value.get("resync"):
+            return False
+        resync_id = value.get("resync_id")
+        if resync_id == self._handled_resync:
+            return False
+        self._handled_resync = resync_id
+        if value.get("ack") == self.version:
+            return False
+        self.request_full()
+        return True
+
+    def needs_full(self, update: FigureUpdate) -> bool:
+        """Whether `update` will be encoded as a full message."""
+        return (
+            self._full_requested
+            or update.full
+            or self._traces is None
+            or len(update.figure["data"]) != len(self._traces)
+        )
+
+    def encode(self, update: FigureUpdate) -> dict:
+        """Encode a figure update as a message for the frontend."""
+        traces = update.figure["data"]
+        layout = update.figure["layout"]
+        if self.needs_full(update):
+            return self._full_message(traces, layout)
+
+        ops = []
+        for i in update.changed_traces:
+            ops.extend(trace_ops(i, self._traces[i], traces[i]))
+        layout_update = layout_diff(self._layout, layout)
+        if layout_update:
+            ops.append({"op": "relayout", "update": layout_update})
+        self._traces = list(traces)
+        self._layout = layout
+        if not ops:
+            return self._message
+        return self._delta_message(ops)
+
+    def encode_ops(self, ops: List[dict], traces: Optional[List[dict]] = None) -> dict:
+        """Encode hand-built operations (e.g. `extend_op`) as a delta message.
+
+        `traces` are the traces once the operations are applied, to diff later
+        updates against.
+        """
+        if self._message is None or self._full_requested:
+            raise ValueError("A full message has to be sent before deltas.")
+        if traces is not None:
+            self._traces = list(traces)
+        return self._delta_message(ops)
+
+    def _full_message(self, traces: List[dict], layout: dict) -> dict:
+        self.version += 1
+        self._traces = list(traces)
+        self._layout = layout
+        self._full_requested = False
+        self._message = {
+            "protocol": PROTOCOL_VERSION,
+            "version": self.version,
+            "figure": {"data": traces, "layout": layout},
+        }
+        return self._message
+
+    def _delta_message(self, ops: List[dict]) -> dict:
+        self.version += 1
+        self._message = {
+            "protocol": PROTOCOL_VERSION,
+            "version": self.version,
+            "base_version": self.version - 1,
+            "ops": ops,
+        }
+        return self._message
+
+
+def trace_ops(index: int, old: dict, new: dict) -> List[dict]:
+    """Operations that turn trace `old` into trace `new`.
+
+    A restyle of the changed attributes when both traces have the same
+    attributes, and a trace replacement otherwise.
+    """
+    if old.keys() != new.keys():
+        return [replace_trace_op(index, new)]
+    update = {}
+    for key, value in new.items():
+        if isinstance(value, dict) and isinstance(old[key], dict):
+            if value.keys() != old[key].keys():
+                return [replace_trace_op(index, new)]
+            for sub_key, sub_value in value.items():
+                if not _equal(old[key][sub_key], sub_value):
+                    update[f"{key}.{sub_key}"] = [sub_value]
+        elif not _equal(old[key], value):
+            update[key] = [value]
+    if not update:
+        return []
+    return [restyle_op([index], update)]
+
+
+def layout_diff(old: Optional[dict], new: dict) -> dict:
+    """Relayout update from `old` to `new`, leaving out the map view."""
+    update = {}
+    for key, value in new.items():
+        old_value = (old or {}).get(key)
+        if key == "mapbox" and isinstance(old_value, dict):
+            for sub_key, sub_value in value.items():
+                if (
+                    sub_key not in VIEW_LAYOUT_KEYS
+                    and old_value.get(sub_key) != sub_value
+                ):
+                    update[f"mapbox.{sub_key}"] = sub_value
+        elif old_value != value:
+            update[key] = value
+    return update
+
+
+def restyle_op(traces: List[int], update: Dict[str, list]) -> dict:
+    return {"op": "restyle", "traces": traces, "update": update}
+
+
+def replace_trace_op(index: int, trace: dict) -> dict:
+    return {"op": "replace_trace", "index": index, "trace": trace}
+
+
+def extend_op(traces: List[int], update: Dict[str, list]) -> dict:
+    """Append points to traces, with `update` as `{"lat": [new_lats_per_trace]}`."""
+    return {"op": "extend", "traces": traces, "update": update}
+
+
+def _equal(a: Any, b: Any) -> bool:
+    if a is b:
+        return True
+    if isinstance(a, np.ndarray) or isinstance(b, np.ndarray):
+        return (
+            np.shape(a) == np.shape(b)
+            and np.asarray(a).dtype == np.asarray(b).dtype
+            and np.array_equal(a, b)
+        )
+    return a == b
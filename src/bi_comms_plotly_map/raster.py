@@ -0,0 +1,140 @@
+"""
+Density raster rendering of map points.
+
+For millions of points even cluster bubbles are too heavy for the browser. In
+density mode the points in view are binned server-side into a 2D histogram
+(`np.histogram2d`) over web mercator coordinates, coloured, and sent as a PNG
+image layer (`mapbox.layers` with `sourcetype="image"`). The size of the map
+payload then only depends on the raster size, not on the number of points.
+Selections are resolved from their lasso or box outline against the data.
+"""
+
+import base64
+import struct
+import zlib
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+import plotly.express as px
+from plotly.colors import hex_to_rgb
+
+from .viewport import MAX_MERCATOR_LAT, Viewport, mercator_xy
+
+RASTER_WIDTH_PX = 1024
+DENSITY_COLORSCALE = px.colors.sequential.Plasma
+DENSITY_OPACITY = 0.8
+
+
+def raster_shape(
+    viewport: Viewport, width_px: int = RASTER_WIDTH_PX
+) -> Tuple[int, int]:
+    """(height, width) in pixels of a raster over `viewport`, with square pixels."""
+    viewport = _clamp(viewport)
+    (x0, x1), (y0, y1) = _mercator_bounds(viewport)
+    height_px = int(round(width_px * (y1 - y0) / max(x1 - x0, 1e-12)))
+    return min(max(height_px, 1), 4 * width_px), width_px
+
+
+def rasterize(
+    lat: np.ndarray,
+    lon: np.ndarray,
+    viewport: Viewport,
+    shape: Tuple[int, int],
+    weights: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """Sum of `weights` (or count) of the points per pixel, first row at the top."""
+    viewport = _clamp(viewport)
+    x, y = mercator_xy(np.asarray(lat, np.float64), np.asarray(lon, np.float64))
+    x_range, y_range = _mercator_bounds(viewport)
+    grid, _, _ = np.histogram2d(
+        y, x, bins=shape, range=(y_range, x_range), weights=weights
+    )
+    return grid
+
+
+def colorize(
+    grid: np.ndarray,
+    colorscale: Sequence[str] = DENSITY_COLORSCALE,
+    opacity: float = DENSITY_OPACITY,
+) -> np.ndarray:
+    """RGBA image (uint8) of a density grid on a log scale; empty pixels are clear."""
+    levels = np.log1p(np.maximum(grid, 0))
+    top = levels.max()
+    if top > 0:
+        levels /= top
+    stops = np.array([hex_to_rgb(color) for color in colorscale], dtype=np.float64)
+    positions = levels * (len(stops) - 1)
+    rgba = np.empty(grid.shape + (4,), dtype=np.uint8)
+    for channel in range(3):
+        rgba[..., channel] = np.interp(
+            positions, np.arange(len(stops)), stops[:, channel]
+        )
+    rgba[..., 3] = np.where(grid > 0, 255 * opacity * (0.3 + 0.7 * levels), 0)
+    return rgba
+
+
+def png_data_uri(rgba: np.ndarray) -> str:
+    """Encode an RGBA image as a `data:image/png;base64,...` URI."""
+    height, width = rgba.shape[:2]
+    # Every scanline starts with filter type 0 (none).
+    scanlines = np.zeros((height, width * 4 + 1), dtype=np.uint8)
+    scanlines[:, 1:] = rgba.reshape(height, width * 4)
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        body = kind + data
+        return struct.pack(">I", len(data)) + body + struct.pack(">I", zlib.crc32(body))
+
+    png = b"".join(
+        [
+            b"\x89PNG\r\n\x1a\n",
+            chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)),
+            chunk(b"IDAT", zlib.compress(scanlines.tobytes(), 6)),
+            chunk(b"IEND", b""),
+        ]
+    )
+    return "data:image/png;base64," + base64.b64encode(png).decode("ascii")
+
+
+def image_layer(source: str, viewport: Viewport) -> dict:
+    """`mapbox.layers` entry showing the image `source` over `viewport`."""
+    viewport = _clamp(viewport)
+    return {
+        "sourcetype": "image",
+        "source": source,
+        "coordinates": [
+            [viewport.min_lon, viewport.max_lat],
+            [viewport.max_lon, viewport.max_lat],
+            [viewport.max_lon, viewport.min_lat],
+            [viewport.min_lon, viewport.min_lat],
+        ],
+    }
+
+
+def density_layer(
+    lat: np.ndarray,
+    lon: np.ndarray,
+    viewport: Viewport,
+    weights: Optional[np.ndarray] = None,
+    width_px: int = RASTER_WIDTH_PX,
+) -> dict:
+    """Density image layer of the points over `viewport`."""
+    grid = rasterize(lat, lon, viewport, raster_shape(viewport, width_px), weights)
+    return image_layer(png_data_uri(colorize(grid)), viewport)
+
+
+def _clamp(viewport: Viewport) -> Viewport:
+    """Viewport within the latitudes and longitudes web mercator can show."""
+    return Viewport(
+        max(viewport.min_lon, -180.0),
+        min(viewport.max_lon, 180.0),
+        max(viewport.min_lat, -MAX_MERCATOR_LAT),
+        min(viewport.max_lat, MAX_MERCATOR_LAT),
+    )
+
+
+def _mercator_bounds(viewport: Viewport) -> tuple:
+    x, y = mercator_xy(
+        np.array([viewport.min_lat, viewport.max_lat]),
+        np.array([viewport.min_lon, viewport.max_lon]),
+    )
+    return (x[0], x[1]), (y[1], y[0])
@@ -0,0 +1,76 @@
+"""
+Page regions that only redo their work when their inputs changed.
+
+Every event of a streamlit app reruns the whole script, so a map move also
+rebuilds the grid, the summary and the tables, although none of them depend on
+the map view. `Regions` groups the page into named regions (e.g. "map", "grid",
+"summary"), each declaring the `ChangeTracker` sources it depends on. A region
+only rebuilds its output when the versions of those sources changed, and reuses
+its previous output otherwise, so widgets are rendered again with identical
+arguments and the browser keeps them as they are.
+
+Streamlit versions with fragments (`st.fragment`, `st.experimental_fragment`)
+can also rerun a region on its own via `Regions.fragment`; without fragments,
+the decorated function simply runs as part of the page.
+"""
+
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple, TypeVar
+
+import streamlit as st
+
+from .change_detection import ChangeTracker
+
+T = TypeVar("T")
+
+
+class Regions:
+    """Named page regions with declared dependencies on tracked sources."""
+
+    def __init__(self, tracker: ChangeTracker):
+        self.tracker = tracker
+        self.dependencies: Dict[str, Tuple[str, ...]] = {}
+        self.hits = 0
+        self.misses = 0
+        self._outputs: Dict[str, Tuple[tuple, Any]] = {}
+
+    def declare(self, name: str, depends_on: Iterable[str]) -> None:
+        """Declare region `name` to depend on the tracker sources `depends_on`."""
+        self.dependencies[name] = tuple(depends_on)
+        self._outputs.pop(name, None)
+
+    def key(self, name: str) -> tuple:
+        """Versions of the dependencies of region `name`."""
+        return self.tracker.key(self.dependencies[name])
+
+    def is_stale(self, name: str) -> bool:
+        """Whether a dependency of region `name` changed since its last build."""
+        output = self._outputs.get(name)
+        return output is None or output[0] != self.key(name)
+
+    def run(self, name: str, build: Callable[[], T]) -> T:
+        """Output of `build` for region `name`, rebuilt only when it is stale."""
+        if not self.is_stale(name):
+            self.hits += 1
+            return self._outputs[name][1]
+        self.misses += 1
+        output = build()
+        self._outputs[name] = (self.key(name), output)
+        return output
+
+    def invalidate(self, name: Optional[str] = None) -> None:
+        """Drop the output of region `name` (all regions if none is given)."""
+        if name is None:
+            self._outputs.clear()
+        else:
+            self._outputs.pop(name, None)
+
+    @staticmethod
+    def fragment(func: Callable[..., T]) -> Callable[..., T]:
+        """`func` as a streamlit fragment, rerun on its own by its widgets.
+
+        Returns `func` unchanged on streamlit versions without fragments.
+        """
+        decorator = getattr(st, "fragment", None) or getattr(
+            st, "experimental_fragment", None
+        )
+        return func if decorator is None else decorator(func)
@@ -0,0 +1,144 @@
+"""
+Batched route reassignment with undo and redo.
+
+Writing a new route into the object-dtype route column of the frame, row by row
+and without history, makes bulk edits slow and impossible to take back. The
+`RouteEditor` applies reassignments as vectorised writes to the integer route
+codes of a `RouteIndex`, and logs each one compactly: the moved row positions,
+their previous codes and the new code. Undo and redo replay an entry of the log
+and cost O(rows moved by that edit). The log keeps the last `max_edits` edits,
+in at most `max_bytes`; older edits can no longer be undone.
+"""
+
+from typing import Hashable, Iterable, List, Optional
+
+import numpy as np
+
+from .route_index import ROUTE_CODE_DTYPE, RouteIndex
+
+ROUTE_EDIT_LOG_EDITS = 100
+ROUTE_EDIT_LOG_BYTES = 64 * 1024**2
+
+
+class RouteEdit:
+    """One logged reassignment: the rows at `positions` moved from `old_codes`
+    (one per row) to `new_codes` (one per row, or a single code for all)."""
+
+    def __init__(self, positions: np.ndarray, old_codes: np.ndarray, new_codes):
+        self.positions = positions
+        self.old_codes = old_codes
+        self.new_codes = new_codes
+
+    def __len__(self) -> int:
+        return self.positions.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        return (
+            self.positions.nbytes
+            + self.old_codes.nbytes
+            + np.asarray(self.new_codes).nbytes
+        )
+
+
+class RouteEditor:
+    """Applies route reassignments to a `RouteIndex`, with an undo/redo log.
+
+    Edits after an undo discard the undone edits, as in an editor.
+    `last_applied` is the last change written to the index, in the direction it
+    was applied (from new to old codes for an undo). The oldest edits are
+    dropped from the log beyond `max_edits` edits or `max_bytes`, but the last
+    edit is always kept.
+    """
+
+    def __init__(
+        self,
+        route_index: RouteIndex,
+        max_edits: Optional[int] = ROUTE_EDIT_LOG_EDITS,
+        max_bytes: Optional[int] = ROUTE_EDIT_LOG_BYTES,
+    ):
+        self.route_index = route_index
+        self.max_edits = max_edits
+        self.max_bytes = max_bytes
+        self.edits: List[RouteEdit] = []
+        self.last_applied: Optional[RouteEdit] = None
+        self._applied = 0
+
+    @property
+    def can_undo(self) -> bool:
+        return self._applied > 0
+
+    @property
+    def can_redo(self) -> bool:
+        return self._applied < len(self.edits)
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the log."""
+        return sum(edit.nbytes for edit in self.edits)
+
+    def reassign(self, positions: Iterable[int], route: Hashable) -> List[Hashable]:
+        """Move the rows at `positions` to `route`, returning the changed routes."""
+        index = self.route_index
+        positions = np.unique(np.asarray(positions, dtype=np.int64))
+        old_codes = index.codes[positions]
+        changed = index.reassign(positions, route)
+        if changed:
+            moved = old_codes != index.codes[positions]
+            new_codes = np.array([index.code(route)], dtype=ROUTE_CODE_DTYPE)
+            self._log(RouteEdit(positions[moved], old_codes[moved], new_codes))
+        return changed
+
+    def assign(self, positions: np.ndarray, codes: np.ndarray) -> List[Hashable]:
+        """Set the route codes of the (unique) rows at `positions`, as one edit."""
+        index = self.route_index
+        positions = np.asarray(positions, dtype=np.int64)
+        codes = np.asarray(codes, dtype=ROUTE_CODE_DTYPE)
+        old_codes = index.codes[positions]
+        changed = index.assign(positions, codes)
+        if changed:
+            moved = old_codes != codes
+            positions, old_codes, codes = (
+                positions[moved],
+                old_codes[moved],
+                codes[moved],
+            )
+            if np.all(codes == codes[0]):
+                codes = codes[:1]
+            self._log(RouteEdit(positions, old_codes, codes))
+        return changed
+
+    def undo(self) -> List[Hashable]:
+        """Take back the last applied edit, returning the changed routes."""
+        if not self.can_undo:
+            return []
+        self._applied -= 1
+        edit = self.edits[self._applied]
+        return self._apply(edit.positions, edit.new_codes, edit.old_codes)
+
+    def redo(self) -> List[Hashable]:
+        """Apply the last undone edit again, returning the changed routes."""
+        if not self.can_redo:
+            return []
+        edit = self.edits[self._applied]
+        self._applied += 1
+        return self._apply(edit.positions, edit.old_codes, edit.new_codes)
+
+    def _log(self, edit: RouteEdit) -> None:
+        """Log an edit written to the index, dropping undone and old edits."""
+        del self.edits[self._applied :]
+        self.edits.append(edit)
+        self.last_applied = edit
+        while len(self.edits) > 1 and (
+            (self.max_edits is not None and len(self.edits) > self.max_edits)
+            or (self.max_bytes is not None and self.nbytes > self.max_bytes)
+        ):
+            del self.edits[0]
+        self._applied = len(self.edits)
+
+    def _apply(
+        self, positions: np.ndarray, old_codes: np.ndarray, codes: np.ndarray
+    ) -> List[Hashable]:
+        self.last_applied = RouteEdit(positions, old_codes, codes)
+        codes = np.broadcast_to(codes, positions.shape)
+        return self.route_index.assign(positions, codes)
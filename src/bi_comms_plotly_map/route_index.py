@@ -0,0 +1,148 @@
+"""
+Positional index of the rows of every route.
+
+Grouping or filtering the data by route (`groupby`, `isin(route_filters)`) costs
+a pass over all rows, on every rerun. The `RouteIndex` is built once per data
+version and holds an integer route code per row plus the sorted row positions
+of every route. Filtering by route is then O(rows in the routes), and moving
+rows to another route only touches the routes involved.
+"""
+
+from typing import Dict, Hashable, Iterable, List
+
+import numpy as np
+import pandas as pd
+
+ROUTE_CODE_DTYPE = np.int32
+
+
+class RouteIndex:
+    """Route code per row and sorted row positions (`iloc`) per route.
+
+    Route codes are assigned in order of first appearance and never change, so
+    they stay valid when rows are moved between routes. `routes` lists the
+    routes that have rows, sorted by name.
+    """
+
+    def __init__(self, values: Iterable[Hashable]):
+        codes, uniques = pd.factorize(pd.Series(values, dtype=object), sort=False)
+        if (codes < 0).any():
+            raise ValueError("Routes cannot be missing.")
+        self.codes = codes.astype(ROUTE_CODE_DTYPE)
+        self._names: List[Hashable] = list(uniques)
+        self._code_of: Dict[Hashable, int] = {r: c for c, r in enumerate(self._names)}
+        order = np.argsort(self.codes, kind="stable")
+        counts = np.bincount(self.codes, minlength=len(self._names))
+        self._positions: List[np.ndarray] = np.split(order, np.cumsum(counts)[:-1])
+        self.version = 0
+
+    @classmethod
+    def from_frame(cls, data: pd.DataFrame, route_col: str) -> "RouteIndex":
+        return cls(data[route_col].to_numpy())
+
+    @property
+    def n_rows(self) -> int:
+        return self.codes.shape[0]
+
+    @property
+    def n_codes(self) -> int:
+        """Number of route codes, including routes without rows."""
+        return len(self._names)
+
+    @property
+    def routes(self) -> List[Hashable]:
+        return sorted(
+            (r for r, c in self._code_of.items() if self._positions[c].size), key=str
+        )
+
+    def code(self, route: Hashable) -> int:
+        """Code of `route`, -1 if it is unknown."""
+        return self._code_of.get(route, -1)
+
+    def name(self, code: int) -> Hashable:
+        return self._names[code]
+
+    def positions(self, route: Hashable) -> np.ndarray:
+        """Sorted row positions of `route`."""
+        code = self._code_of.get(route)
+        if code is None:
+            return np.empty(0, dtype=np.int64)
+        return self._positions[code]
+
+    def count(self, route: Hashable) -> int:
+        return self.positions(route).shape[0]
+
+    def filter(self, routes: Iterable[Hashable]) -> np.ndarray:
+        """Sorted row positions of all `routes`."""
+        parts = [self.positions(route) for route in set(routes)]
+        parts = [p for p in parts if p.size]
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        return np.sort(np.concatenate(parts))
+
+    def mask(self, routes: Iterable[Hashable]) -> np.ndarray:
+        """Boolean mask of the rows on `routes`."""
+        mask = np.zeros(self.n_rows, dtype=bool)
+        mask[self.filter(routes)] = True
+        return mask
+
+    def values(self) -> np.ndarray:
+        """Route of every row, as an object array."""
+        return np.asarray(self._names, dtype=object)[self.codes]
+
+    def categorical(self) -> pd.Categorical:
+        """Route of every row, as a categorical sharing the route codes."""
+        return pd.Categorical.from_codes(self.codes, categories=self._names)
+
+    def add_route(self, route: Hashable) -> int:
+        """Code of `route`, adding it (without rows) if it is new."""
+        code = self._code_of.get(route)
+        if code is None:
+            code = len(self._names)
+            self._names.append(route)
+            self._code_of[route] = code
+            self._positions.append(np.empty(0, dtype=np.int64))
+        return code
+
+    def reassign(self, positions: Iterable[int], route: Hashable) -> List[Hashable]:
+        """Move the rows at `positions` to `route`, returning the changed routes.
+
+        Costs O(rows of the routes involved), instead of regrouping all rows.
+        """
+        positions = np.unique(np.asarray(positions, dtype=np.int64))
+        codes = np.full(positions.shape[0], self.add_route(route), ROUTE_CODE_DTYPE)
+        return self.assign(positions, codes)
+
+    def assign(self, positions: np.ndarray, codes: np.ndarray) -> List[Hashable]:
+        """Set the route codes of the (unique) rows at `positions` to `codes`.
+
+        Returns the changed routes, i.e. the routes that lost or gained rows.
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        codes = np.asarray(codes, dtype=ROUTE_CODE_DTYPE)
+        moved = self.codes[positions] != codes
+        positions, codes = positions[moved], codes[moved]
+        if positions.size == 0:
+            return []
+        old_codes = self.codes[positions]
+        for old in np.unique(old_codes).tolist():
+            self._positions[old] = np.setdiff1d(
+                self._positions[old], positions[old_codes == old], assume_unique=True
+            )
+        for new in np.unique(codes).tolist():
+            self._positions[new] = np.union1d(
+                self._positions[new], positions[codes == new]
+            )
+        self.codes[positions] = codes
+        self.version += 1
+        changed = np.union1d(old_codes, codes).tolist()
+        return [self._names[code] for code in changed]
+
+    def copy(self) -> "RouteIndex":
+        index = RouteIndex.__new__(RouteIndex)
+        index.codes = self.codes.copy()
+        index._names = list(self._names)
+        index._code_of = dict(self._code_of)
+        index._positions = list(self._positions)
+        index.version = self.version
+        return index
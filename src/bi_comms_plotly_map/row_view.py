@@ -0,0 +1,59 @@
+"""
+Lazy views of a subset of rows.
+
+Copying the selected rows out of the data (`data.loc[data["selected"]].copy()`)
+on every rerun, only to render them in a table, allocates and renders the full
+selection however large it is. A `RowView` holds the row positions of the subset
+over the shared frame instead, and only takes rows out of the frame on demand,
+one page at a time.
+"""
+
+import math
+from typing import Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+DISPLAY_ROWS = 100
+
+
+class RowView:
+    """Rows at `positions` (`iloc`) of `data`, materialised only on demand."""
+
+    def __init__(
+        self,
+        data: pd.DataFrame,
+        positions: np.ndarray,
+        columns: Optional[Sequence[str]] = None,
+    ):
+        self.data = data
+        self.positions = np.asarray(positions, dtype=np.int64)
+        self.columns = list(data.columns) if columns is None else list(columns)
+
+    def __len__(self) -> int:
+        return self.positions.shape[0]
+
+    def __bool__(self) -> bool:
+        return self.positions.shape[0] > 0
+
+    def __repr__(self) -> str:
+        return f"RowView({len(self)} of {self.data.shape[0]} rows)"
+
+    def take(self, start: int = 0, stop: Optional[int] = None) -> pd.DataFrame:
+        """Copy of the rows `start:stop` of the view."""
+        return self.data.iloc[self.positions[start:stop]][self.columns]
+
+    def head(self, n: int = DISPLAY_ROWS) -> pd.DataFrame:
+        return self.take(0, n)
+
+    def n_pages(self, page_size: int = DISPLAY_ROWS) -> int:
+        return max(1, math.ceil(len(self) / page_size))
+
+    def page(self, page: int, page_size: int = DISPLAY_ROWS) -> pd.DataFrame:
+        """Copy of the rows of `page` (0-based, clamped to the pages)."""
+        page = min(max(int(page), 0), self.n_pages(page_size) - 1)
+        return self.take(page * page_size, (page + 1) * page_size)
+
+    def to_frame(self) -> pd.DataFrame:
+        """Copy of all rows of the view."""
+        return self.take()
@@ -0,0 +1,82 @@
+"""
+Compact column types for the base data.
+
+Frames loaded for the map typically hold routes as Python strings, coordinates
+as float64, and redundant id columns. `normalize_frame` converts them to a
+compact schema: categorical routes, float32 coordinates when the rounding error
+stays within a distance budget, downcast integers, and without the given
+redundant columns. Selections are kept outside the frame (see `DataOverlay`).
+`memory_report` compares the memory use per column before and after.
+"""
+
+import math
+from typing import Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from .spatial_index import EARTH_RADIUS_M
+
+MAX_COORDINATE_ERROR_M = 1.0
+
+
+def normalize_frame(
+    data: pd.DataFrame,
+    lat_col: str,
+    lon_col: str,
+    route_col: Optional[str] = None,
+    drop_columns: Sequence[str] = (),
+    max_coordinate_error_m: float = MAX_COORDINATE_ERROR_M,
+) -> pd.DataFrame:
+    """Return `data` with a compact schema.
+
+    Coordinates become float32 only if that moves no point by more than
+    `max_coordinate_error_m` metres. Integer columns are downcast to the
+    smallest type holding their values, and `route_col` becomes categorical.
+    """
+    data = data.drop(columns=list(drop_columns))
+    columns = {}
+    if route_col is not None:
+        columns[route_col] = data[route_col].astype("category")
+    if coordinate_error_m(data[lat_col], data[lon_col]) <= max_coordinate_error_m:
+        columns[lat_col] = data[lat_col].astype(np.float32)
+        columns[lon_col] = data[lon_col].astype(np.float32)
+    for col in data.columns:
+        if col not in columns and pd.api.types.is_integer_dtype(data[col].dtype):
+            columns[col] = pd.to_numeric(data[col], downcast="integer")
+    return data.assign(**columns)
+
+
+def coordinate_error_m(lat: pd.Series, lon: pd.Series) -> float:
+    """Largest distance in metres a point moves when stored as float32."""
+    lat = lat.to_numpy(dtype=np.float64)
+    lon = lon.to_numpy(dtype=np.float64)
+    if lat.size == 0:
+        return 0.0
+    d_lat = np.abs(lat.astype(np.float32) - lat)
+    d_lon = np.abs(lon.astype(np.float32) - lon) * np.cos(np.radians(lat))
+    error = np.nanmax(np.hypot(d_lat, d_lon), initial=0.0)
+    return math.radians(float(error)) * EARTH_RADIUS_M
+
+
+def memory_report(before: pd.DataFrame, after: pd.DataFrame) -> pd.DataFrame:
+    """Bytes per column (including strings) before and after, with a total."""
+    report = pd.DataFrame(
+        {
+            "before_bytes": before.memory_usage(index=True, deep=True),
+            "after_bytes": after.memory_usage(index=True, deep=True),
+            "before_dtype": before.dtypes.astype(str),
+            "after_dtype": after.dtypes.astype(str),
+        }
+    )
+    report.loc["total", ["before_bytes", "after_bytes"]] = [
+        before.memory_usage(index=True, deep=True).sum(),
+        after.memory_usage(index=True, deep=True).sum(),
+    ]
+    report["after_bytes"] = report["after_bytes"].fillna(0).astype(np.int64)
+    report["before_bytes"] = report["before_bytes"].fillna(0).astype(np.int64)
+    report[["before_dtype", "after_dtype"]] = report[
+        ["before_dtype", "after_dtype"]
+    ].fillna("")
+    report["ratio"] = report["after_bytes"] / report["before_bytes"]
+    return report
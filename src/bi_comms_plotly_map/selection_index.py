@@ -0,0 +1,212 @@
+"""
+Integer row-id selection index for plotly map events.
+
+Map events describe points by the trace they belong to (`curveNumber`) and their
+position inside that trace (`pointIndex`). The `SelectionIndex` keeps, for each
+trace, the positional row ids of the base data used to build it, so that event
+payloads can be resolved back to rows without building and hashing
+`"lon-lat"` strings (which also breaks when JS and Python format floats
+differently).
+
+Selections can also be resolved from their lasso or box outline alone, so the
+event size does not grow with the number of selected points. A trace point can
+also stand for a group of rows, such as a cluster bubble, in which case selecting
+it selects all of its rows. Given the coordinates of such group points, outlines
+select the groups whose point (e.g. the bubble centroid) is inside, as plotly
+does in the browser, rather than the rows inside. Rows drawn without trace
+points, such as a density raster, are registered as an area and can only be
+selected by outline.
+"""
+
+from typing import Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from .spatial_index import GridIndex, points_in_polygon, selection_polygon
+
+ROW_ID_DTYPE = np.int64
+
+
+class SelectionIndex:
+    """Maps (trace, point) pairs from plotly events to row positions.
+
+    Row positions are positional (`iloc`) ids into the base data-frame. To
+    resolve selection outlines, either the coordinates (`lat`, `lon`) of the base
+    data or a `spatial_index` over them is needed.
+    """
+
+    def __init__(
+        self,
+        n_rows: int,
+        lat: Optional[np.ndarray] = None,
+        lon: Optional[np.ndarray] = None,
+        spatial_index: Optional[GridIndex] = None,
+    ):
+        self.n_rows = n_rows
+        self.lat = lat
+        self.lon = lon
+        self.spatial_index = spatial_index
+        self._trace_rows: List[np.ndarray] = []
+        self._trace_offsets: List[Optional[np.ndarray]] = []
+        self._trace_points: List[Optional[tuple]] = []
+        self._area_rows = np.empty(0, dtype=ROW_ID_DTYPE)
+
+    @property
+    def n_traces(self) -> int:
+        return len(self._trace_rows)
+
+    def add_trace(
+        self,
+        row_positions: Iterable[int],
+        offsets: Optional[np.ndarray] = None,
+        lat: Optional[np.ndarray] = None,
+        lon: Optional[np.ndarray] = None,
+    ) -> int:
+        """Register the row positions of a new trace, returning its curve number.
+
+        Without `offsets`, trace point `i` is row `row_positions[i]`. With
+        `offsets`, point `i` stands for `row_positions[offsets[i]:offsets[i + 1]]`,
+        and `lat` and `lon` are the coordinates of the points, if any.
+        """
+        rows = self._as_positions(row_positions)
+        self._trace_rows.append(rows)
+        self._trace_offsets.append(self._as_offsets(offsets, rows))
+        self._trace_points.append(self._as_points(offsets, lat, lon))
+        return len(self._trace_rows) - 1
+
+    def add_area(self, row_positions: Iterable[int]) -> None:
+        """Register rows shown on the map without trace points (e.g. a raster).
+
+        Area rows are only returned by `resolve_geometry`, and only when all
+        traces are allowed.
+        """
+        rows = self._as_positions(row_positions)
+        self._area_rows = np.concatenate((self._area_rows, rows))
+
+    def trace_rows(self, curve_number: int) -> np.ndarray:
+        """Row positions of (all points of) a trace, in trace point order."""
+        return self._trace_rows[curve_number]
+
+    def resolve(
+        self, points: Optional[List[dict]], curves: Optional[Iterable[int]] = None
+    ) -> np.ndarray:
+        """Resolve plotly event points to a sorted array of unique row positions.
+
+        Runs in O(selected) time. Points on unknown traces (or, if `curves` is
+        given, on traces not in `curves`) are ignored, so overlay traces such as
+        the red "Selected" markers do not need to be registered.
+        """
+        if not points:
+            return np.empty(0, dtype=ROW_ID_DTYPE)
+        curve_numbers = np.fromiter(
+            (p.get("curveNumber", 0) for p in points), ROW_ID_DTYPE, len(points)
+        )
+        point_index = np.fromiter(
+            (p.get("pointIndex", p.get("pointNumber", -1)) for p in points),
+            ROW_ID_DTYPE,
+            len(points),
+        )
+        allowed = set(range(self.n_traces) if curves is None else curves)
+        resolved = []
+        for curve in np.unique(curve_numbers).tolist():
+            if curve not in allowed or curve >= self.n_traces:
+                continue
+            rows = self._trace_rows[curve]
+            offsets = self._trace_offsets[curve]
+            n_points = rows.shape[0] if offsets is None else offsets.shape[0] - 1
+            idx = point_index[curve_numbers == curve]
+            idx = idx[(idx >= 0) & (idx < n_points)]
+            if offsets is None:
+                resolved.append(rows[idx])
+            else:
+                resolved.extend(rows[offsets[i] : offsets[i + 1]] for i in idx)
+        if not resolved:
+            return np.empty(0, dtype=ROW_ID_DTYPE)
+        return np.unique(np.concatenate(resolved))
+
+    def resolve_geometry(
+        self, geometry: Optional[dict], curves: Optional[Iterable[int]] = None
+    ) -> np.ndarray:
+        """Resolve a lasso or box outline to a sorted array of row positions.
+
+        `geometry` holds the `lassoPoints` or `range` of a plotly selection. Only
+        rows shown in the (allowed) traces are returned, as with `resolve`. Points
+        of group traces registered with coordinates select all rows of their
+        group when they are inside.
+        """
+        polygon = selection_polygon(geometry)
+        if polygon is None or polygon.shape[0] < 3:
+            return np.empty(0, dtype=ROW_ID_DTYPE)
+        allowed = range(self.n_traces) if curves is None else curves
+        allowed = [c for c in allowed if c < self.n_traces]
+        resolved = [
+            self._group_rows(c, polygon) for c in allowed if self._trace_points[c]
+        ]
+        shown = [self._trace_rows[c] for c in allowed if not self._trace_points[c]]
+        if curves is None and self._area_rows.size:
+            shown.append(self._area_rows)
+        if shown:
+            resolved.append(self._rows_inside(np.concatenate(shown), polygon))
+        if not resolved:
+            return np.empty(0, dtype=ROW_ID_DTYPE)
+        return np.unique(np.concatenate(resolved))
+
+    def _rows_inside(self, shown: np.ndarray, polygon: np.ndarray) -> np.ndarray:
+        if self.spatial_index is not None:
+            inside = self.spatial_index.query_polygon(polygon)
+            return inside[np.isin(inside, shown)]
+        if self.lat is None or self.lon is None:
+            raise ValueError("Resolving geometry needs coordinates or a spatial index.")
+        return shown[points_in_polygon(self.lat[shown], self.lon[shown], polygon)]
+
+    def _group_rows(self, curve_number: int, polygon: np.ndarray) -> np.ndarray:
+        """Rows of the groups of a trace whose point is inside `polygon`."""
+        lat, lon = self._trace_points[curve_number]
+        offsets = self._trace_offsets[curve_number]
+        inside = points_in_polygon(lat, lon, polygon)
+        return self._trace_rows[curve_number][np.repeat(inside, np.diff(offsets))]
+
+    @staticmethod
+    def _as_offsets(
+        offsets: Optional[np.ndarray], rows: np.ndarray
+    ) -> Optional[np.ndarray]:
+        if offsets is None:
+            return None
+        offsets = np.asarray(offsets, dtype=ROW_ID_DTYPE)
+        if offsets.ndim != 1 or offsets[0] != 0 or offsets[-1] != rows.shape[0]:
+            raise ValueError("Offsets have to run from 0 to the number of rows.")
+        return offsets
+
+    @staticmethod
+    def _as_points(
+        offsets: Optional[np.ndarray],
+        lat: Optional[np.ndarray],
+        lon: Optional[np.ndarray],
+    ) -> Optional[tuple]:
+        if lat is None or lon is None:
+            return None
+        if offsets is None:
+            raise ValueError("Point coordinates are only used for group traces.")
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        if lat.shape != lon.shape or lat.shape[0] != len(offsets) - 1:
+            raise ValueError("Point coordinates need one value per group.")
+        return lat, lon
+
+    def _as_positions(self, row_positions: Iterable[int]) -> np.ndarray:
+        positions = np.asarray(row_positions, dtype=ROW_ID_DTYPE)
+        if positions.size and (positions.min() < 0 or positions.max() >= self.n_rows):
+            raise IndexError("Row positions fall outside of the base data.")
+        return positions
+
+
+def group_positions(values: pd.Series) -> List[np.ndarray]:
+    """Row positions per unique value, with groups in order of first appearance."""
+    codes, uniques = pd.factorize(values)
+    if len(uniques) == 0:
+        return []
+    order = np.argsort(codes, kind="stable")
+    order = order[codes[order] >= 0]
+    counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+    return np.split(order, np.cumsum(counts)[:-1])
@@ -0,0 +1,181 @@
+"""
+Bitmap-backed selection of rows.
+
+Selections from the map, the grid and route filters used to be Python sets of
+row ids, merged with `set.update` and written to a `selected` column row by row.
+A `SelectionState` is a NumPy boolean bitmap over the row positions of the base
+data instead: set algebra is vectorised, the number of selected rows is kept up
+to date, and the bitmap packs to one bit per row for serialisation. A content
+`fingerprint` is kept up to date as well, so changes can be detected in O(1).
+"""
+
+from typing import Iterable, Iterator, Optional, Union
+
+import numpy as np
+
+
+class SelectionState:
+    """Selected row positions (`iloc`) of a dataset with `n_rows` rows.
+
+    Supports `|`, `&`, `-` and `~` (union, intersection, difference and
+    inversion) with other selections over the same rows, and `len` in O(1).
+    """
+
+    def __init__(self, n_rows: int, mask: Optional[np.ndarray] = None):
+        if mask is None:
+            mask = np.zeros(n_rows, dtype=bool)
+        elif mask.dtype != bool or mask.shape != (n_rows,):
+            raise ValueError(f"The mask has to be a boolean array of {n_rows} rows.")
+        self._mask = mask
+        self._count = int(np.count_nonzero(mask))
+        self._hash = _hash_positions(np.flatnonzero(mask))
+
+    @classmethod
+    def from_positions(cls, n_rows: int, positions: Iterable[int]) -> "SelectionState":
+        mask = np.zeros(n_rows, dtype=bool)
+        mask[_checked_positions(positions, n_rows)] = True
+        return cls(n_rows, mask)
+
+    @classmethod
+    def from_mask(cls, mask: np.ndarray) -> "SelectionState":
+        mask = np.asarray(mask, dtype=bool)
+        return cls(mask.shape[0], mask.copy())
+
+    @classmethod
+    def from_bytes(cls, data: bytes, n_rows: int) -> "SelectionState":
+        """Inverse of `to_bytes`."""
+        bits = np.unpackbits(np.frombuffer(data, dtype=np.uint8), count=n_rows)
+        return cls(n_rows, bits.astype(bool))
+
+    @property
+    def n_rows(self) -> int:
+        return self._mask.shape[0]
+
+    @property
+    def mask(self) -> np.ndarray:
+        """Read-only boolean mask over the rows."""
+        mask = self._mask.view()
+        mask.flags.writeable = False
+        return mask
+
+    @property
+    def fingerprint(self) -> tuple:
+        """Hashable fingerprint of the selected rows, equal for equal selections.
+
+        An XOR of per-row hashes, updated with every in-place change.
+        """
+        return (self.n_rows, self._count, self._hash)
+
+    def positions(self) -> np.ndarray:
+        """Sorted selected row positions."""
+        return np.flatnonzero(self._mask)
+
+    def to_bytes(self) -> bytes:
+        """The bitmap packed to one bit per row."""
+        return np.packbits(self._mask).tobytes()
+
+    def copy(self) -> "SelectionState":
+        return SelectionState(self.n_rows, self._mask.copy())
+
+    def add(self, positions: Union[Iterable[int], "SelectionState"]) -> bool:
+        """Select rows in place, returning whether the selection changed."""
+        return self.assign(positions, True).size > 0
+
+    def discard(self, positions: Union[Iterable[int], "SelectionState"]) -> bool:
+        """Deselect rows in place, returning whether the selection changed."""
+        return self.assign(positions, False).size > 0
+
+    def assign(
+        self, positions: Union[Iterable[int], "SelectionState"], selected: bool
+    ) -> np.ndarray:
+        """(De)select rows in place, returning the sorted positions that flipped."""
+        if isinstance(positions, SelectionState):
+            flipped = np.flatnonzero(self._other(positions) & (self._mask != selected))
+        else:
+            positions = _checked_positions(positions, self.n_rows)
+            flipped = positions[self._mask[positions] != selected]
+        if flipped.size:
+            self._mask[flipped] = selected
+            self._count += flipped.size if selected else -flipped.size
+            self._hash ^= _hash_positions(flipped)
+        return flipped
+
+    def clear(self) -> bool:
+        changed = self._count > 0
+        self._mask[:] = False
+        self._count = 0
+        self._hash = 0
+        return changed
+
+    def union(self, other: "SelectionState") -> "SelectionState":
+        return SelectionState(self.n_rows, self._mask | self._other(other))
+
+    def intersect(self, other: "SelectionState") -> "SelectionState":
+        return SelectionState(self.n_rows, self._mask & self._other(other))
+
+    def difference(self, other: "SelectionState") -> "SelectionState":
+        return SelectionState(self.n_rows, self._mask & ~self._other(other))
+
+    def invert(self) -> "SelectionState":
+        return SelectionState(self.n_rows, ~self._mask)
+
+    __or__ = union
+    __and__ = intersect
+    __sub__ = difference
+    __invert__ = invert
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __bool__(self) -> bool:
+        return self._count > 0
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.positions().tolist())
+
+    def __contains__(self, position: int) -> bool:
+        return 0 <= position < self.n_rows and bool(self._mask[position])
+
+    def __eq__(self, other) -> bool:
+        return (
+            isinstance(other, SelectionState)
+            and self.fingerprint == other.fingerprint
+            and np.array_equal(self._mask, other._mask)
+        )
+
+    def __repr__(self) -> str:
+        return f"SelectionState({self._count} of {self.n_rows} rows)"
+
+    def __getstate__(self) -> dict:
+        return {"n_rows": self.n_rows, "bits": self.to_bytes()}
+
+    def __setstate__(self, state: dict) -> None:
+        restored = SelectionState.from_bytes(state["bits"], state["n_rows"])
+        self._mask = restored._mask
+        self._count = restored._count
+        self._hash = restored._hash
+
+    def _other(self, other: "SelectionState") -> np.ndarray:
+        if other.n_rows != self.n_rows:
+            raise ValueError("Selections have to be over the same number of rows.")
+        return other._mask
+
+
+def _checked_positions(positions: Iterable[int], n_rows: int) -> np.ndarray:
+    """Sorted unique `positions`, raising `IndexError` outside `[0, n_rows)`."""
+    positions = np.unique(np.asarray(positions, dtype=np.int64))
+    if positions.size and (positions[0] < 0 or positions[-1] >= n_rows):
+        raise IndexError(f"Row positions have to be in [0, {n_rows}).")
+    return positions
+
+
+def _hash_positions(positions: np.ndarray) -> int:
+    """Order independent hash of row positions: XOR of their splitmix64 hashes."""
+    if positions.size == 0:
+        return 0
+    with np.errstate(over="ignore"):
+        z = positions.astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        z = z ^ (z >> np.uint64(31))
+    return int(np.bitwise_xor.reduce(z))
@@ -0,0 +1,153 @@
+"""
+Per-route aggregates of the selected rows, maintained by delta.
+
+Summarising the selection with `groupby("route").agg(...)` over the selected
+rows, plus a second pass for the total row, costs O(selected rows) on every
+rerun. A `SelectionSummary` keeps, per route code, the number of selected rows,
+the sum of a value column and a histogram of an integer bin column (e.g. the
+hour of day). Rows entering or leaving the selection, or moving to another
+route, update these with a `bincount` over the changed rows only.
+"""
+
+import numpy as np
+import pandas as pd
+
+from .route_index import RouteIndex
+
+
+class SelectionSummary:
+    """Count, sum of `values` and histogram of `bins` per route of the selection.
+
+    The routes of added and removed rows are read from `route_index`; route
+    changes of selected rows are passed to `move`. `bins` are non-negative
+    integers.
+    """
+
+    def __init__(
+        self,
+        route_index: RouteIndex,
+        values: np.ndarray,
+        bins: np.ndarray,
+        value_name: str = "value",
+        bin_name: str = "bin",
+    ):
+        self.route_index = route_index
+        self.values = np.asarray(values, dtype=np.float64)
+        self.bins = np.asarray(bins, dtype=np.int64)
+        if self.bins.size and self.bins.min() < 0:
+            raise ValueError("Bins have to be non-negative integers.")
+        self.value_name = value_name
+        self.bin_name = bin_name
+        self.n_bins = int(self.bins.max()) + 1 if self.bins.size else 1
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.sums = np.zeros(0, dtype=np.float64)
+        self.histogram = np.zeros((0, self.n_bins), dtype=np.int64)
+
+    @classmethod
+    def from_frame(
+        cls,
+        data: pd.DataFrame,
+        route_index: RouteIndex,
+        value_col: str,
+        bin_col: str,
+    ) -> "SelectionSummary":
+        return cls(
+            route_index,
+            data[value_col].to_numpy(),
+            data[bin_col].to_numpy(),
+            value_name=value_col,
+            bin_name=bin_col,
+        )
+
+    @property
+    def count(self) -> int:
+        """Number of selected rows."""
+        return int(self.counts.sum())
+
+    def add(self, positions: np.ndarray) -> None:
+        """Count the newly selected rows at `positions`."""
+        positions = np.asarray(positions, dtype=np.int64)
+        self._update(positions, self.route_index.codes[positions], 1)
+
+    def remove(self, positions: np.ndarray) -> None:
+        """Uncount the newly deselected rows at `positions`."""
+        positions = np.asarray(positions, dtype=np.int64)
+        self._update(positions, self.route_index.codes[positions], -1)
+
+    def move(
+        self, positions: np.ndarray, old_codes: np.ndarray, new_codes: np.ndarray
+    ) -> None:
+        """Move the selected rows at `positions` from `old_codes` to `new_codes`."""
+        positions = np.asarray(positions, dtype=np.int64)
+        self._update(positions, np.broadcast_to(old_codes, positions.shape), -1)
+        self._update(positions, np.broadcast_to(new_codes, positions.shape), 1)
+
+    def reset(self) -> None:
+        """Empty the summary, e.g. after clearing the selection."""
+        self.counts[:] = 0
+        self.sums[:] = 0.0
+        self.histogram[:] = 0
+
+    def frame(self, route_col: str = "route") -> pd.DataFrame:
+        """Summary table of the routes with selected rows, with a total row.
+
+        Lists per route the number of selected rows, the sum and average of the
+        values, and the bins present, as `groupby(route).agg(...)` would.
+        """
+        codes = np.flatnonzero(self.counts)
+        codes = np.asarray(
+            sorted(codes.tolist(), key=lambda c: str(self.route_index.name(c))),
+            dtype=np.int64,
+        )
+        counts = self.counts[codes]
+        sums = self.sums[codes]
+        summary = pd.DataFrame(
+            {
+                route_col: [self.route_index.name(code) for code in codes.tolist()],
+                "n_selected": counts,
+                f"sum_{self.value_name}": sums,
+                f"average_{self.value_name}": sums / np.maximum(counts, 1),
+                f"{self.bin_name}s": [
+                    np.flatnonzero(self.histogram[code]).tolist()
+                    for code in codes.tolist()
+                ],
+            }
+        )
+        if codes.size:
+            total = pd.DataFrame(
+                {
+                    route_col: [codes.size],
+                    "n_selected": [counts.sum()],
+                    f"sum_{self.value_name}": [sums.sum()],
+                    f"average_{self.value_name}": [sums.sum() / counts.sum()],
+                    f"{self.bin_name}s": [
+                        np.count_nonzero(self.histogram[codes].sum(axis=0))
+                    ],
+                },
+                index=["Total/average"],
+            )
+            summary = pd.concat([summary, total])
+        return summary
+
+    def _update(self, positions: np.ndarray, codes: np.ndarray, sign: int) -> None:
+        if positions.size == 0:
+            return
+        self._grow(self.route_index.n_codes)
+        n_codes = self.counts.shape[0]
+        self.counts += sign * np.bincount(codes, minlength=n_codes)
+        self.sums += sign * np.bincount(
+            codes, weights=self.values[positions], minlength=n_codes
+        )
+        cells = codes.astype(np.int64) * self.n_bins + self.bins[positions]
+        self.histogram += sign * np.bincount(
+            cells, minlength=n_codes * self.n_bins
+        ).reshape(n_codes, self.n_bins)
+
+    def _grow(self, n_codes: int) -> None:
+        extra = n_codes - self.counts.shape[0]
+        if extra > 0:
+            self.counts = np.concatenate([self.counts, np.zeros(extra, np.int64)])
+            self.sums = np.concatenate([self.sums, np.zeros(extra, np.float64)])
+            self.histogram = np.vstack(
+                [self.histogram, np.zeros((extra, self.n_bins), np.int64)]
+            )
@@ -0,0 +1,225 @@
+"""
+Uniform grid spatial index over point coordinates.
+
+Points are bucketed into a uniform lon/lat grid, sized to hold a few dozen points
+per cell, and stored sorted by cell. Bounding box, radius and polygon queries
+only look at the points in the cells that overlap the query, instead of
+comparing every row of the data. Build the index once per dataset (e.g. in a
+`st.experimental_singleton`) and share it between sessions; it is read-only.
+"""
+
+import math
+from typing import Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from .viewport import Viewport, mercator_xy
+
+EARTH_RADIUS_M = 6371008.8
+POINTS_PER_CELL = 32
+STRATIFIED_CELLS = 64
+STRATIFIED_SAMPLE_POINTS = 50_000
+
+
+class GridIndex:
+    """Uniform grid over lon/lat, answering bbox, radius and polygon queries.
+
+    Query results are sorted arrays of row positions (`iloc`) of the indexed data.
+    """
+
+    def __init__(
+        self, lat: np.ndarray, lon: np.ndarray, points_per_cell: int = POINTS_PER_CELL
+    ):
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        valid = np.flatnonzero(np.isfinite(self.lat) & np.isfinite(self.lon))
+        self.n_points = self.lat.shape[0]
+
+        if valid.size:
+            self.min_lon, self.max_lon = self.lon[valid].min(), self.lon[valid].max()
+            self.min_lat, self.max_lat = self.lat[valid].min(), self.lat[valid].max()
+        else:
+            self.min_lon = self.max_lon = self.min_lat = self.max_lat = 0.0
+        n_cells = max(valid.size // points_per_cell, 1)
+        width = max(self.max_lon - self.min_lon, 1e-9)
+        height = max(self.max_lat - self.min_lat, 1e-9)
+        # Square-ish cells in degrees, n_lon * n_lat ~ n_cells. Cells span at
+        # least 1 / n_cells of the larger extent, so points along one latitude
+        # or longitude (a near zero extent) give ~n_cells cells, not billions.
+        self.cell_size = max(
+            math.sqrt(width * height / n_cells), max(width, height) / n_cells
+        )
+        self.n_lon = int(width // self.cell_size) + 1
+        self.n_lat = int(height // self.cell_size) + 1
+
+        cells = self._cell_lon(self.lon[valid]) * self.n_lat + self._cell_lat(
+            self.lat[valid]
+        )
+        order = np.argsort(cells, kind="stable")
+        self._positions = valid[order]
+        self._cell_starts = np.zeros(self.n_lon * self.n_lat + 1, dtype=np.int64)
+        np.cumsum(
+            np.bincount(cells, minlength=self.n_lon * self.n_lat),
+            out=self._cell_starts[1:],
+        )
+
+    @classmethod
+    def from_frame(
+        cls, data: pd.DataFrame, lat_col: str, lon_col: str, **kwargs
+    ) -> "GridIndex":
+        return cls(data[lat_col].to_numpy(), data[lon_col].to_numpy(), **kwargs)
+
+    def query_bbox(self, viewport: Viewport) -> np.ndarray:
+        """Positions of the points inside the bounds of `viewport`."""
+        candidates = self._candidates(viewport)
+        inside = viewport.contains(self.lat[candidates], self.lon[candidates])
+        return np.sort(candidates[inside])
+
+    def query_radius(self, lat: float, lon: float, radius_m: float) -> np.ndarray:
+        """Positions of the points within `radius_m` metres of (`lat`, `lon`)."""
+        d_lat = math.degrees(radius_m / EARTH_RADIUS_M)
+        cos_lat = max(math.cos(math.radians(lat)), 1e-9)
+        d_lon = min(d_lat / cos_lat, 180.0)
+        candidates = self._candidates(
+            Viewport(lon - d_lon, lon + d_lon, lat - d_lat, lat + d_lat)
+        )
+        distance = haversine_m(lat, lon, self.lat[candidates], self.lon[candidates])
+        return np.sort(candidates[distance <= radius_m])
+
+    def query_polygon(self, polygon: Sequence[Sequence[float]]) -> np.ndarray:
+        """Positions of the points inside `polygon`, a sequence of [lon, lat] vertices."""
+        polygon = np.asarray(polygon, dtype=np.float64)
+        if polygon.ndim != 2 or polygon.shape[0] < 3:
+            return np.empty(0, dtype=np.int64)
+        candidates = self._candidates(
+            Viewport(
+                polygon[:, 0].min(),
+                polygon[:, 0].max(),
+                polygon[:, 1].min(),
+                polygon[:, 1].max(),
+            )
+        )
+        inside = points_in_polygon(self.lat[candidates], self.lon[candidates], polygon)
+        return np.sort(candidates[inside])
+
+    def _cell_lon(self, lon: np.ndarray) -> np.ndarray:
+        cells = ((lon - self.min_lon) // self.cell_size).astype(np.int64)
+        return np.clip(cells, 0, self.n_lon - 1)
+
+    def _cell_lat(self, lat: np.ndarray) -> np.ndarray:
+        cells = ((lat - self.min_lat) // self.cell_size).astype(np.int64)
+        return np.clip(cells, 0, self.n_lat - 1)
+
+    def _candidates(self, viewport: Viewport) -> np.ndarray:
+        """Positions of the points in the cells overlapping `viewport`."""
+        if (
+            self._positions.size == 0
+            or viewport.max_lon < self.min_lon
+            or viewport.min_lon > self.max_lon
+            or viewport.max_lat < self.min_lat
+            or viewport.min_lat > self.max_lat
+        ):
+            return np.empty(0, dtype=np.int64)
+        lon0, lon1 = self._cell_lon(np.array([viewport.min_lon, viewport.max_lon]))
+        lat0, lat1 = self._cell_lat(np.array([viewport.min_lat, viewport.max_lat]))
+        # Cells of one grid column are contiguous, so each column is one slice.
+        columns = np.arange(lon0, lon1 + 1) * self.n_lat
+        starts = self._cell_starts[columns + lat0]
+        ends = self._cell_starts[columns + lat1 + 1]
+        return np.concatenate(
+            [self._positions[start:end] for start, end in zip(starts, ends)]
+        )
+
+
+def points_in_polygon(
+    lat: np.ndarray, lon: np.ndarray, polygon: Sequence[Sequence[float]]
+) -> np.ndarray:
+    """Boolean mask of the points inside `polygon` ([lon, lat] vertices).
+
+    Even-odd ray casting, vectorised over the points, one pass per polygon edge.
+    """
+    polygon = np.asarray(polygon, dtype=np.float64)
+    inside = np.zeros(np.shape(lat), dtype=bool)
+    x0, y0 = polygon[-1]
+    for x1, y1 in polygon:
+        crosses = (y0 > lat) != (y1 > lat)
+        if crosses.any():
+            with np.errstate(divide="ignore", invalid="ignore"):
+                x_cross = x0 + (lat - y0) * (x1 - x0) / (y1 - y0)
+            inside ^= crosses & (lon < x_cross)
+        x0, y0 = x1, y1
+    return inside
+
+
+def haversine_m(
+    lat: float, lon: float, lats: np.ndarray, lons: np.ndarray
+) -> np.ndarray:
+    """Great-circle distance in metres from (`lat`, `lon`) to each point."""
+    lat, lon = math.radians(lat), math.radians(lon)
+    lats, lons = np.radians(lats), np.radians(lons)
+    a = (
+        np.sin((lats - lat) / 2) ** 2
+        + math.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def selection_polygon(selected: Optional[dict]) -> Optional[np.ndarray]:
+    """Polygon ([lon, lat] vertices) of a plotly map box or lasso selection.
+
+    Reads `lassoPoints` or `range` of plotly's `selectedData`, `None` if absent.
+    """
+    if not selected:
+        return None
+    lasso = (selected.get("lassoPoints") or {}).get("mapbox")
+    if lasso:
+        return np.asarray(lasso, dtype=np.float64)
+    box = (selected.get("range") or {}).get("mapbox")
+    if box:
+        (lon0, lat0), (lon1, lat1) = box
+        return np.array(
+            [[lon0, lat0], [lon1, lat0], [lon1, lat1], [lon0, lat1]], dtype=np.float64
+        )
+    return None
+
+
+def stratified_order(
+    lat: np.ndarray,
+    lon: np.ndarray,
+    cells: int = STRATIFIED_CELLS,
+    seed: int = 0,
+    sample: Optional[int] = None,
+) -> np.ndarray:
+    """Order of points in which every prefix is a spatially stratified sample.
+
+    Points are binned into a `cells` x `cells` mercator grid over their extent,
+    and taken round-robin over the cells, in a random (but fixed) order per cell.
+    With `sample`, only a random sample of `sample` points is ordered this way,
+    followed by the other points in random order, so ordering many points stays
+    cheap and every prefix is still representative of the data.
+    """
+    n_points = lat.shape[0]
+    if n_points == 0:
+        return np.empty(0, dtype=np.int64)
+    order = np.random.default_rng(seed).permutation(n_points)
+    if sample is None:
+        sample = n_points
+    head, rest = order[:sample], order[sample:]
+    x, y = mercator_xy(
+        np.asarray(lat, np.float64)[head], np.asarray(lon, np.float64)[head]
+    )
+    cell = _bin(x, cells) * cells + _bin(y, cells)
+    by_cell = np.argsort(cell, kind="stable")
+    starts = np.searchsorted(cell[by_cell], cell[by_cell], side="left")
+    rank = np.arange(head.shape[0]) - starts
+    return np.concatenate((head[by_cell[np.argsort(rank, kind="stable")]], rest))
+
+
+def _bin(values: np.ndarray, n_bins: int) -> np.ndarray:
+    low, high = np.nanmin(values), np.nanmax(values)
+    if not high > low:
+        return np.zeros(values.shape[0], dtype=np.int64)
+    # Points without coordinates (NaN) go to the first bin.
+    bins = np.nan_to_num((values - low) / (high - low) * n_bins).astype(np.int64)
+    return np.clip(bins, 0, n_bins - 1)
@@ -0,0 +1,168 @@
+"""
+Map viewport bounds and viewport culling.
+
+In viewport mode only the points inside the current map bounds, plus a margin,
+are sent to the map. The bounds come from the relayout events of the map
+(`mapbox._derived.coordinates`), or are estimated from the stored map center and
+zoom. The `ViewportCuller` pages points in and out: it only moves the culled
+region when the view leaves it, or when zooming in makes it much too large.
+"""
+
+import math
+from typing import Optional
+
+import numpy as np
+
+# mapbox-gl renders the world as 512 pixel tiles at zoom level 0.
+TILE_SIZE = 512
+MAX_MERCATOR_LAT = 85.0511
+
+
+class Viewport:
+    """Latitude and longitude bounds of (part of) the map."""
+
+    def __init__(self, min_lon: float, max_lon: float, min_lat: float, max_lat: float):
+        if min_lon > max_lon or min_lat > max_lat:
+            raise ValueError("Viewport minimum bounds exceed the maximum bounds.")
+        self.min_lon = min_lon
+        self.max_lon = max_lon
+        self.min_lat = min_lat
+        self.max_lat = max_lat
+
+    def __repr__(self) -> str:
+        return (
+            f"Viewport(min_lon={self.min_lon}, max_lon={self.max_lon}, "
+            f"min_lat={self.min_lat}, max_lat={self.max_lat})"
+        )
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Viewport) and self.key == other.key
+
+    def __hash__(self) -> int:
+        return hash(self.key)
+
+    @property
+    def key(self) -> tuple:
+        return (self.min_lon, self.max_lon, self.min_lat, self.max_lat)
+
+    @property
+    def width(self) -> float:
+        return self.max_lon - self.min_lon
+
+    @property
+    def height(self) -> float:
+        return self.max_lat - self.min_lat
+
+    @classmethod
+    def from_derived(cls, coordinates: list) -> "Viewport":
+        """From the `mapbox._derived.coordinates` corners of a relayout event."""
+        lons = [corner[0] for corner in coordinates]
+        lats = [corner[1] for corner in coordinates]
+        return cls(min(lons), max(lons), min(lats), max(lats))
+
+    @classmethod
+    def from_center_zoom(
+        cls, center: dict, zoom: float, width_px: int = 1000, height_px: int = 500
+    ) -> "Viewport":
+        """Estimate the bounds of a `width_px` by `height_px` map in web mercator."""
+        world_px = TILE_SIZE * 2**zoom
+        half_lon = width_px / world_px * 180
+        center_y = _mercator_y(center["lat"])
+        half_y = height_px / world_px * math.pi
+        return cls(
+            center["lon"] - half_lon,
+            center["lon"] + half_lon,
+            _mercator_lat(center_y - half_y),
+            _mercator_lat(center_y + half_y),
+        )
+
+    @classmethod
+    def from_relayout(
+        cls, relayout: Optional[dict], width_px: int = 1000, height_px: int = 500
+    ) -> Optional["Viewport"]:
+        """From a relayout event of the map component, `None` if it has no view."""
+        if not relayout:
+            return None
+        derived = (relayout.get("raw") or {}).get("mapbox._derived")
+        if derived and derived.get("coordinates"):
+            return cls.from_derived(derived["coordinates"])
+        if relayout.get("center") and relayout.get("zoom") is not None:
+            return cls.from_center_zoom(
+                relayout["center"], relayout["zoom"], width_px, height_px
+            )
+        return None
+
+    def expand(self, margin: float) -> "Viewport":
+        """Grow the bounds by `margin` times their width and height on each side."""
+        d_lon = self.width * margin
+        d_lat = self.height * margin
+        return Viewport(
+            self.min_lon - d_lon,
+            self.max_lon + d_lon,
+            max(self.min_lat - d_lat, -90.0),
+            min(self.max_lat + d_lat, 90.0),
+        )
+
+    def contains(self, lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+        """Boolean mask of the points inside the bounds."""
+        return (
+            (lon >= self.min_lon)
+            & (lon <= self.max_lon)
+            & (lat >= self.min_lat)
+            & (lat <= self.max_lat)
+        )
+
+    def covers(self, other: "Viewport") -> bool:
+        """Whether `other` lies completely inside the bounds."""
+        return (
+            self.min_lon <= other.min_lon
+            and other.max_lon <= self.max_lon
+            and self.min_lat <= other.min_lat
+            and other.max_lat <= self.max_lat
+        )
+
+
+class ViewportCuller:
+    """Decides which region of the map to send points for.
+
+    The culled region is the view expanded by `margin`. It is kept while the
+    view stays inside it and is not more than `max_zoom_in` times smaller than
+    the region, so small pans do not resend any points.
+    """
+
+    def __init__(self, margin: float = 0.5, max_zoom_in: float = 16.0):
+        self.margin = margin
+        self.max_zoom_in = max_zoom_in
+        self.region: Optional[Viewport] = None
+
+    def update(self, view: Optional[Viewport]) -> Optional[Viewport]:
+        """Culled region for the current `view`, `None` if the view is unknown."""
+        if view is None:
+            return self.region
+        if self.region is not None and self.region.covers(view):
+            view_area = view.width * view.height
+            region_area = self.region.width * self.region.height
+            if view_area * self.max_zoom_in >= region_area:
+                return self.region
+        self.region = view.expand(self.margin)
+        return self.region
+
+    def reset(self) -> None:
+        self.region = None
+
+
+def mercator_xy(lat: np.ndarray, lon: np.ndarray) -> tuple:
+    """Web mercator coordinates, scaled to [0, 1] with y = 0 at the top."""
+    x = (lon + 180.0) / 360.0
+    sin_lat = np.clip(np.sin(np.radians(lat)), -0.9999, 0.9999)
+    y = 0.5 - np.log((1 + sin_lat) / (1 - sin_lat)) / (4 * np.pi)
+    return x, y
+
+
+def _mercator_y(lat: float) -> float:
+    lat = max(min(lat, MAX_MERCATOR_LAT), -MAX_MERCATOR_LAT)
+    return math.log(math.tan(math.pi / 4 + math.radians(lat) / 2))
+
+
+def _mercator_lat(y: float) -> float:
+    return math.degrees(2 * math.atan(math.exp(y)) - math.pi / 2)
@@ -0,0 +1,6 @@
+"""Makes `bi_comms_plotly_map` importable from `src` when running the tests."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from bi_comms_plotly_map.cache import CacheSizeWarning, LRUCache, nbytes
+
+
+def test_evicts_least_recently_used_first():
+    cache = LRUCache(max_bytes=30, sizeof=lambda value: 10)
+    for key in "abc":
+        cache.put(key, key)
+    assert cache.get("a") == "a"
+    cache.put("d", "d")
+    assert "b" not in cache
+    assert [key in cache for key in "acd"] == [True, True, True]
+    assert cache.stats["evictions"] == 1
+    assert cache.nbytes == 30
+
+
+def test_max_entries():
+    cache = LRUCache(max_bytes=100, max_entries=2, sizeof=lambda value: 1)
+    for key in "abc":
+        cache.put(key, key)
+    assert len(cache) == 2
+    assert "a" not in cache
+
+
+def test_get_or_build_counts_hits_and_misses():
+    cache = LRUCache(max_bytes=100, sizeof=lambda value: 1)
+    builds = []
+    for _ in range(3):
+        cache.get_or_build("a", lambda: builds.append(1) or "value")
+    assert builds == [1]
+    assert cache.stats["hits"] == 2
+    assert cache.stats["misses"] == 1
+
+
+def test_values_larger_than_the_cache_are_rejected():
+    cache = LRUCache(max_bytes=10, sizeof=len)
+    cache.put("small", "x" * 5)
+    with pytest.warns(CacheSizeWarning):
+        cache.put("large", "x" * 11)
+    assert "large" not in cache
+    assert "small" in cache
+    assert cache.stats["rejected"] == 1
+
+
+def test_pop_and_clear():
+    cache = LRUCache(max_bytes=10, sizeof=len)
+    cache.put("a", "xx")
+    cache.put("b", "xxx")
+    assert cache.pop("a") == "xx"
+    assert cache.pop("a") is None
+    assert cache.nbytes == 3
+    cache.clear()
+    assert len(cache) == 0 and cache.nbytes == 0
+
+
+def test_nbytes():
+    assert nbytes(np.zeros(10)) == 80
+    assert nbytes({"a": np.zeros(2, dtype=np.int32), "bc": "xyz"}) == 1 + 8 + 2 + 3
+    strings = np.array(["x" * 100] * 5000, dtype=object)
+    assert nbytes(strings) > 5000 * 100
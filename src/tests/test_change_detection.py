@@ -0,0 +1,51 @@
+import numpy as np
+
+from bi_comms_plotly_map.change_detection import ChangeTracker, fingerprint
+from bi_comms_plotly_map.selection_state import SelectionState
+
+
+def test_additions_and_removals_are_changes():
+    tracker = ChangeTracker()
+    selection = SelectionState.from_positions(10, [1, 2])
+    assert tracker.update("map", selection.copy())
+    assert not tracker.update("map", selection.copy())
+    selection.discard([2])
+    assert tracker.update("map", selection.copy())
+    selection.clear()
+    assert tracker.update("map", selection)
+    assert tracker.version("map") == 3
+
+
+def test_empty_first_values_are_not_changes():
+    tracker = ChangeTracker()
+    assert not tracker.update("map", SelectionState(10))
+    assert not tracker.update("grid", [])
+    assert not tracker.update("view", None)
+    assert tracker.update_all({"map": SelectionState(10), "zoom": 11}) == ["zoom"]
+    assert tracker.key(["map", "zoom", "unknown"]) == (0, 1, 0)
+
+
+def test_reset_makes_the_next_value_a_change():
+    tracker = ChangeTracker()
+    tracker.update("a", [1])
+    tracker.update("b", [2])
+    key = tracker.key(["a", "b"])
+    tracker.reset(["a"])
+    assert tracker.key(["a", "b"]) != key
+    assert tracker.update("a", [1])
+    assert not tracker.update("b", [2])
+    tracker.reset()
+    assert tracker.update("b", [2])
+
+
+def test_fingerprints():
+    assert fingerprint({"b": [1, 2], "a": {3}}) == fingerprint({"a": {3}, "b": (1, 2)})
+    assert fingerprint({1, 2, 3}) == fingerprint({3, 2, 1})
+    assert fingerprint([1, 2]) != fingerprint([2, 1])
+    assert fingerprint(np.arange(3)) == fingerprint(np.arange(3))
+    assert fingerprint(np.arange(3)) != fingerprint(np.arange(3, dtype=np.int8))
+    assert fingerprint(float("nan")) == fingerprint(float("nan"))
+    a = SelectionState.from_positions(10, [1, 5])
+    b = SelectionState(10)
+    b.add([5, 1])
+    assert fingerprint(a) == fingerprint(b)
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from bi_comms_plotly_map.clustering import ClusterPyramid
+from bi_comms_plotly_map.viewport import Viewport
+
+
+def _points(n_points=2000):
+    rng = np.random.default_rng(0)
+    lat = rng.normal(52.5, 0.5, n_points)
+    lon = rng.normal(13.4, 0.8, n_points)
+    lat[::101] = np.nan
+    return lat, lon
+
+
+def _cluster_rows(pyramid, level, mask=None):
+    return [pyramid.members(level, [c], mask) for c in range(len(level))]
+
+
+def test_every_level_partitions_the_valid_points():
+    lat, lon = _points()
+    pyramid = ClusterPyramid(lat, lon, max_zoom=10)
+    valid = np.flatnonzero(np.isfinite(lat))
+    sizes = [len(level) for level in pyramid.levels]
+    assert sizes == sorted(sizes) and sizes[0] < sizes[-1]
+    for level in pyramid.levels:
+        rows = np.concatenate(_cluster_rows(pyramid, level))
+        np.testing.assert_array_equal(np.sort(rows), valid)
+        assert level.count.sum() == valid.size
+
+
+def test_clusters_aggregate_their_members():
+    lat, lon = _points()
+    weights = np.random.default_rng(1).random(lat.shape[0])
+    pyramid = ClusterPyramid(lat, lon, weights, max_zoom=8)
+    level = pyramid.level(5.7)
+    assert level.zoom == 5
+    assert pyramid.level(-1).zoom == 0 and pyramid.level(30).zoom == 8
+    for i, rows in enumerate(_cluster_rows(pyramid, level)):
+        assert level.count[i] == rows.size
+        assert level.weight[i] == pytest.approx(weights[rows].sum())
+        assert level.lat[i] == pytest.approx(lat[rows].mean())
+        assert level.lon[i] == pytest.approx(lon[rows].mean())
+
+
+def test_masked_clusters_are_recomputed():
+    lat, lon = _points()
+    pyramid = ClusterPyramid(lat, lon, max_zoom=8)
+    mask = np.zeros(lat.shape[0], dtype=bool)
+    mask[::3] = True
+    level = pyramid.clusters(6, mask=mask)
+    assert (level.count > 0).all()
+    rows = _cluster_rows(pyramid, level, mask)
+    np.testing.assert_array_equal(
+        np.sort(np.concatenate(rows)), np.flatnonzero(mask & np.isfinite(lat))
+    )
+    for i, members in enumerate(rows):
+        assert level.count[i] == members.size
+        assert level.lat[i] == pytest.approx(lat[members].mean())
+
+
+def test_clusters_in_a_viewport():
+    lat, lon = _points()
+    pyramid = ClusterPyramid(lat, lon, max_zoom=8)
+    viewport = Viewport(13.0, 14.0, 52.0, 53.0)
+    level = pyramid.clusters(6, viewport=viewport)
+    assert 0 < len(level) < len(pyramid.level(6))
+    assert viewport.contains(level.lat, level.lon).all()
+
+
+def test_empty_and_invalid_pyramids():
+    pyramid = ClusterPyramid(np.array([np.nan]), np.array([1.0]), max_zoom=2)
+    assert [len(level) for level in pyramid.levels] == [0, 0, 0]
+    assert pyramid.members(pyramid.level(1), []).size == 0
+    with pytest.raises(ValueError):
+        ClusterPyramid(np.zeros(1), np.zeros(1), cell_px=48)
+    with pytest.raises(ValueError):
+        ClusterPyramid(np.zeros(1), np.zeros(1), max_zoom=40)
@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from bi_comms_plotly_map import component
+from bi_comms_plotly_map.figure_manager import FigureManager
+
+
+@pytest.fixture
+def session_state(monkeypatch):
+    """A plain dict as Session State, and a frontend that returns no events."""
+    state = {}
+    monkeypatch.setattr(component.st, "session_state", state)
+    monkeypatch.setattr(component, "_component_func", lambda **kwargs: None)
+    return state
+
+
+def _update():
+    data = pd.DataFrame({"route": ["a", "b"], "lat": [52.5, 52.6], "lon": [13.4, 13.5]})
+    manager = FigureManager("lat", "lon", "route", validate=False)
+    manager.set_data(data, data_version=0)
+    return manager.build()
+
+
+def test_state_is_kept_per_key(session_state):
+    update = _update()
+    events = component.plotly_map(update, key="map")
+    assert events["event_id"] == 0 and not events["loading"]
+    assert list(session_state) == [component.STATE_KEY]
+    stats = component.return_payload_stats("map")
+    assert stats["version"] == 1 and stats["full"]
+    assert component.return_selection_index("map", 1) is update.selection_index
+    assert component.return_selection_index("map", 2) is None
+    assert component.return_loading_progress("map") == (0, 0)
+    assert component.return_payload_stats("other") is None
+
+
+def test_state_of_keys_not_rendered_is_dropped(session_state):
+    update = _update()
+    states = lambda: sorted(session_state[component.STATE_KEY])  # noqa: E731
+    # Two maps rendered in every run keep their state.
+    for _ in range(3):
+        component.plotly_map(update, key="a")
+        component.plotly_map(update, key="b")
+    assert states() == ["a", "b"]
+    # After a key change, the old key is dropped by the next map rendered.
+    component.plotly_map(update, key="a1")
+    assert states() == ["a", "a1", "b"]
+    component.plotly_map(update, key="b")
+    assert states() == ["a1", "b"]
+
+
+def test_state_of_a_changed_key_is_dropped(session_state):
+    update = _update()
+    for key in ["map0", "map1", "map1"]:
+        component.plotly_map(update, key=key)
+    assert list(session_state[component.STATE_KEY]) == ["map1"]
+
+
+def test_selection_indexes_are_bounded(session_state):
+    manager = FigureManager("lat", "lon", "route", validate=False)
+    rng = np.random.default_rng(0)
+    data = pd.DataFrame(
+        {"route": ["a"] * 10, "lat": rng.random(10), "lon": rng.random(10)}
+    )
+    manager.set_data(data, data_version=0)
+    for i in range(component.SELECTION_INDEX_VERSIONS + 2):
+        component.plotly_map(manager.build(selected=[i]), key="map")
+    assert component.return_selection_index("map", 1) is None
+    last = component.SELECTION_INDEX_VERSIONS + 2
+    assert component.return_selection_index("map", last) is not None
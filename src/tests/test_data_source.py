@@ -0,0 +1,112 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from bi_comms_plotly_map.data_source import (
+    ArrowSource,
+    DataSource,
+    FrameSource,
+    ParquetSource,
+)
+from bi_comms_plotly_map.viewport import Viewport
+
+BBOX = Viewport(13.3, 13.5, 52.4, 52.6)
+
+
+def _frame(n_rows=1000):
+    rng = np.random.default_rng(0)
+    data = pd.DataFrame(
+        {
+            "route": rng.choice(["a", "b", "c", "d"], n_rows),
+            "lat": rng.normal(52.5, 0.2, n_rows),
+            "lon": rng.normal(13.4, 0.3, n_rows),
+            "value": rng.random(n_rows),
+        }
+    )
+    # Sorted by route, so row groups hold few routes and can be skipped.
+    return data.sort_values("route", kind="stable", ignore_index=True)
+
+
+def _expected(data, columns, routes=None, bbox=None):
+    mask = np.ones(data.shape[0], dtype=bool)
+    if routes is not None:
+        mask &= data["route"].isin(routes).to_numpy()
+    if bbox is not None:
+        mask &= bbox.contains(data["lat"].to_numpy(), data["lon"].to_numpy())
+    return data.loc[mask, columns].reset_index(drop=True)
+
+
+@pytest.fixture(params=["frame", "parquet", "arrow"])
+def source(request, tmp_path):
+    data = _frame()
+    if request.param == "frame":
+        return FrameSource(data, "lat", "lon", "route")
+    pa = pytest.importorskip("pyarrow")
+    pq = pytest.importorskip("pyarrow.parquet")
+    table = pa.Table.from_pandas(data, preserve_index=False)
+    path = str(tmp_path / "data")
+    if request.param == "parquet":
+        pq.write_table(table, path, row_group_size=100)
+        return ParquetSource(path, "lat", "lon", "route")
+    with pa.ipc.new_file(path, table.schema) as writer:
+        writer.write_table(table)
+    return ArrowSource(path, "lat", "lon", "route")
+
+
+def test_read(source):
+    data = _frame()
+    assert source.columns == list(data.columns)
+    assert source.n_rows == data.shape[0]
+    pd.testing.assert_frame_equal(source.read(), data)
+
+
+def test_read_projection(source):
+    read = source.read(["value", "lat"])
+    pd.testing.assert_frame_equal(read, _frame()[["value", "lat"]])
+
+
+@pytest.mark.parametrize(
+    "routes, bbox", [(["b", "d"], None), (None, BBOX), (["a", "c"], BBOX)]
+)
+def test_read_filtered(source, routes, bbox):
+    expected = _expected(_frame(), ["value"], routes, bbox)
+    assert 0 < expected.shape[0] < source.n_rows
+    pd.testing.assert_frame_equal(source.read(["value"], routes, bbox), expected)
+
+
+def test_read_no_routes(source):
+    read = source.read(["value"], routes=[])
+    assert read.shape == (0, 1)
+
+
+def test_route_filter_needs_route_col(source):
+    source.route_col = None
+    with pytest.raises(ValueError):
+        source.read(routes=["a"])
+
+
+def test_parquet_row_groups_are_pruned(tmp_path):
+    pa = pytest.importorskip("pyarrow")
+    pq = pytest.importorskip("pyarrow.parquet")
+    data = _frame()
+    path = str(tmp_path / "data.parquet")
+    pq.write_table(
+        pa.Table.from_pandas(data, preserve_index=False), path, row_group_size=100
+    )
+    source = ParquetSource(path, "lat", "lon", "route")
+    groups = source.row_groups(routes=["b"])
+    route_of_group = data["route"].groupby(np.arange(data.shape[0]) // 100)
+    assert groups == [i for i, routes in route_of_group if "b" in set(routes.tolist())]
+    assert 0 < len(groups) < source.file.metadata.num_row_groups
+    assert source.row_groups(bbox=Viewport(0.0, 1.0, 0.0, 1.0)) == []
+    assert source.row_groups() == list(range(10))
+
+
+def test_sources_implement_the_interface():
+    class ColumnsOnly(DataSource):
+        @property
+        def columns(self):
+            return ["lat", "lon"]
+
+    with pytest.raises(TypeError):
+        ColumnsOnly("lat", "lon")
@@ -0,0 +1,75 @@
+import base64
+import json
+
+import numpy as np
+
+from bi_comms_plotly_map.encoding import (
+    TraceJSONCache,
+    dumps,
+    encode_array,
+    encode_typed_arrays,
+)
+
+
+def _decode(spec):
+    dtype = np.dtype(spec["dtype"]).newbyteorder("<")
+    values = np.frombuffer(base64.b64decode(spec["bdata"]), dtype=dtype)
+    if "shape" in spec:
+        values = values.reshape([int(n) for n in spec["shape"].split(",")])
+    return values
+
+
+def test_arrays_round_trip():
+    for values in [
+        np.array([1.5, -2.25, 3.0]),
+        np.array([1, 2, 3], dtype=np.uint8),
+        np.arange(6, dtype=np.int16).reshape(2, 3),
+    ]:
+        spec = encode_array(values)
+        assert spec["dtype"] == values.dtype.str[1:]
+        np.testing.assert_array_equal(_decode(spec), values)
+    assert encode_array(np.array(["a", "b"], dtype=object)) is None
+    assert encode_array(np.array([], dtype=np.float64)) is None
+
+
+def test_64_bit_integers_are_narrowed():
+    assert encode_array(np.array([1, -2], dtype=np.int64))["dtype"] == "i4"
+    wide = np.array([1, 2**40], dtype=np.int64)
+    spec = encode_array(wide)
+    assert spec["dtype"] == "f8"
+    np.testing.assert_array_equal(_decode(spec), wide)
+
+
+def test_only_coordinates_are_sent_as_float32():
+    values = np.array([52.123456789, 13.1])
+    trace = {"lat": values, "marker": {"size": values}, "text": ["a", "b"]}
+    encoded = encode_typed_arrays(trace)
+    assert encoded["lat"]["dtype"] == "f4"
+    assert encoded["marker"]["size"]["dtype"] == "f8"
+    assert encoded["text"] == ["a", "b"]
+    assert encode_typed_arrays(trace, float32_coordinates=False)["lat"]["dtype"] == "f8"
+    assert trace["lat"] is values
+
+
+def test_dumps_with_and_without_typed_arrays():
+    message = {"figure": {"data": [{"lat": np.array([1.0, 2.0]), "name": "a"}]}}
+    plain = json.loads(dumps(message, binary=False))
+    assert plain["figure"]["data"][0]["lat"] == [1.0, 2.0]
+    binary = json.loads(dumps(message))
+    np.testing.assert_array_equal(_decode(binary["figure"]["data"][0]["lat"]), [1, 2])
+
+
+def test_cached_trace_json_matches_a_plain_dump():
+    traces = [{"lat": np.array([1.0, 2.0]), "name": "a"}, {"name": "Selected"}]
+    message = {"version": 2, "figure": {"data": traces, "layout": {}}}
+    ops = {"ops": [{"op": "replace_trace", "index": 0, "trace": traces[0]}]}
+    cache = TraceJSONCache()
+    keys = {id(traces[0]): ("route", "a")}
+    for binary in (True, False):
+        for msg in (message, ops):
+            expected = json.loads(dumps(msg, binary=binary))
+            for _ in range(2):
+                payload = dumps(msg, binary, trace_cache=cache, trace_keys=keys)
+                assert json.loads(payload) == expected
+    # One entry per encoding, each reused by the later dumps.
+    assert cache.stats["entries"] == 2 and cache.stats["misses"] == 2
@@ -0,0 +1,157 @@
+import json
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import plotly.io as pio
+import pytest
+
+from bi_comms_plotly_map.cache import LRUCache
+from bi_comms_plotly_map.figure_manager import (
+    TRACE_CACHE_BYTES,
+    TRACE_CACHE_FIGURES,
+    FigureManager,
+)
+from bi_comms_plotly_map.viewport import Viewport
+
+
+def _data(n_rows=3000):
+    rng = np.random.default_rng(0)
+    return pd.DataFrame(
+        {
+            "route": rng.choice(["a", "b", "c"], n_rows),
+            "lat": rng.normal(52.5, 0.2, n_rows),
+            "lon": rng.normal(13.4, 0.3, n_rows),
+            "weight": rng.random(n_rows) + 1.0,
+            "name": [f"point {i}" for i in range(n_rows)],
+        }
+    )
+
+
+def _manager(data=None, **kwargs):
+    manager = FigureManager(
+        "lat", "lon", "route", size_col="weight", hover_name="name", **kwargs
+    )
+    manager.set_data(_data() if data is None else data, data_version=0)
+    return manager
+
+
+def test_trace_cache_is_sized_from_the_data():
+    manager = _manager(_data(200_000), validate=False)
+    manager.build()
+    stats = manager.cache_stats
+    assert stats["evictions"] == 0 and stats["rejected"] == 0
+    assert stats["bytes"] <= manager.figure_nbytes
+    assert manager.figure_nbytes < 2 * stats["bytes"]
+    assert manager._trace_cache.max_bytes == max(
+        TRACE_CACHE_BYTES, TRACE_CACHE_FIGURES * manager.figure_nbytes
+    )
+    assert _manager(trace_cache_bytes=1000)._trace_cache.max_bytes == 1000
+
+
+@pytest.mark.filterwarnings("error")
+def test_default_center_leaves_out_missing_coordinates():
+    data = pd.DataFrame(
+        {
+            "route": ["a", "a", "b", "b"],
+            "lat": [1.0, np.nan, 2.0, 5.0],
+            "lon": [10.0, 20.0, np.nan, 40.0],
+        }
+    )
+    manager = FigureManager("lat", "lon", "route")
+    manager.set_data(data, data_version=0)
+    assert manager.default_center == {"lat": 2.0, "lon": 20.0}
+    manager.set_data(data.assign(lat=np.nan), data_version=1)
+    assert manager.default_center == {"lat": 0.0, "lon": 0.0}
+
+
+def test_unchanged_build_changes_no_traces():
+    manager = _manager()
+    first = manager.build()
+    assert first.full and first.changed_traces == [0, 1, 2, 3]
+    assert [t["name"] for t in first.figure["data"]] == ["a", "b", "c", "Selected"]
+    again = manager.build()
+    assert not again.full and again.changed_traces == [] and not again.changed
+
+
+def test_selection_only_changes_the_overlay():
+    manager = _manager()
+    manager.build()
+    update = manager.build(selected=np.array([0, 5, 7]))
+    assert not update.full and update.changed_traces == [3]
+    assert len(update.figure["data"][3]["lat"]) == 3
+    assert manager.build(selected=np.array([0, 5, 7])).changed_traces == []
+
+
+def test_route_filter_changes_the_trace_layout():
+    manager = _manager()
+    colors = [t["marker"]["color"] for t in manager.build().figure["data"][:3]]
+    update = manager.build(route_filters=["c", "a"])
+    assert update.full
+    traces = update.figure["data"]
+    assert [t["name"] for t in traces] == ["a", "c", "Selected"]
+    assert [t["marker"]["color"] for t in traces[:2]] == [colors[0], colors[2]]
+
+
+def test_edited_routes_are_rebuilt():
+    manager = _manager()
+    manager.build()
+    moved = manager.route_positions("a")[:10]
+    data = manager.data.copy()
+    data.loc[moved, "route"] = "b"
+    manager.set_data(data, data_version=0)
+    manager.update_routes(["a", "b"])
+    update = manager.build()
+    assert not update.full and update.changed_traces == [0, 1]
+    assert len(update.figure["data"][1]["lat"]) == (data["route"] == "b").sum()
+
+
+def test_earlier_filters_and_views_are_served_from_the_cache():
+    manager = _manager()
+    viewport = Viewport(13.3, 13.5, 52.4, 52.6)
+    manager.build()
+    manager.build(route_filters=["a"], viewport=viewport)
+    misses = manager.cache_stats["misses"]
+    manager.build()
+    manager.build(route_filters=["a"], viewport=viewport)
+    assert manager.cache_stats["misses"] == misses
+    manager.set_data(_data(), data_version=1)
+    manager.build()
+    assert manager.cache_stats["misses"] == misses + 4
+
+
+def test_shared_cache_is_keyed_by_data_version_and_route_edits():
+    cache = LRUCache(TRACE_CACHE_BYTES)
+    first, second = _manager(trace_cache=cache), _manager(trace_cache=cache)
+    first.build()
+    misses = cache.stats["misses"]
+    second.build()
+    assert cache.stats["misses"] == misses
+
+    data = first.data.copy()
+    data.loc[first.route_positions("a")[:10], "route"] = "b"
+    for manager in (first, second):
+        manager.set_data(data, data_version=0)
+        manager.update_routes(["a", "b"])
+    first.build()
+    # Only the traces of the edited routes are rebuilt, once for both sessions.
+    assert cache.stats["misses"] == misses + 2
+    second.build()
+    assert cache.stats["misses"] == misses + 2
+
+    other = _manager(data, trace_cache=cache)
+    other.set_data(data, data_version=1)
+    other.build()
+    assert cache.stats["misses"] == misses + 6
+
+
+@pytest.mark.parametrize("highlight", ["overlay", "selectedpoints"])
+def test_unvalidated_traces_match_validated_traces(highlight):
+    def figure_json(validate):
+        manager = _manager(
+            validate=validate, selection_highlight=highlight, hover_data=["weight"]
+        )
+        update = manager.build(selected=np.array([1, 2, 300]))
+        return json.loads(pio.to_json(go.Figure(update.figure)))
+
+    assert figure_json(False) == figure_json(True)
@@ -0,0 +1,39 @@
+import numpy as np
+import pandas as pd
+
+from bi_comms_plotly_map.grid import POSITION_COL, GridWindow
+from bi_comms_plotly_map.selection_state import SelectionState
+
+
+def _rows(*positions):
+    return [{POSITION_COL: position} for position in positions]
+
+
+def test_window_pages():
+    grid = GridWindow(page_size=4)
+    rows = np.arange(10, 20)
+    assert grid.window(rows).tolist() == [10, 11, 12, 13]
+    assert grid.set_page(9, rows.size) == 2
+    assert grid.window(rows).tolist() == [18, 19]
+    frame = grid.frame(pd.DataFrame({"a": range(20)}), grid.window(rows), ["a"])
+    assert frame[POSITION_COL].tolist() == [18, 19]
+    assert frame["a"].tolist() == [18, 19]
+
+
+def test_merge_keeps_the_selection_outside_the_window():
+    selection = SelectionState.from_positions(10, [0, 4, 5])
+    window = np.array([4, 5, 6])
+    assert GridWindow.pre_selected(window, selection) == [0, 1]
+    merged = GridWindow.merge(selection, window, _rows(6))
+    assert merged.positions().tolist() == [0, 6]
+    assert selection.positions().tolist() == [0, 4, 5]
+
+
+def test_only_new_responses_are_applied():
+    grid = GridWindow()
+    assert not grid.is_new_response("w0", None)
+    assert grid.is_new_response("w0", [])
+    # Reruns return the same rows, in any order.
+    assert grid.is_new_response("w0", _rows(3, 1))
+    assert not grid.is_new_response("w0", _rows(1, 3))
+    assert grid.is_new_response("w1", _rows(1, 3))
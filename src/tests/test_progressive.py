@@ -0,0 +1,137 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from bi_comms_plotly_map.figure_manager import FigureManager
+from bi_comms_plotly_map.progressive import ProgressiveLoader
+from bi_comms_plotly_map.protocol import DeltaEncoder
+
+
+def _data(n_rows=3000):
+    rng = np.random.default_rng(0)
+    return pd.DataFrame(
+        {
+            "route": rng.choice(["a", "b", "c"], n_rows),
+            "lat": rng.normal(52.5, 0.2, n_rows),
+            "lon": rng.normal(13.4, 0.3, n_rows),
+            "weight": rng.random(n_rows) + 1.0,
+            "name": [f"point {i}" for i in range(n_rows)],
+        }
+    )
+
+
+def _manager(**kwargs):
+    manager = FigureManager(
+        "lat",
+        "lon",
+        "route",
+        size_col="weight",
+        hover_name="name",
+        hover_data=["weight"],
+        validate=False,
+        point_order="stratified",
+        **kwargs,
+    )
+    manager.set_data(_data(), data_version=0)
+    return manager
+
+
+def _load(encoder, loader, update):
+    """Messages of a progressive load of `update`, as sent by `plotly_map`."""
+    messages = [encoder.encode(loader.start(update))]
+    while loader.loading:
+        messages.append(encoder.encode_ops(*loader.next_ops()))
+    return messages
+
+
+def _assert_traces_equal(traces, expected):
+    assert len(traces) == len(expected)
+    for trace, other in zip(traces, expected):
+        assert trace.keys() == other.keys()
+        np.testing.assert_array_equal(trace["lat"], other["lat"])
+        np.testing.assert_array_equal(trace["lon"], other["lon"])
+        np.testing.assert_array_equal(
+            trace["marker"].get("size"), other["marker"].get("size")
+        )
+        np.testing.assert_array_equal(trace.get("customdata"), other.get("customdata"))
+        np.testing.assert_array_equal(trace.get("hovertext"), other.get("hovertext"))
+
+
+def test_loads_a_built_figure_in_batches():
+    update = _manager().build()
+    loader = ProgressiveLoader(first_chunk_points=300, chunk_points=1000)
+    assert loader.should_load(update)
+    first = loader.start(update)
+    assert first.full
+    assert sum(len(t["lat"]) for t in first.figure["data"]) <= 300 + 3
+    assert loader.progress == (sum(len(t["lat"]) for t in first.figure["data"]), 3000)
+
+    n_batches = 0
+    while loader.loading:
+        ops, traces = loader.next_ops()
+        assert {op["op"] for op in ops} == {"extend"}
+        n_batches += 1
+    assert n_batches == 3
+    _assert_traces_equal(traces, update.figure["data"])
+
+
+def test_pending_traces_are_built_per_batch():
+    expected = _manager().build().figure["data"]
+    update = _manager().build(first_points=300)
+    assert sorted(update.pending) == [0, 1, 2]
+    assert update.trace_keys[:3] == [None, None, None]
+    assert sum(len(t["lat"]) for t in update.figure["data"]) <= 300 + 3
+
+    loader = ProgressiveLoader(first_chunk_points=300, chunk_points=1000)
+    encoder = DeltaEncoder()
+    messages = _load(encoder, loader, update)
+    assert "figure" in messages[0]
+    assert all("ops" in message for message in messages[1:])
+    assert loader.progress == (3000, 3000)
+    _assert_traces_equal(loader.partial_traces(), expected)
+
+
+def test_partial_traces_are_views_of_the_loaded_points():
+    update = _manager().build(first_points=300)
+    loader = ProgressiveLoader(first_chunk_points=300, chunk_points=1000)
+    loader.start(update)
+    partial = []
+    while loader.loading:
+        partial.append(loader.next_ops()[1][0]["lat"])
+    loaded = loader.partial_traces()[0]["lat"]
+    assert [len(lat) for lat in partial][-1] == len(loaded)
+    assert all(np.shares_memory(lat, loaded) for lat in partial)
+
+
+@pytest.mark.filterwarnings("ignore::bi_comms_plotly_map.cache.CacheSizeWarning")
+def test_loaded_figure_is_not_loaded_again():
+    # A cache too small for any trace keeps nothing of the loaded figure.
+    manager = _manager(trace_cache_bytes=1)
+    loader = ProgressiveLoader(first_chunk_points=300, chunk_points=1000)
+    encoder = DeltaEncoder()
+    _load(encoder, loader, manager.build(first_points=300))
+    last = encoder.encode(manager.build(first_points=300))
+
+    for _ in range(3):
+        update = manager.build(first_points=300)
+        assert update.pending == {}
+        assert update.changed_traces == []
+        assert not encoder.needs_full(update)
+        assert encoder.encode(update) is last
+        assert not loader.loading
+
+
+@pytest.mark.filterwarnings("ignore::bi_comms_plotly_map.cache.CacheSizeWarning")
+def test_changed_route_is_loaded_again():
+    manager = _manager(trace_cache_bytes=1)
+    loader = ProgressiveLoader(first_chunk_points=300, chunk_points=1000)
+    _load(DeltaEncoder(), loader, manager.build(first_points=300))
+
+    moved = manager.route_positions("a")[:10]
+    data = manager.data.copy()
+    data.loc[moved, "route"] = "b"
+    manager.set_data(data, data_version=0)
+    manager.update_routes(["a", "b"])
+    update = manager.build(first_points=300)
+    assert sorted(update.pending) == [0, 1]
+    assert update.changed_traces == [0, 1]
@@ -0,0 +1,109 @@
+import numpy as np
+import pytest
+
+from bi_comms_plotly_map.figure_manager import FigureUpdate
+from bi_comms_plotly_map.protocol import DeltaEncoder, layout_diff, trace_ops
+
+
+def _trace(color="red", lat=(1.0, 2.0)):
+    return {
+        "type": "scattermapbox",
+        "lat": np.array(lat),
+        "marker": {"color": color, "size": 6},
+    }
+
+
+def _update(traces, changed=(), full=False, zoom=10):
+    layout = {"mapbox": {"style": "open-street-map", "zoom": zoom}}
+    return FigureUpdate({"data": traces, "layout": layout}, list(changed), full, None)
+
+
+def test_first_message_is_full():
+    encoder = DeltaEncoder()
+    message = encoder.encode(_update([_trace()]))
+    assert message["version"] == 1
+    assert "figure" in message and "ops" not in message
+
+
+def test_changed_trace_is_restyled():
+    encoder = DeltaEncoder()
+    encoder.encode(_update([_trace(), _trace()]))
+    message = encoder.encode(_update([_trace(), _trace(color="blue")], changed=[1]))
+    assert message["version"] == 2
+    assert message["base_version"] == 1
+    assert message["ops"] == [
+        {"op": "restyle", "traces": [1], "update": {"marker.color": ["blue"]}}
+    ]
+
+
+def test_unchanged_update_resends_the_last_message():
+    encoder = DeltaEncoder()
+    first = encoder.encode(_update([_trace()]))
+    # The map view is owned by the frontend, so a new zoom is no change.
+    assert encoder.encode(_update([_trace()], changed=[0], zoom=12)) is first
+    assert encoder.version == 1
+
+
+def test_changed_trace_count_is_sent_in_full():
+    encoder = DeltaEncoder()
+    encoder.encode(_update([_trace()]))
+    message = encoder.encode(_update([_trace(), _trace()], changed=[1]))
+    assert "figure" in message
+    assert message["version"] == 2
+
+
+def test_trace_ops():
+    assert trace_ops(0, _trace(), _trace()) == []
+    assert trace_ops(0, _trace(), _trace(lat=(1.0, 3.0)))[0]["op"] == "restyle"
+    new = dict(_trace(), name="route")
+    assert trace_ops(3, _trace(), new) == [
+        {"op": "replace_trace", "index": 3, "trace": new}
+    ]
+    # Arrays of another dtype are sent again, even if equal in value.
+    ops = trace_ops(0, _trace(lat=(1, 2)), _trace(lat=(1.0, 2.0)))
+    assert list(ops[0]["update"]) == ["lat"]
+
+
+def test_layout_diff_leaves_out_the_map_view():
+    old = {"mapbox": {"zoom": 3, "center": {"lat": 0}, "style": "a"}, "height": 600}
+    new = {"mapbox": {"zoom": 5, "center": {"lat": 1}, "style": "b"}, "height": 600}
+    assert layout_diff(old, new) == {"mapbox.style": "b"}
+
+
+def test_resync_sends_the_figure_in_full():
+    encoder = DeltaEncoder()
+    encoder.encode(_update([_trace()]))
+    encoder.encode(_update([_trace(color="blue")], changed=[0]))
+    assert encoder.acknowledge({"resync": True, "resync_id": 1, "ack": 1})
+    message = encoder.encode(_update([_trace(color="blue")], changed=[0]))
+    assert "figure" in message
+    assert message["version"] == 3
+
+
+def test_resync_is_handled_once():
+    encoder = DeltaEncoder()
+    encoder.encode(_update([_trace()]))
+    encoder.encode(_update([_trace(color="blue")], changed=[0]))
+    value = {"resync": True, "resync_id": 1, "ack": 1}
+    assert encoder.acknowledge(value)
+    encoder.encode(_update([_trace(color="blue")]))
+    # The same value is returned on reruns until the frontend sends a new one.
+    assert not encoder.acknowledge(value)
+    assert not encoder.acknowledge(None)
+    assert not encoder.acknowledge({"ack": 1})
+
+
+def test_resync_of_the_current_version_is_ignored():
+    encoder = DeltaEncoder()
+    encoder.encode(_update([_trace()]))
+    assert not encoder.acknowledge({"resync": True, "resync_id": 1, "ack": 1})
+    assert "ops" in encoder.encode(_update([_trace(color="blue")], changed=[0]))
+
+
+def test_encode_ops_needs_a_full_message_first():
+    encoder = DeltaEncoder()
+    with pytest.raises(ValueError):
+        encoder.encode_ops([])
+    encoder.encode(_update([_trace()]))
+    message = encoder.encode_ops([{"op": "extend", "traces": [0], "update": {}}])
+    assert message["base_version"] == 1
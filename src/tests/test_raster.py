@@ -0,0 +1,71 @@
+import base64
+import struct
+import zlib
+
+import numpy as np
+
+from bi_comms_plotly_map.raster import (
+    colorize,
+    density_layer,
+    png_data_uri,
+    raster_shape,
+    rasterize,
+)
+from bi_comms_plotly_map.viewport import Viewport
+
+VIEWPORT = Viewport(13.0, 14.0, 52.0, 53.0)
+
+
+def _read_png(uri):
+    """Width, height and RGBA pixels of an unfiltered PNG data URI."""
+    png = base64.b64decode(uri.split(",", 1)[1])
+    assert png[:8] == b"\x89PNG\r\n\x1a\n"
+    width, height = struct.unpack(">II", png[16:24])
+    idat_length = struct.unpack(">I", png[33:37])[0]
+    scanlines = zlib.decompress(png[41 : 41 + idat_length])
+    rows = np.frombuffer(scanlines, dtype=np.uint8).reshape(height, -1)
+    return width, height, rows[:, 1:].reshape(height, width, 4)
+
+
+def test_raster_pixels_are_square():
+    height, width = raster_shape(VIEWPORT, 200)
+    assert width == 200
+    # One degree of latitude at 52.5N is ~1.65 degrees of longitude on a map.
+    assert 320 < height < 340
+    assert raster_shape(Viewport(0.0, 10.0, 0.0, 0.0), 100) == (1, 100)
+    assert raster_shape(Viewport(0.0, 0.001, -90.0, 90.0), 100) == (400, 100)
+
+
+def test_rasterize_counts_points_per_pixel():
+    lat = np.array([52.99, 52.99, 52.01, 60.0, np.nan])
+    lon = np.array([13.01, 13.01, 13.99, 13.5, 13.5])
+    grid = rasterize(lat, lon, VIEWPORT, (4, 4))
+    assert grid[0, 0] == 2 and grid[-1, -1] == 1
+    assert grid.sum() == 3
+    weighted = rasterize(lat, lon, VIEWPORT, (4, 4), weights=np.full(5, 0.5))
+    assert weighted.sum() == 1.5
+
+
+def test_colorize_leaves_empty_pixels_clear():
+    rgba = colorize(np.array([[0.0, 1.0], [10.0, 100.0]]))
+    assert rgba.dtype == np.uint8 and rgba.shape == (2, 2, 4)
+    assert rgba[0, 0, 3] == 0
+    assert 0 < rgba[0, 1, 3] < rgba[1, 0, 3] < rgba[1, 1, 3]
+    assert colorize(np.zeros((2, 2)))[..., 3].max() == 0
+
+
+def test_png_round_trip():
+    rgba = np.random.default_rng(0).integers(0, 256, (3, 5, 4), dtype=np.uint8)
+    width, height, pixels = _read_png(png_data_uri(rgba))
+    assert (width, height) == (5, 3)
+    np.testing.assert_array_equal(pixels, rgba)
+
+
+def test_density_layer_covers_the_viewport():
+    rng = np.random.default_rng(0)
+    layer = density_layer(rng.uniform(52, 53, 100), rng.uniform(13, 14, 100), VIEWPORT)
+    assert layer["sourcetype"] == "image"
+    assert layer["coordinates"][0] == [13.0, 53.0]
+    assert layer["coordinates"][2] == [14.0, 52.0]
+    width, height, _ = _read_png(layer["source"])
+    assert (height, width) == raster_shape(VIEWPORT)
@@ -0,0 +1,55 @@
+import streamlit as st
+
+from bi_comms_plotly_map.change_detection import ChangeTracker
+from bi_comms_plotly_map.regions import Regions
+
+
+def _regions():
+    tracker = ChangeTracker()
+    regions = Regions(tracker)
+    regions.declare("grid", ["selection", "grid_page"])
+    regions.declare("map", ["selection", "view"])
+    return tracker, regions
+
+
+def test_regions_rebuild_only_when_a_dependency_changed():
+    tracker, regions = _regions()
+    builds = []
+
+    def run(name):
+        return regions.run(name, lambda: builds.append(name) or len(builds))
+
+    assert run("grid") == 1 and run("map") == 2
+    tracker.update("view", {"zoom": 11})
+    assert run("grid") == 1 and run("map") == 3
+    assert not regions.is_stale("grid")
+    tracker.update("selection", [1, 2])
+    assert regions.is_stale("grid") and regions.is_stale("map")
+    assert run("grid") == 4 and run("grid") == 4
+    assert (regions.hits, regions.misses) == (2, 4)
+
+
+def test_invalidate_and_redeclare():
+    tracker, regions = _regions()
+    regions.run("grid", lambda: 1)
+    regions.run("map", lambda: 1)
+    regions.invalidate("grid")
+    assert regions.is_stale("grid") and not regions.is_stale("map")
+    regions.invalidate()
+    assert regions.is_stale("map")
+    regions.run("map", lambda: 1)
+    regions.declare("map", ["view"])
+    assert regions.is_stale("map")
+
+
+def test_fragment_falls_back_to_the_function(monkeypatch):
+    def func():
+        return 1
+
+    monkeypatch.delattr(st, "fragment", raising=False)
+    monkeypatch.delattr(st, "experimental_fragment", raising=False)
+    assert Regions.fragment(func) is func
+    monkeypatch.setattr(
+        st, "experimental_fragment", lambda f: ("fragment", f), raising=False
+    )
+    assert Regions.fragment(func) == ("fragment", func)
@@ -0,0 +1,64 @@
+from bi_comms_plotly_map.route_edits import RouteEditor
+from bi_comms_plotly_map.route_index import RouteIndex
+
+
+def test_editor_undo_redo():
+    index = RouteIndex(["a", "a", "b", "b"])
+    editor = RouteEditor(index)
+    assert sorted(editor.reassign([0, 2], "c")) == ["a", "b", "c"]
+    assert index.values().tolist() == ["c", "a", "c", "b"]
+    assert editor.reassign([0, 2], "c") == []
+    assert editor.can_undo and not editor.can_redo
+
+    editor.undo()
+    assert index.values().tolist() == ["a", "a", "b", "b"]
+    assert index.positions("c").tolist() == []
+    editor.redo()
+    assert index.values().tolist() == ["c", "a", "c", "b"]
+    assert index.positions("c").tolist() == [0, 2]
+
+
+def test_edit_after_undo_discards_redo():
+    index = RouteIndex(["a", "a", "b"])
+    editor = RouteEditor(index)
+    editor.reassign([0], "b")
+    editor.reassign([1], "b")
+    editor.undo()
+    editor.reassign([2], "a")
+    assert not editor.can_redo
+    assert len(editor.edits) == 2
+    assert editor.redo() == []
+    assert index.values().tolist() == ["b", "a", "a"]
+
+
+def test_reassign_matches_route_index():
+    index, expected = RouteIndex(["a", "b", "a", "c"]), RouteIndex(["a", "b", "a", "c"])
+    editor = RouteEditor(index)
+    assert editor.reassign([3, 0, 0, 1], "b") == expected.reassign([3, 0, 0, 1], "b")
+    assert index.values().tolist() == expected.values().tolist()
+    assert editor.last_applied.positions.tolist() == [0, 3]
+    assert [index.name(code) for code in editor.last_applied.old_codes] == ["a", "c"]
+
+
+def test_log_drops_the_oldest_edits():
+    index = RouteIndex(["a"] * 5)
+    editor = RouteEditor(index, max_edits=3)
+    for position in range(5):
+        editor.reassign([position], "b")
+    assert len(editor.edits) == 3
+    while editor.can_undo:
+        editor.undo()
+    assert index.values().tolist() == ["b", "b", "a", "a", "a"]
+    editor.redo()
+    assert index.values().tolist() == ["b", "b", "b", "a", "a"]
+
+
+def test_log_keeps_the_last_edit_beyond_max_bytes():
+    index = RouteIndex(["a"] * 100)
+    editor = RouteEditor(index, max_bytes=1)
+    editor.reassign(range(50), "b")
+    editor.reassign(range(50, 100), "b")
+    assert len(editor.edits) == 1
+    editor.undo()
+    assert not editor.can_undo
+    assert index.values().tolist() == ["b"] * 50 + ["a"] * 50
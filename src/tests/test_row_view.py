@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+
+from bi_comms_plotly_map.row_view import RowView
+
+
+def _data(n_rows=250):
+    return pd.DataFrame(
+        {"route": ["a", "b"] * (n_rows // 2), "value": np.arange(n_rows)},
+        index=np.arange(n_rows) * 10,
+    )
+
+
+def test_view_takes_rows_in_position_order():
+    data = _data()
+    view = RowView(data, [5, 1, 3], columns=["value"])
+    assert len(view) == 3 and view
+    assert repr(view) == "RowView(3 of 250 rows)"
+    frame = view.to_frame()
+    assert list(frame.columns) == ["value"]
+    assert frame["value"].tolist() == [5, 1, 3]
+    assert frame.index.tolist() == [50, 10, 30]
+    assert view.take(1)["value"].tolist() == [1, 3]
+    assert not RowView(data, np.empty(0, dtype=np.int64))
+
+
+def test_pages_are_clamped():
+    view = RowView(_data(), np.arange(0, 250, 2))
+    assert view.n_pages(50) == 3
+    assert view.page(0, 50)["value"].tolist() == list(range(0, 100, 2))
+    assert view.page(2, 50)["value"].tolist() == list(range(200, 250, 2))
+    assert view.page(7, 50).equals(view.page(2, 50))
+    assert view.page(-1, 50).equals(view.page(0, 50))
+    assert view.head(3)["value"].tolist() == [0, 2, 4]
+    empty = RowView(_data(), [])
+    assert empty.n_pages() == 1 and empty.page(3).empty
+
+
+def test_copies_do_not_write_through():
+    data = _data()
+    page = RowView(data, [0, 1]).page(0)
+    page.loc[:, "value"] = -1
+    assert data["value"].iloc[:2].tolist() == [0, 1]
@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+
+from bi_comms_plotly_map.schema import (
+    coordinate_error_m,
+    memory_report,
+    normalize_frame,
+)
+
+
+def _data(n_rows=1000):
+    rng = np.random.default_rng(0)
+    return pd.DataFrame(
+        {
+            "route": rng.choice(["a", "b", "c"], n_rows),
+            "lat": rng.normal(52.5, 0.2, n_rows),
+            "lon": rng.normal(13.4, 0.3, n_rows),
+            "count": np.arange(n_rows, dtype=np.int64),
+            "id": np.arange(n_rows),
+        }
+    )
+
+
+def test_normalized_frame_is_compact():
+    data = _data()
+    normalized = normalize_frame(data, "lat", "lon", "route", drop_columns=["id"])
+    assert list(normalized.columns) == ["route", "lat", "lon", "count"]
+    assert normalized["route"].dtype == "category"
+    assert normalized["lat"].dtype == np.float32
+    assert normalized["count"].dtype == np.int16
+    pd.testing.assert_series_equal(
+        normalized["route"].astype(object), data["route"], check_names=False
+    )
+    assert data["lat"].dtype == np.float64 and "id" in data
+
+
+def test_coordinates_stay_float64_beyond_the_error_budget():
+    data = _data()
+    error = coordinate_error_m(data["lat"], data["lon"])
+    assert 0 < error < 1.0
+    kept = normalize_frame(data, "lat", "lon", max_coordinate_error_m=error / 2)
+    assert kept["lat"].dtype == np.float64 and kept["route"].dtype == object
+    with_nan = pd.Series([np.nan, 1.0])
+    assert coordinate_error_m(with_nan, with_nan) >= 0.0
+    assert (
+        coordinate_error_m(pd.Series([], dtype=float), pd.Series([], dtype=float)) == 0
+    )
+
+
+def test_memory_report_totals():
+    data = _data()
+    normalized = normalize_frame(data, "lat", "lon", "route", drop_columns=["id"])
+    report = memory_report(data, normalized)
+    assert report.loc["total", "before_bytes"] == data.memory_usage(deep=True).sum()
+    assert report.loc["total", "after_bytes"] < report.loc["total", "before_bytes"]
+    assert (
+        report.loc["id", "after_bytes"] == 0 and report.loc["id", "after_dtype"] == ""
+    )
+    assert report.loc["lat", "after_dtype"] == "float32"
+    assert report.loc["lat", "ratio"] == 0.5
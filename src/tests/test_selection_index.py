@@ -0,0 +1,109 @@
+import numpy as np
+import pytest
+
+from bi_comms_plotly_map.selection_index import SelectionIndex
+from bi_comms_plotly_map.spatial_index import GridIndex
+
+
+def _points(*pairs):
+    return [{"curveNumber": curve, "pointIndex": point} for curve, point in pairs]
+
+
+def test_resolve_points_to_rows():
+    index = SelectionIndex(10)
+    assert index.add_trace([7, 3, 5]) == 0
+    assert index.add_trace([0, 9]) == 1
+    assert index.n_traces == 2
+    rows = index.resolve(_points((0, 2), (1, 1), (0, 0), (0, 2)))
+    assert rows.tolist() == [5, 7, 9]
+    assert index.resolve([{"curveNumber": 1, "pointNumber": 0}]).tolist() == [0]
+    assert index.resolve(None).tolist() == []
+
+
+def test_resolve_ignores_unknown_traces_and_points():
+    index = SelectionIndex(10)
+    index.add_trace([7, 3, 5])
+    index.add_trace([0, 9])
+    # An unregistered overlay trace, and points past the end of a trace.
+    assert index.resolve(_points((2, 0), (0, 3), (0, -1))).tolist() == []
+    assert index.resolve(_points((0, 0), (1, 0)), curves=[1]).tolist() == [0]
+
+
+def test_group_points_resolve_to_all_their_rows():
+    index = SelectionIndex(10)
+    index.add_trace([4, 5, 6, 1, 2], offsets=[0, 3, 5])
+    assert index.resolve(_points((0, 1))).tolist() == [1, 2]
+    assert index.resolve(_points((0, 0), (0, 1))).tolist() == [1, 2, 4, 5, 6]
+    assert index.trace_rows(0).tolist() == [4, 5, 6, 1, 2]
+
+
+def test_positions_are_checked():
+    index = SelectionIndex(3)
+    with pytest.raises(IndexError):
+        index.add_trace([0, 3])
+    with pytest.raises(IndexError):
+        index.add_trace([-1])
+    with pytest.raises(ValueError):
+        index.add_trace([0, 1], offsets=[0, 1])
+    with pytest.raises(ValueError):
+        index.add_trace([0, 1], lat=np.zeros(2), lon=np.zeros(2))
+
+
+def _box(lon0, lat0, lon1, lat1):
+    return {"range": {"mapbox": [[lon0, lat0], [lon1, lat1]]}}
+
+
+def test_resolve_geometry_selects_shown_rows_inside():
+    lat = np.array([0.5, 0.5, 2.0, 0.2, 0.8])
+    lon = np.array([0.5, 1.5, 0.5, 0.2, 0.8])
+    index = SelectionIndex(5, lat=lat, lon=lon)
+    index.add_trace([0, 1, 2])
+    index.add_trace([3])
+    box = _box(0.0, 0.0, 1.0, 1.0)
+    # Row 4 is inside, but not shown.
+    assert index.resolve_geometry(box).tolist() == [0, 3]
+    assert index.resolve_geometry(box, curves=[1]).tolist() == [3]
+    lasso = {"lassoPoints": {"mapbox": [[0, 0], [1, 0], [0, 1]]}}
+    assert index.resolve_geometry(lasso).tolist() == [3]
+    assert index.resolve_geometry(None).tolist() == []
+    assert index.resolve_geometry({"lassoPoints": {"mapbox": [[0, 0]]}}).size == 0
+
+
+def test_resolve_geometry_with_a_spatial_index():
+    rng = np.random.default_rng(0)
+    lat, lon = rng.uniform(0, 2, 500), rng.uniform(0, 2, 500)
+    shown = np.arange(0, 500, 3)
+    with_index = SelectionIndex(500, spatial_index=GridIndex(lat, lon))
+    with_coordinates = SelectionIndex(500, lat=lat, lon=lon)
+    for index in (with_index, with_coordinates):
+        index.add_trace(shown)
+    box = _box(0.3, 0.4, 1.2, 1.5)
+    expected = with_coordinates.resolve_geometry(box)
+    assert expected.size > 0
+    np.testing.assert_array_equal(with_index.resolve_geometry(box), expected)
+    without_coordinates = SelectionIndex(1)
+    without_coordinates.add_trace([0])
+    with pytest.raises(ValueError):
+        without_coordinates.resolve_geometry(box)
+
+
+def test_area_rows_are_only_selected_by_outline_over_all_traces():
+    lat, lon = np.array([0.5, 0.5, 5.0]), np.array([0.5, 0.6, 5.0])
+    index = SelectionIndex(3, lat=lat, lon=lon)
+    index.add_trace([0])
+    index.add_area([1, 2])
+    box = _box(0.0, 0.0, 1.0, 1.0)
+    assert index.resolve_geometry(box).tolist() == [0, 1]
+    assert index.resolve_geometry(box, curves=[0]).tolist() == [0]
+    assert index.resolve(_points((0, 0), (1, 0))).tolist() == [0]
+
+
+def test_group_points_are_selected_by_their_own_coordinates():
+    # Rows of a group can lie outside the outline while its point is inside.
+    lat, lon = np.array([0.5, 5.0, 0.5, 0.6]), np.array([0.5, 5.0, 8.0, 8.0])
+    index = SelectionIndex(4, lat=lat, lon=lon)
+    index.add_trace(
+        [0, 1, 2, 3], offsets=[0, 2, 4], lat=np.array([0.5, 0.5]), lon=[0.5, 8.0]
+    )
+    assert index.resolve_geometry(_box(0.0, 0.0, 1.0, 1.0)).tolist() == [0, 1]
+    assert index.resolve_geometry(_box(7.0, 0.0, 9.0, 1.0)).tolist() == [2, 3]
@@ -0,0 +1,82 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from bi_comms_plotly_map.selection_state import SelectionState
+
+
+def test_assign_returns_the_flipped_positions():
+    state = SelectionState.from_positions(10, [1, 2])
+    assert state.assign([5, 2, 1, 5], True).tolist() == [5]
+    assert state.assign([2, 3], False).tolist() == [2]
+    assert state.positions().tolist() == [1, 5]
+    assert len(state) == 2
+
+
+def test_assign_a_selection():
+    state = SelectionState.from_positions(10, [1, 2])
+    other = SelectionState.from_positions(10, [2, 3])
+    assert state.assign(other, True).tolist() == [3]
+    assert state.assign(other, False).tolist() == [2, 3]
+    assert state.positions().tolist() == [1]
+
+
+def test_add_and_discard_report_changes():
+    state = SelectionState(5)
+    assert state.add([1])
+    assert not state.add([1])
+    assert state.discard([1])
+    assert not state.discard([1])
+    assert not state.clear()
+
+
+def test_fingerprint_depends_on_the_selected_rows_only():
+    a = SelectionState(100)
+    a.add([1, 50, 99])
+    a.discard([50])
+    b = SelectionState.from_positions(100, [99, 1])
+    assert a == b
+    assert a.fingerprint == b.fingerprint
+    assert a.fingerprint != SelectionState.from_positions(100, [1, 98]).fingerprint
+    assert b.fingerprint != SelectionState.from_positions(101, [1, 99]).fingerprint
+
+
+def test_operators():
+    a = SelectionState.from_positions(6, [0, 1, 2])
+    b = SelectionState.from_positions(6, [2, 3])
+    assert (a | b).positions().tolist() == [0, 1, 2, 3]
+    assert (a & b).positions().tolist() == [2]
+    assert (a - b).positions().tolist() == [0, 1]
+    assert (~a).positions().tolist() == [3, 4, 5]
+    assert 2 in a and 3 not in a
+    with pytest.raises(ValueError):
+        a | SelectionState(7)
+
+
+def test_round_trips():
+    mask = np.random.default_rng(0).random(1001) < 0.3
+    state = SelectionState.from_mask(mask)
+    assert SelectionState.from_bytes(state.to_bytes(), 1001) == state
+    copy = pickle.loads(pickle.dumps(state))
+    assert copy == state
+    assert copy.fingerprint == state.fingerprint
+    assert len(copy) == mask.sum()
+
+
+def test_mask_is_read_only():
+    state = SelectionState(3)
+    with pytest.raises(ValueError):
+        state.mask[0] = True
+
+
+@pytest.mark.parametrize("positions", [[-1], [2, 10], [0, -10]])
+def test_positions_out_of_range_are_rejected(positions):
+    state = SelectionState.from_positions(10, [1])
+    with pytest.raises(IndexError):
+        state.add(positions)
+    with pytest.raises(IndexError):
+        state.discard(positions)
+    with pytest.raises(IndexError):
+        SelectionState.from_positions(10, positions)
+    assert state.positions().tolist() == [1]
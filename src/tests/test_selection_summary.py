@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+
+from bi_comms_plotly_map.overlay import DataOverlay
+
+
+def _base(n_rows=200):
+    rng = np.random.default_rng(0)
+    return pd.DataFrame(
+        {
+            "route": rng.choice(["a", "b", "c"], n_rows),
+            "value": rng.random(n_rows),
+            "hour": rng.integers(0, 24, n_rows),
+        }
+    )
+
+
+def _expected(overlay):
+    view = overlay.view()
+    selected = view[view["selected"]]
+    grouped = selected.groupby("route")
+    return pd.DataFrame(
+        {
+            "n_selected": grouped.size(),
+            "sum_value": grouped["value"].sum(),
+            "hours": grouped["hour"].agg(lambda h: sorted(set(h))),
+        }
+    )
+
+
+def _assert_summary(overlay):
+    frame = overlay.summary.frame().iloc[:-1].set_index("route")
+    expected = _expected(overlay)
+    assert frame.index.tolist() == expected.index.tolist()
+    assert frame["n_selected"].tolist() == expected["n_selected"].tolist()
+    np.testing.assert_allclose(frame["sum_value"], expected["sum_value"])
+    assert frame["hours"].tolist() == expected["hours"].tolist()
+
+
+def test_summary_follows_selection_and_route_changes():
+    overlay = DataOverlay(_base(), "route")
+    overlay.set_selected(range(0, 200, 3))
+    overlay.summarize("value", "hour")
+    _assert_summary(overlay)
+
+    overlay.set_selected(range(0, 100))
+    overlay.set_selected(range(50, 70), selected=False)
+    _assert_summary(overlay)
+
+    overlay.set_routes(range(0, 120, 2), "d")
+    _assert_summary(overlay)
+    overlay.set_routes(range(10, 40), "a")
+    _assert_summary(overlay)
+
+    overlay.undo_routes()
+    _assert_summary(overlay)
+    overlay.undo_routes()
+    _assert_summary(overlay)
+    assert overlay.route_overrides == {}
+    overlay.redo_routes()
+    _assert_summary(overlay)
+
+    overlay.reset_routes()
+    _assert_summary(overlay)
+    assert overlay.routes.tolist() == overlay.base["route"].tolist()
+
+    overlay.clear_selection()
+    assert overlay.summary.count == 0
+    assert overlay.summary.frame().empty
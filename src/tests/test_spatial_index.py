@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from bi_comms_plotly_map.spatial_index import (
+    GridIndex,
+    haversine_m,
+    points_in_polygon,
+    selection_polygon,
+    stratified_order,
+)
+from bi_comms_plotly_map.viewport import Viewport
+
+
+def _points(n_points=5000):
+    rng = np.random.default_rng(0)
+    lat = rng.normal(52.5, 0.2, n_points)
+    lon = rng.normal(13.4, 0.3, n_points)
+    lat[::97] = np.nan
+    return lat, lon
+
+
+def test_bbox_query_matches_a_scan():
+    lat, lon = _points()
+    index = GridIndex(lat, lon, points_per_cell=16)
+    for viewport in [
+        Viewport(13.3, 13.5, 52.4, 52.6),
+        Viewport(10.0, 20.0, 50.0, 55.0),
+        Viewport(14.5, 15.0, 52.0, 53.0),
+        Viewport(0.0, 1.0, 0.0, 1.0),
+    ]:
+        expected = np.flatnonzero(viewport.contains(lat, lon))
+        assert index.query_bbox(viewport).tolist() == expected.tolist()
+
+
+def test_radius_query_matches_a_scan():
+    lat, lon = _points()
+    index = GridIndex(lat, lon)
+    for radius_m in [100.0, 5000.0, 50000.0]:
+        distance = haversine_m(52.5, 13.4, lat, lon)
+        expected = np.flatnonzero(distance <= radius_m)
+        assert index.query_radius(52.5, 13.4, radius_m).tolist() == expected.tolist()
+
+
+def test_polygon_query_matches_a_scan():
+    lat, lon = _points()
+    index = GridIndex(lat, lon)
+    polygon = [[13.0, 52.3], [13.8, 52.4], [13.5, 52.9], [13.2, 52.6]]
+    expected = np.flatnonzero(points_in_polygon(lat, lon, np.asarray(polygon)))
+    assert expected.size
+    assert index.query_polygon(polygon).tolist() == expected.tolist()
+    assert index.query_polygon(polygon[:2]).tolist() == []
+
+
+def test_box_selection_polygon():
+    lat, lon = _points()
+    index = GridIndex(lat, lon)
+    polygon = selection_polygon({"range": {"mapbox": [[13.3, 52.6], [13.5, 52.4]]}})
+    expected = index.query_bbox(Viewport(13.3, 13.5, 52.4, 52.6))
+    assert index.query_polygon(polygon).tolist() == expected.tolist()
+    assert selection_polygon({"points": []}) is None
+
+
+def test_points_on_one_latitude():
+    lon = np.linspace(0.0, 10.0, 10000)
+    lat = np.full(lon.shape, 45.0)
+    index = GridIndex(lat, lon)
+    assert index.n_lon * index.n_lat <= 2 * lon.size
+    viewport = Viewport(2.0, 3.0, 44.0, 46.0)
+    expected = np.flatnonzero(viewport.contains(lat, lon))
+    assert index.query_bbox(viewport).tolist() == expected.tolist()
+
+
+@pytest.mark.filterwarnings("error")
+def test_stratified_order():
+    lat, lon = _points()
+    order = stratified_order(lat, lon)
+    assert np.sort(order).tolist() == list(range(lat.size))
+    assert stratified_order(lat, lon).tolist() == order.tolist()
+    sampled = stratified_order(lat, lon, sample=100)
+    assert np.sort(sampled).tolist() == list(range(lat.size))
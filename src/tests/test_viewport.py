@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from bi_comms_plotly_map.viewport import Viewport, ViewportCuller, mercator_xy
+
+
+def test_bounds():
+    with pytest.raises(ValueError):
+        Viewport(1.0, 0.0, 0.0, 1.0)
+    viewport = Viewport(0.0, 2.0, 10.0, 11.0)
+    assert (viewport.width, viewport.height) == (2.0, 1.0)
+    assert viewport == Viewport(0.0, 2.0, 10.0, 11.0)
+    assert len({viewport, Viewport(0.0, 2.0, 10.0, 11.0)}) == 1
+    inside = viewport.contains(np.array([10.5, 10.5, 12.0]), np.array([1.0, 3.0, 1.0]))
+    assert inside.tolist() == [True, False, False]
+
+
+def test_expand_and_covers():
+    viewport = Viewport(0.0, 2.0, 80.0, 89.0)
+    expanded = viewport.expand(0.5)
+    assert expanded.key == (-1.0, 3.0, 75.5, 90.0)
+    assert expanded.covers(viewport)
+    assert not viewport.covers(expanded)
+
+
+def test_from_center_zoom():
+    viewport = Viewport.from_center_zoom({"lat": 52.5, "lon": 13.4}, 10)
+    assert viewport.contains(np.array([52.5]), np.array([13.4]))[0]
+    assert viewport.min_lon + viewport.max_lon == pytest.approx(2 * 13.4)
+    # Mercator stretches latitudes, so the view spans less latitude than longitude.
+    assert viewport.height < viewport.width / 2
+    zoomed = Viewport.from_center_zoom({"lat": 52.5, "lon": 13.4}, 11)
+    assert zoomed.width == pytest.approx(viewport.width / 2)
+
+
+def test_from_relayout():
+    corners = [[13.0, 53.0], [14.0, 53.0], [14.0, 52.0], [13.0, 52.0]]
+    relayout = {"raw": {"mapbox._derived": {"coordinates": corners}}}
+    assert Viewport.from_relayout(relayout) == Viewport(13.0, 14.0, 52.0, 53.0)
+    relayout = {"raw": {}, "center": {"lat": 52.5, "lon": 13.4}, "zoom": 10}
+    expected = Viewport.from_center_zoom({"lat": 52.5, "lon": 13.4}, 10)
+    assert Viewport.from_relayout(relayout) == expected
+    assert Viewport.from_relayout(None) is None
+    assert Viewport.from_relayout({"raw": {}}) is None
+
+
+def test_culler_keeps_the_region_for_small_moves():
+    culler = ViewportCuller(margin=0.5, max_zoom_in=16.0)
+    assert culler.update(None) is None
+    region = culler.update(Viewport(0.0, 2.0, 0.0, 2.0))
+    assert region == Viewport(-1.0, 3.0, -1.0, 3.0)
+    assert culler.update(Viewport(0.5, 2.5, 0.5, 2.5)) is region
+    assert culler.update(None) is region
+    # Panning out of the region, or zooming far in, culls a new region.
+    assert culler.update(Viewport(2.0, 4.0, 0.0, 2.0)) == Viewport(1.0, 5.0, -1.0, 3.0)
+    assert culler.update(Viewport(2.0, 2.5, 0.0, 0.5)) == Viewport(
+        1.75, 2.75, -0.25, 0.75
+    )
+    culler.reset()
+    assert culler.update(None) is None
+
+
+def test_mercator_xy():
+    x, y = mercator_xy(np.array([0.0, 85.0, -85.0]), np.array([-180.0, 0.0, 180.0]))
+    np.testing.assert_allclose(x, [0.0, 0.5, 1.0])
+    assert y[0] == pytest.approx(0.5)
+    assert 0.0 <= y[1] < 0.01 and 0.99 < y[2] <= 1.0